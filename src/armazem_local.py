@@ -0,0 +1,137 @@
+import gzip
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rdflib import Graph
+
+# Armazém SPARQL embutido: um grafo rdflib servido por HTTP com o mesmo
+# protocolo do repositório GraphDB/RDF4J usado pelo projeto (POST de queries
+# em /repositories/<nome>, GET de /size e POST de SPARQL UPDATE em
+# /statements). Serve para benchmarks e testes sem um GraphDB rodando: o
+# ClienteSPARQL e o sparql.py funcionam sem mudanças apontando para ele.
+
+FORMATOS = {
+    'application/sparql-results+json': 'json',
+    'text/csv': 'csv',
+    'text/tab-separated-values': 'tsv',
+    'application/sparql-results+xml': 'xml',
+}
+
+def carregar_grafo(caminho: str) -> Graph:
+    "Lê um arquivo RDF (N-Triples, possivelmente .gz, ou Turtle) num grafo rdflib."
+
+    formato = 'ttl' if caminho.endswith(('.ttl', '.ttl.gz')) else 'nt'
+    abrir = gzip.open if caminho.endswith('.gz') else open
+    with abrir(caminho, 'rb') as f:
+        return Graph().parse(data=f.read(), format=formato)
+
+#-------------------------------------------------------------------------------
+
+class _Requisicao(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status: int, corpo: bytes = b'', tipo: str = 'text/plain'):
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _consultar(self, query: str):
+        armazem = self.server.armazem
+        aceitar = self.headers.get('Accept', '')
+        tipo = next((t for t in FORMATOS if t in aceitar), 'application/sparql-results+json')
+        try:
+            with armazem.trava:
+                resultado = armazem.grafo.query(query)
+                corpo = resultado.serialize(format=FORMATOS[tipo])
+        except Exception as erro:
+            self._responder(400, str(erro).encode())
+            return
+        self._responder(200, corpo, tipo)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.endswith('/size'):
+            with self.server.armazem.trava:
+                tamanho = len(self.server.armazem.grafo)
+            self._responder(200, str(tamanho).encode())
+            return
+        query = urllib.parse.parse_qs(url.query).get('query')
+        if not query:
+            self._responder(400, b'missing query')
+            return
+        self._consultar(query[0])
+
+    def _ler_corpo(self) -> bytes:
+        "Corpo da requisição, com Content-Length ou em chunks (como o enviado por ntriples.carregar_no_graphdb)."
+
+        if 'chunked' not in self.headers.get('Transfer-Encoding', ''):
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        pedacos = []
+        while True:
+            tamanho = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+            if not tamanho:
+                while self.rfile.readline().strip():
+                    pass
+                return b''.join(pedacos)
+            pedacos.append(self.rfile.read(tamanho))
+            self.rfile.readline()
+
+    def do_POST(self):
+        corpo = self._ler_corpo().decode('utf-8')
+        tipo = self.headers.get('Content-Type', '')
+
+        if self.path.rstrip('/').endswith('/statements'):
+            if tipo.startswith('application/x-www-form-urlencoded'):
+                corpo = urllib.parse.parse_qs(corpo).get('update', [''])[0]
+            with self.server.armazem.trava:
+                try:
+                    if tipo.startswith(('application/n-triples', 'text/turtle')):
+                        self.server.armazem.grafo.parse(data=corpo, format='nt' if 'n-triples' in tipo else 'ttl')
+                    else:
+                        self.server.armazem.grafo.update(corpo)
+                except Exception as erro:
+                    self._responder(400, str(erro).encode())
+                    return
+            self._responder(204)
+            return
+
+        if tipo.startswith('application/sparql-query'):
+            query = corpo
+        else:
+            query = urllib.parse.parse_qs(corpo).get('query', [''])[0]
+        self._consultar(query)
+
+#-------------------------------------------------------------------------------
+
+class ArmazemLocal:
+    """
+    Servidor SPARQL local sobre um grafo rdflib, numa thread própria.
+    `endpoint` é a URL a passar para o ClienteSPARQL. Use como gerenciador
+    de contexto ou chame `fechar()` ao terminar.
+    """
+
+    def __init__(self, grafo: Graph = None, porta: int = 0, repositorio: str = 'gtfs-rj'):
+        self.grafo = grafo if grafo is not None else Graph()
+        self.trava = threading.Lock()
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', porta), _Requisicao)
+        self._servidor.daemon_threads = True
+        self._servidor.armazem = self
+        self.endpoint = f'http://127.0.0.1:{self._servidor.server_port}/repositories/{repositorio}'
+        self._thread = threading.Thread(target=self._servidor.serve_forever, name='armazem-local', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
+
+    def fechar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
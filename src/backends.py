@@ -0,0 +1,205 @@
+import os
+import pickle
+import threading
+
+import versao_dados
+from cronometro import etapa
+from versao_dados import ENDPOINT
+
+# Backends de consulta do sparql.py. Todos têm a interface do ClienteSPARQL
+# (consultar, consultar_tabela, consultar_varias, consultar_async, versao,
+# invalidar e fechar):
+#   - ClienteSPARQL: endpoint remoto (GraphDB/RDF4J) por HTTP;
+#   - BackendLocal: grafo rdflib embutido no próprio processo, carregado do
+#     gtfs.ttl gerado por csvToRdf.generate_rdf_graph (ou de um N-Triples) e
+#     salvo num snapshot pickle ao lado do arquivo, que carrega bem mais rápido
+#     nas execuções seguintes.
+# `criar_backend` escolhe o backend a partir de uma URL ou de um caminho, e
+# BackendSobDemanda adia essa escolha até a primeira consulta.
+# pandas, rdflib e o cliente HTTP são importados só ao criar ou usar um
+# backend: o main.py importa este módulo para consultar a versão do
+# repositório (versao_repositorio) e não paga essas importações.
+
+VARIAVEL_AMBIENTE = 'GTFS_SPARQL'
+
+def _termo_json(termo) -> dict:
+    "Converte um termo rdflib no formato de um binding SPARQL JSON."
+
+    from rdflib import BNode, Literal
+
+    if isinstance(termo, Literal):
+        valor = {'type': 'literal', 'value': str(termo)}
+        if termo.language:
+            valor['xml:lang'] = termo.language
+        elif termo.datatype:
+            valor['datatype'] = str(termo.datatype)
+        return valor
+    if isinstance(termo, BNode):
+        return {'type': 'bnode', 'value': str(termo)}
+    return {'type': 'uri', 'value': str(termo)}
+
+#-------------------------------------------------------------------------------
+
+class BackendLocal:
+    """
+    Backend SPARQL em processo sobre um grafo rdflib, sem rede. `arquivo` é o
+    RDF de origem (.ttl, .nt ou .nt.gz); o snapshot (`arquivo` + '.pkl', por
+    padrão) guarda a assinatura do arquivo (caminho, tamanho e data de
+    modificação) e é refeito quando ela muda. As consultas são
+    serializadas por uma trava, já que o rdflib não é seguro para threads.
+    """
+
+    def __init__(self, arquivo: str = './gtfs.ttl', snapshot: str = None, grafo=None):
+        self.arquivo = arquivo
+        self.snapshot = snapshot if snapshot is not None else arquivo + '.pkl'
+        self._trava = threading.Lock()
+        self.grafo = grafo if grafo is not None else self._carregar()
+
+    def _assinatura(self) -> tuple:
+        "Identifica o arquivo de origem: caminho absoluto, tamanho e data de modificação."
+
+        estado = os.stat(self.arquivo)
+        return (os.path.abspath(self.arquivo), estado.st_size, estado.st_mtime_ns)
+
+    def _carregar(self):
+        # Sem o arquivo de origem não há como validar o snapshot: os.stat
+        # levanta FileNotFoundError em vez de servir um grafo órfão.
+        assinatura = self._assinatura()
+        if self.snapshot and os.path.exists(self.snapshot):
+            # A assinatura vem antes do grafo no arquivo, como no roteador.pkl.
+            with open(self.snapshot, 'rb') as f:
+                if pickle.load(f) == assinatura:
+                    return pickle.load(f)
+
+        from armazem_local import carregar_grafo
+        grafo = carregar_grafo(self.arquivo)
+        if self.snapshot:
+            with open(self.snapshot, 'wb') as f:
+                pickle.dump(assinatura, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(grafo, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return grafo
+
+    #---------------------------------------------------------------------------
+
+    def versao(self) -> str:
+        "Versão do grafo: marcador de versão e número de triplas, como no ClienteSPARQL."
+
+        with self._trava:
+            marcador = ','.join(sorted(str(v) for (v,) in self.grafo.query(versao_dados.QUERY_VERSAO)))
+            return versao_dados.compor(marcador, len(self.grafo))
+
+    def invalidar(self):
+        pass
+
+    def _executar(self, query: str):
+        with etapa('consulta'), self._trava:
+            resultado = self.grafo.query(query)
+            return [str(v) for v in resultado.vars], list(resultado)
+
+    def consultar(self, query: str, cache: bool = True) -> dict:
+        "Executa uma query SELECT e retorna o resultado no formato SPARQL JSON já decodificado."
+
+        variaveis, linhas = self._executar(query)
+        bindings = [
+            {v: _termo_json(t) for v, t in zip(variaveis, linha) if t is not None}
+            for linha in linhas
+        ]
+        return {'head': {'vars': variaveis}, 'results': {'bindings': bindings}}
+
+    def consultar_tabela(self, query: str, tipos: dict = None, cache: bool = True, engine: str = 'c'):
+        "Executa uma query SELECT e retorna um DataFrame com as colunas de `tipos` tipadas."
+
+        import pandas as panda
+
+        variaveis, linhas = self._executar(query)
+        if not variaveis:
+            return panda.DataFrame()
+        colunas = list(zip(*linhas)) if linhas else [()] * len(variaveis)
+        df = panda.DataFrame({
+            v: panda.Series([None if t is None else str(t) for t in coluna], dtype=object)
+            for v, coluna in zip(variaveis, colunas)
+        })
+        for coluna, tipo in (tipos or {}).items():
+            if coluna in df.columns:
+                df[coluna] = df[coluna].astype(tipo)
+        return df
+
+    def consultar_varias(self, queries, cache: bool = True) -> list:
+        return [self.consultar(q, cache) for q in queries]
+
+    async def consultar_async(self, query: str, cache: bool = True) -> dict:
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, self.consultar, query, cache)
+
+    async def consultar_varias_async(self, queries, cache: bool = True) -> list:
+        import asyncio
+        return await asyncio.gather(*(self.consultar_async(q, cache) for q in queries))
+
+    def fechar(self):
+        pass
+
+#-------------------------------------------------------------------------------
+
+def _remoto(destino: str) -> bool:
+    """
+    Se `destino` é a URL de um endpoint remoto (http ou https). Outras URLs
+    são recusadas, em vez de tratadas como caminho de arquivo.
+    """
+    esquema, separador, _ = destino.partition('://')
+    if not separador:
+        return False
+    if esquema.lower() not in ('http', 'https'):
+        raise ValueError(f"Esquema de URL não suportado: {destino!r} (use http, https ou um caminho de arquivo)")
+    return True
+
+def versao_repositorio(destino: str = None) -> str:
+    """
+    Versão do repositório de `destino` (mesma resolução de criar_backend) sem
+    criar o backend: o marcador de versão e o número de triplas de um
+    endpoint remoto, ou o tamanho e a data de modificação de um arquivo RDF.
+    """
+    destino = destino or os.environ.get(VARIAVEL_AMBIENTE) or ENDPOINT
+    if _remoto(destino):
+        return versao_dados.versao_endpoint(destino)
+    estado = os.stat(destino)
+    return f'arquivo-{estado.st_size}-{estado.st_mtime_ns}'
+
+class BackendSobDemanda:
+    """
+    Adia a criação do backend (criar_backend(destino)) até o primeiro uso e
+    então repassa tudo a ele. É o `sparql.cliente` padrão: importar o
+    sparql.py (ex.: nos processos do lote.py, que só desenham mapas) não abre
+    conexões nem carrega o grafo.
+    """
+
+    def __init__(self, destino: str = None):
+        self.destino = destino
+        self._backend = None
+        self._trava = threading.Lock()
+
+    def backend(self):
+        if self._backend is None:
+            with self._trava:
+                if self._backend is None:
+                    self._backend = criar_backend(self.destino)
+        return self._backend
+
+    def __getattr__(self, nome):
+        return getattr(self.backend(), nome)
+
+    def fechar(self):
+        if self._backend is not None:
+            self._backend.fechar()
+
+def criar_backend(destino: str = None):
+    """
+    Cria o backend de consulta: uma URL http ou https usa o endpoint remoto
+    (https com TLS, na porta 443 por padrão); um caminho de arquivo, o
+    BackendLocal. Sem `destino`, usa a variável de ambiente GTFS_SPARQL e, na
+    falta dela, o endpoint padrão do GraphDB.
+    """
+    destino = destino or os.environ.get(VARIAVEL_AMBIENTE) or ENDPOINT
+    if _remoto(destino):
+        from cliente_sparql import ClienteSPARQL
+        return ClienteSPARQL(destino)
+    return BackendLocal(destino)
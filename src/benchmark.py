@@ -0,0 +1,261 @@
+import contextlib
+import datetime
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as panda
+
+import csvToRdf
+import cronometro
+
+# Benchmarks do projeto. Cada função mede um estágio e retorna uma lista de
+# dicionários (uma linha por variante medida), impressa como tabela.
+
+def _medir(funcao):
+    """
+    Executa `funcao` duas vezes: uma cronometrada e outra com o tracemalloc
+    ligado (que distorce o tempo) para medir o pico de memória alocada.
+    Retorna (resultado, segundos, pico de memória em MB).
+    """
+    inicio = time.perf_counter()
+    resultado = funcao()
+    duracao = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, duracao, pico / 2**20
+
+def _imprimir(linhas):
+    if linhas:
+        print(panda.DataFrame(linhas).to_string(index=False, float_format=lambda x: f'{x:,.2f}'))
+
+#-------------------------------------------------------------------------------
+
+def _leitura_original(nome):
+    df = panda.read_csv(f'{csvToRdf.BASE_DIR}/{nome}.csv')
+    return len(df), df.memory_usage(deep=True).sum()
+
+def _leitura_tipada(nome, engine='c'):
+    df = csvToRdf.ler_tabela(nome, engine=engine)
+    return len(df), df.memory_usage(deep=True).sum()
+
+def _leitura_em_blocos(nome, chunksize):
+    linhas, maior = 0, 0
+    for df in csvToRdf.ler_tabela(nome, chunksize=chunksize):
+        linhas += len(df)
+        maior = max(maior, df.memory_usage(deep=True).sum())
+    return linhas, maior
+
+def benchmark_leitura(nomes=('stops', 'trips', 'stop_times'), chunksize: int = 200_000):
+    """
+    Compara o leitor original (read_csv sem parâmetros) com a leitura tipada
+    inteira, em blocos e, se instalado, com o engine pyarrow. Para cada tabela
+    reporta tempo, linhas/s, pico de memória alocada e o tamanho do DataFrame
+    residente (no modo em blocos, o do maior bloco).
+    """
+    import importlib.util
+
+    variantes = [
+        ('original', _leitura_original),
+        ('tipada', _leitura_tipada),
+        (f'blocos de {chunksize}', lambda nome: _leitura_em_blocos(nome, chunksize)),
+    ]
+    if importlib.util.find_spec('pyarrow') is not None:
+        variantes.append(('tipada pyarrow', lambda nome: _leitura_tipada(nome, 'pyarrow')))
+
+    linhas = []
+    for nome in nomes:
+        for variante, funcao in variantes:
+            (n, residente), duracao, pico = _medir(lambda: funcao(nome))
+            linhas.append({
+                'tabela': nome,
+                'leitor': variante,
+                'segundos': duracao,
+                'linhas/s': n / duracao if duracao else float('inf'),
+                'pico MB': pico,
+                'residente MB': residente / 2**20,
+            })
+
+    _imprimir(linhas)
+    return linhas
+
+#-------------------------------------------------------------------------------
+
+# Benchmark das funções de consulta (sparql.py) sobre um feed sintético servido
+# por um armazém SPARQL local. O tempo de cada função é dividido nas etapas
+# marcadas com cronometro.etapa ('consulta': ida e volta HTTP ao armazém,
+# 'json': decodificação, 'roteamento', 'renderizacao': folium/matplotlib);
+# 'processamento' é o restante, o pós-processamento em Python.
+
+def _reiniciar_estado(sparql, roteamento):
+    "Descarta os caches em memória e em disco, para medir as funções a frio."
+
+    sparql.cliente.invalidar()
+    sparql.descartar_indice()
+    roteamento.descartar_roteador(remover_cache=True)
+
+def _casos(sparql, stops: panda.DataFrame) -> list:
+    origem = stops.iloc[0]
+    destino = stops.iloc[len(stops) // 2]
+    return [
+        ('plot_paradas_linha', lambda: sparql.plot_paradas_linha('100')),
+        ('melhor_rota', lambda: sparql.melhor_rota(origem['stop_lat'], origem['stop_lon'], destino['stop_lat'], destino['stop_lon'])),
+        ('encontrar_estacao_mais_proxima', lambda: sparql.encontrar_estacao_mais_proxima(origem['stop_lat'], origem['stop_lon'])),
+        ('generate_heatmap_paradas_geral', sparql.generate_heatmap_paradas_geral),
+        ('generate_heatmap_paradas_geral_folium', sparql.generate_heatmap_paradas_geral_folium),
+        ('generate_heatmap_paradas_linha', lambda: sparql.generate_heatmap_paradas_linha('R0')),
+    ]
+
+def _medir_caso(funcao, repeticoes: int, reiniciar) -> dict:
+    "Executa o caso `repeticoes` vezes e retorna {etapa: [segundos de cada execução]}."
+
+    medidas = {}
+    for _ in range(repeticoes):
+        if reiniciar:
+            reiniciar()
+        with contextlib.redirect_stdout(io.StringIO()), cronometro.registrando() as etapas:
+            inicio = time.perf_counter()
+            funcao()
+            total = time.perf_counter() - inicio
+        etapas['processamento'] = total - sum(etapas.values())
+        etapas['total'] = total
+        for etapa, segundos in etapas.items():
+            medidas.setdefault(etapa, []).append(segundos)
+    return medidas
+
+def _historico(saida: str) -> list:
+    if not os.path.exists(saida):
+        return []
+    with open(saida, encoding='utf-8') as f:
+        return json.load(f)
+
+def _comparar_com_anterior(historico: list, registro: dict):
+    "Imprime a variação do tempo total de cada função em relação à última execução na mesma escala."
+
+    anteriores = [r for r in historico if r['escala'] == registro['escala']]
+    if not anteriores:
+        return
+    antes = {(l['funcao'], l['etapa']): l['mediana'] for l in anteriores[-1]['resultados']}
+    print(f"Comparação com a execução de {anteriores[-1]['data']}:")
+    for linha in registro['resultados']:
+        anterior = antes.get((linha['funcao'], 'total'))
+        if linha['etapa'] == 'total' and anterior:
+            variacao = (linha['mediana'] - anterior) / anterior * 100
+            print(f"  {linha['funcao']}: {anterior:.3f}s -> {linha['mediana']:.3f}s ({variacao:+.1f}%)")
+
+def benchmark_sparql(
+    paradas: int = 2000,
+    linhas: int = 50,
+    viagens: int = 2000,
+    repeticoes: int = 3,
+    frio: bool = True,
+    saida: str = './benchmark_sparql.json',
+    semente: int = 0,
+    embutido: bool = False,
+) -> dict:
+    """
+    Gera um feed sintético na escala pedida, converte-o para RDF, serve-o num
+    armazém SPARQL local e mede cada função de sparql.py por etapa. Com `frio`,
+    os caches (do cliente, do índice de paradas e do roteador) são descartados
+    antes de cada repetição; senão, uma execução de aquecimento é descartada.
+    O registro da execução (mediana e mínimo de cada etapa) é acrescentado ao
+    histórico JSON em `saida` e comparado com a última execução na mesma escala.
+    Com `embutido`, as funções consultam o grafo em processo (BackendLocal),
+    sem o HTTP do armazém local.
+    """
+    import matplotlib.pyplot as plt
+
+    import roteamento
+    import sparql
+    from armazem_local import ArmazemLocal, carregar_grafo
+    from backends import BackendLocal
+    from cliente_sparql import ClienteSPARQL
+    from feed_sintetico import gerar_feed
+
+    escala = {
+        'paradas': paradas, 'linhas': linhas, 'viagens': viagens, 'semente': semente, 'frio': frio,
+        'backend': 'embutido' if embutido else 'http',
+    }
+    base_dir, cliente, diretorio = csvToRdf.BASE_DIR, sparql.cliente, os.getcwd()
+    preparacao = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inicio = time.perf_counter()
+        tabelas = gerar_feed(f'{tmp}/gtfs', paradas, linhas, viagens, semente)
+        preparacao['geracao'] = time.perf_counter() - inicio
+
+        csvToRdf.BASE_DIR = f'{tmp}/gtfs'
+        inicio = time.perf_counter()
+        preparacao['triplas'] = csvToRdf.generate_rdf_stream(f'{tmp}/gtfs.nt.gz')
+        preparacao['conversao'] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        grafo = carregar_grafo(f'{tmp}/gtfs.nt.gz')
+        preparacao['carga'] = time.perf_counter() - inicio
+
+        # As funções gravam em ../map e leem ../mapa_rj.png.
+        os.makedirs(f'{tmp}/map')
+        os.makedirs(f'{tmp}/trabalho')
+        plt.imsave(f'{tmp}/mapa_rj.png', np.full((8, 8, 3), 0.9))
+
+        stops = csvToRdf.ler_tabela('stops')
+        medidas = {}
+        with ArmazemLocal(grafo) as armazem:
+            sparql.usar_backend(BackendLocal(grafo=grafo) if embutido else ClienteSPARQL(armazem.endpoint))
+            os.chdir(f'{tmp}/trabalho')
+            reiniciar = lambda: _reiniciar_estado(sparql, roteamento)
+            try:
+                for nome, funcao in _casos(sparql, stops):
+                    if frio:
+                        medidas[nome] = _medir_caso(funcao, repeticoes, reiniciar)
+                    else:
+                        reiniciar()
+                        _medir_caso(funcao, 1, None)
+                        medidas[nome] = _medir_caso(funcao, repeticoes, None)
+            finally:
+                os.chdir(diretorio)
+                sparql.cliente.fechar()
+                csvToRdf.BASE_DIR = base_dir
+                sparql.usar_backend(cliente)
+                roteamento.descartar_roteador()
+
+    resultados = [
+        {'funcao': nome, 'etapa': etapa, 'mediana': float(np.median(tempos)), 'minimo': float(np.min(tempos))}
+        for nome, etapas in medidas.items()
+        for etapa, tempos in etapas.items()
+    ]
+    registro = {
+        'data': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'escala': escala,
+        'tabelas': tabelas,
+        'preparacao': preparacao,
+        'resultados': resultados,
+    }
+
+    _imprimir(resultados)
+    historico = _historico(saida) if saida else []
+    _comparar_com_anterior(historico, registro)
+    if saida:
+        with open(saida, 'w', encoding='utf-8') as f:
+            json.dump(historico + [registro], f, indent=1, ensure_ascii=False)
+    return registro
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    # python benchmark.py [leitura | sparql [paradas linhas viagens]]
+    if len(sys.argv) > 1 and sys.argv[1] == 'sparql':
+        benchmark_sparql(*(int(v) for v in sys.argv[2:5]))
+    else:
+        benchmark_leitura()
@@ -0,0 +1,262 @@
+import asyncio
+import http.client
+import io
+import json
+import queue
+import re
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as panda
+
+import versao_dados
+from cronometro import etapa
+from versao_dados import ENDPOINT
+
+# Cliente SPARQL com pool de conexões HTTP persistentes, execução concorrente
+# (threads ou asyncio) e cache LRU/TTL de resultados. O cache é esvaziado
+# quando o repositório muda, detectado pelo marcador de versão gravado a cada
+# escrita (versao_dados.py) junto com o número de triplas (/size).
+# Resultados grandes podem ser pedidos em SPARQL CSV e lidos direto num
+# DataFrame com colunas tipadas, sem montar o JSON binding a binding.
+
+_ESPACOS_FORA_DE_LITERAIS = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|<[^<>\s]*>)|\s+')
+
+def normalizar_query(query: str) -> str:
+    "Colapsa os espaços de uma query (fora de literais e IRIs) para usá-la como chave de cache."
+
+    return _ESPACOS_FORA_DE_LITERAIS.sub(lambda m: m.group(1) or ' ', query).strip()
+
+def ler_csv(corpo: bytes, tipos: dict = None, engine: str = 'c') -> panda.DataFrame:
+    """
+    Lê um resultado SPARQL CSV num DataFrame. `tipos` ({variável: dtype})
+    tipa as colunas na leitura (ex.: 'float64' para coordenadas); as demais
+    ficam como texto. Variáveis não ligadas viram nulos. `engine='pyarrow'`
+    usa o leitor do Arrow, se instalado.
+    """
+    if not corpo.strip():
+        return panda.DataFrame()
+    if engine == 'pyarrow':
+        import importlib.util
+        if importlib.util.find_spec('pyarrow') is None:
+            engine = 'c'
+    cabecalho = corpo.split(b'\n', 1)[0].decode('utf-8').strip().split(',')
+    tipos = {c: tipos.get(c, 'str') for c in cabecalho} if tipos else 'str'
+    return panda.read_csv(io.BytesIO(corpo), dtype=tipos, engine=engine, keep_default_na=False, na_values=[''])
+
+#-------------------------------------------------------------------------------
+
+def conexao_http(url: urllib.parse.SplitResult, timeout: float = None) -> http.client.HTTPConnection:
+    "Conexão com o servidor de uma URL http ou https (na porta padrão do esquema, se omitida)."
+
+    if url.scheme not in ('http', 'https'):
+        raise ValueError(f"Esquema de URL não suportado: {url.geturl()!r} (use http ou https)")
+    if url.scheme == 'https':
+        return http.client.HTTPSConnection(url.hostname, url.port or 443, timeout=timeout)
+    return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+
+class _PoolConexoes:
+    "Pool de conexões HTTP(S) keep-alive para um mesmo servidor."
+
+    def __init__(self, url: urllib.parse.SplitResult, tamanho: int, timeout: float):
+        self.url, self.timeout = url, timeout
+        conexao_http(url)  # valida o esquema já na criação do cliente
+        self._livres = queue.LifoQueue()
+        self._vagas = threading.Semaphore(tamanho)
+
+    def requisitar(self, metodo: str, caminho: str, corpo=None, cabecalhos=None):
+        "Executa uma requisição numa conexão do pool; retorna (status, corpo)."
+
+        self._vagas.acquire()
+        try:
+            for tentativa in range(2):
+                try:
+                    conexao = self._livres.get_nowait()
+                except queue.Empty:
+                    conexao = conexao_http(self.url, self.timeout)
+                try:
+                    conexao.request(metodo, caminho, body=corpo, headers=cabecalhos or {})
+                    resposta = conexao.getresponse()
+                    dados = resposta.read()
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionError):
+                    # Conexão ociosa fechada pelo servidor: tenta uma vez com outra.
+                    conexao.close()
+                    if tentativa:
+                        raise
+                    continue
+                except Exception:
+                    conexao.close()
+                    raise
+                if resposta.will_close:
+                    conexao.close()
+                else:
+                    self._livres.put(conexao)
+                return resposta.status, dados
+        finally:
+            self._vagas.release()
+
+    def fechar(self):
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                return
+
+#-------------------------------------------------------------------------------
+
+class ClienteSPARQL:
+    """
+    Cliente de um endpoint SPARQL (GraphDB/RDF4J). `consultar` é seguro para
+    uso concorrente; `consultar_varias` e `consultar_async` executam várias
+    queries em paralelo no pool de threads do cliente.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = ENDPOINT,
+        conexoes: int = 8,
+        cache_tamanho: int = 256,
+        cache_ttl: float = 300,
+        intervalo_versao: float = 5,
+        timeout: float = 300,
+    ):
+        self.endpoint = endpoint
+        url = urllib.parse.urlsplit(endpoint)
+        self._caminho = url.path
+        self._pool = _PoolConexoes(url, conexoes, timeout)
+        self._executor = ThreadPoolExecutor(max_workers=conexoes, thread_name_prefix='sparql')
+
+        self.cache_tamanho, self.cache_ttl = cache_tamanho, cache_ttl
+        self._cache = OrderedDict()
+        self._trava = threading.Lock()
+
+        self.intervalo_versao = intervalo_versao
+        self._versao = None
+        self._versao_em = float('-inf')
+
+    #---------------------------------------------------------------------------
+
+    def versao(self) -> str:
+        """
+        Versão do repositório (marcador de versão e número de triplas, ver
+        versao_dados.py). É consultada no máximo a cada `intervalo_versao`
+        segundos; quando muda, o cache é esvaziado.
+        """
+        agora = time.monotonic()
+        if agora - self._versao_em < self.intervalo_versao:
+            return self._versao
+
+        status, triplas = self._pool.requisitar('GET', f'{self._caminho}/size')
+        if status >= 300:
+            raise RuntimeError(f"Falha ao consultar a versão do repositório: {status} {triplas[:500]!r}")
+        status, marcador = self._pool.requisitar(
+            'POST', self._caminho,
+            corpo=urllib.parse.urlencode({'query': versao_dados.QUERY_VERSAO}),
+            cabecalhos={'Content-Type': 'application/x-www-form-urlencoded', 'Accept': 'text/csv'},
+        )
+        if status >= 300:
+            raise RuntimeError(f"Falha ao consultar a versão do repositório: {status} {marcador[:500]!r}")
+        versao = versao_dados.compor(versao_dados.ler_marcador(marcador), triplas.decode().strip())
+
+        with self._trava:
+            if versao != self._versao:
+                self._cache.clear()
+            self._versao, self._versao_em = versao, agora
+        return versao
+
+    def invalidar(self):
+        "Esvazia o cache de resultados."
+
+        with self._trava:
+            self._cache.clear()
+
+    def _do_cache(self, chave):
+        with self._trava:
+            item = self._cache.get(chave)
+            if item is None:
+                return None
+            resultado, criado_em = item
+            if time.monotonic() - criado_em > self.cache_ttl:
+                del self._cache[chave]
+                return None
+            self._cache.move_to_end(chave)
+            return resultado
+
+    def _para_cache(self, chave, resultado):
+        with self._trava:
+            self._cache[chave] = (resultado, time.monotonic())
+            self._cache.move_to_end(chave)
+            while len(self._cache) > self.cache_tamanho:
+                self._cache.popitem(last=False)
+
+    #---------------------------------------------------------------------------
+
+    def _executar(self, query: str, aceitar: str) -> bytes:
+        with etapa('consulta'):
+            status, corpo = self._pool.requisitar(
+                'POST', self._caminho,
+                corpo=urllib.parse.urlencode({'query': query}),
+                cabecalhos={'Content-Type': 'application/x-www-form-urlencoded', 'Accept': aceitar},
+            )
+        if status >= 300:
+            raise RuntimeError(f"Erro SPARQL {status}: {corpo[:500]!r}")
+        return corpo
+
+    def consultar(self, query: str, cache: bool = True) -> dict:
+        "Executa uma query SELECT e retorna o resultado SPARQL JSON já decodificado."
+
+        chave = ('json', normalizar_query(query))
+        if cache:
+            self.versao()
+            resultado = self._do_cache(chave)
+            if resultado is not None:
+                return resultado
+
+        corpo = self._executar(query, 'application/sparql-results+json')
+        with etapa('json'):
+            resultado = json.loads(corpo)
+        if cache:
+            self._para_cache(chave, resultado)
+        return resultado
+
+    def consultar_tabela(self, query: str, tipos: dict = None, cache: bool = True, engine: str = 'c') -> panda.DataFrame:
+        """
+        Executa uma query SELECT pedindo o resultado em SPARQL CSV e o retorna
+        como DataFrame, com as colunas de `tipos` já tipadas (ver `ler_csv`).
+        As colunas numéricas podem ser usadas direto como arrays NumPy.
+        """
+        chave = ('csv', normalizar_query(query), tuple(sorted((tipos or {}).items())), engine)
+        if cache:
+            self.versao()
+            resultado = self._do_cache(chave)
+            if resultado is not None:
+                return resultado.copy()
+
+        corpo = self._executar(query, 'text/csv')
+        with etapa('csv'):
+            resultado = ler_csv(corpo, tipos, engine)
+        if cache:
+            self._para_cache(chave, resultado)
+            return resultado.copy()
+        return resultado
+
+    def consultar_varias(self, queries, cache: bool = True) -> list:
+        "Executa várias queries em paralelo e retorna os resultados na mesma ordem."
+
+        return list(self._executor.map(lambda q: self.consultar(q, cache), queries))
+
+    async def consultar_async(self, query: str, cache: bool = True) -> dict:
+        "Versão asyncio de `consultar` (executada no pool de threads do cliente)."
+
+        laco = asyncio.get_running_loop()
+        return await laco.run_in_executor(self._executor, self.consultar, query, cache)
+
+    async def consultar_varias_async(self, queries, cache: bool = True) -> list:
+        return await asyncio.gather(*(self.consultar_async(q, cache) for q in queries))
+
+    def fechar(self):
+        self._executor.shutdown(wait=False)
+        self._pool.fechar()
@@ -0,0 +1,402 @@
+import pandas as panda
+from typing import NamedTuple, Optional
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import RDF, FOAF, XSD, DC
+
+import csvToRdf
+from csvToRdf import GTFS_URI, TIME_URI, GEO_URI, GEOSPARQL_URI
+
+# Motor de conversão colunar: em vez de percorrer cada DataFrame com iterrows,
+# as triplas são montadas coluna a coluna. Cada tabela vira uma lista de
+# blocos (sujeitos, predicado, objetos) em que sujeitos e objetos são Series
+# de texto, e só no final os blocos são materializados num grafo rdflib.
+
+ROUTE_TYPE_MAP = {
+    "0": GTFS_URI.LightRail,
+    "1": GTFS_URI.SubWay,
+    "2": GTFS_URI.Rail,
+    "3": GTFS_URI.Bus,
+    "4": GTFS_URI.Ferry,
+    "5": GTFS_URI.CableCar,
+    "6": GTFS_URI.Gondola,
+    "7": GTFS_URI.Funicular,
+}
+
+PICKUP_TYPE_MAP = {
+    "0": GTFS_URI.Regular,
+    "1": GTFS_URI.NotAvailable,
+    "2": GTFS_URI.MustPhone,
+    "3": GTFS_URI.MustCoordinateWithDriver,
+}
+
+WHEELCHAIR_MAP = {
+    "0": GTFS_URI.CheckParentStation,
+    "1": GTFS_URI.WheelchairAccessible,
+    "2": GTFS_URI.NotWheelchairAccessible,
+}
+
+#-------------------------------------------------------------------------------
+
+class Bloco(NamedTuple):
+    "Conjunto de triplas com o mesmo predicado, representado de forma colunar."
+
+    sujeitos: panda.Series
+    predicado: URIRef
+    objetos: object                 # Series de texto ou um valor constante
+    iri: bool = False               # objetos são IRIs (senão, literais)
+    datatype: Optional[URIRef] = None
+
+    def __len__(self):
+        return len(self.sujeitos)
+
+#-------------------------------------------------------------------------------
+# Conversores de coluna e geradores de blocos, usados também pelos módulos que
+# geram triplas no mesmo formato (jornadas.py, frequencias.py).
+
+def texto(serie: panda.Series) -> panda.Series:
+    "Converte uma coluna para texto como str() faria em cada célula."
+
+    valores = serie.astype(str)
+    return valores.fillna('nan') if valores.hasnans else valores
+
+def inteiro(serie: panda.Series) -> panda.Series:
+    "Equivalente colunar de str(int(valor))."
+
+    return serie.astype('float64').astype('int64').astype(str)
+
+def booleano(serie: panda.Series) -> panda.Series:
+    "Equivalente colunar de Literal(str(valor) == '1', datatype=XSD.boolean)."
+
+    return (texto(serie) == "1").map({True: "true", False: "false"})
+
+def uri(prefixo: str, serie: panda.Series) -> panda.Series:
+    "Monta as URIs GTFS_URI[prefixo + id] de uma coluna inteira."
+
+    return str(GTFS_URI) + prefixo + texto(serie)
+
+def preenchidas(df: panda.DataFrame, coluna: str) -> Optional[panda.Series]:
+    "Máscara de células preenchidas de uma coluna, ou None se ela não existe."
+
+    if coluna not in df.columns:
+        return None
+    return df[coluna].notna()
+
+def blocos_opcionais(df, sujeitos, colunas):
+    """
+    Gera os blocos das colunas opcionais de uma tabela. `colunas` é uma lista de
+    (coluna, predicado, conversor, datatype); a máscara de nulos é calculada
+    uma única vez por coluna.
+    """
+    for coluna, predicado, conversor, datatype in colunas:
+        mascara = preenchidas(df, coluna)
+        if mascara is None or not mascara.any():
+            continue
+        yield Bloco(sujeitos[mascara], predicado, conversor(df.loc[mascara, coluna]), datatype=datatype)
+
+def blocos_enum(sujeitos, predicado, codigos, mapa):
+    "Bloco de uma coluna codificada por dicionário (tipos de rota, embarque...)."
+
+    objetos = codigos.map({codigo: str(uri) for codigo, uri in mapa.items()})
+    validos = objetos.notna()
+    if validos.any():
+        yield Bloco(sujeitos[validos], predicado, objetos[validos], iri=True)
+
+#-------------------------------------------------------------------------------
+
+def triplas_agency(df: panda.DataFrame):
+    "Versão colunar de add_agency_to_rdf."
+
+    sujeitos = uri("agency/", df['agency_id'])
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.Agency), iri=True)
+    yield from blocos_opcionais(df, sujeitos, [
+        ('agency_name', FOAF.name, texto, XSD.string),
+        ('agency_url', FOAF.page, texto, None),
+        ('agency_timezone', TIME_URI.timeZone, texto, XSD.string),
+    ])
+
+def triplas_frequencies(df: panda.DataFrame):
+    "Versão colunar de add_frequencies_to_rdf."
+
+    obrigatorias = ['trip_id', 'start_time', 'end_time', 'headway_secs']
+    completas = panda.Series(True, index=df.index)
+    for coluna in obrigatorias:
+        mascara = preenchidas(df, coluna)
+        completas &= mascara if mascara is not None else False
+
+    incompletas = int((~completas).sum())
+    if incompletas:
+        print(f"{incompletas} frequencies don't contain all required fields")
+
+    df = df[completas]
+    inicio, fim = texto(df['start_time']), texto(df['end_time'])
+    sujeitos = str(GTFS_URI) + "trips/" + texto(df['trip_id']) + "/frequencies/" + inicio + fim
+
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.Frequency), iri=True)
+    yield Bloco(sujeitos, GTFS_URI.startTime, inicio, datatype=XSD.string)
+    yield Bloco(sujeitos, GTFS_URI.endTime, fim, datatype=XSD.string)
+    yield Bloco(sujeitos, GTFS_URI.headwaySeconds, inteiro(df['headway_secs']), datatype=XSD.nonNegativeInteger)
+
+    if 'exact_times' in df.columns:
+        exatos = booleano(df['exact_times']).where(df['exact_times'].notna(), "false")
+    else:
+        exatos = "false"
+    yield Bloco(sujeitos, GTFS_URI.exactTimes, exatos, datatype=XSD.boolean)
+
+def triplas_routes(df: panda.DataFrame):
+    "Versão colunar de add_routes_to_rdf."
+
+    sujeitos = uri("routes/", df['route_id'])
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.Route), iri=True)
+
+    mascara = preenchidas(df, 'agency_id')
+    if mascara is not None and mascara.any():
+        yield Bloco(sujeitos[mascara], GTFS_URI.agency, uri("agency/", df.loc[mascara, 'agency_id']), iri=True)
+
+    yield from blocos_opcionais(df, sujeitos, [
+        ('route_short_name', GTFS_URI.shortName, texto, XSD.string),
+        ('route_long_name', GTFS_URI.longName, texto, XSD.string),
+        ('route_desc', DC.description, texto, XSD.string),
+    ])
+
+    mascara = preenchidas(df, 'route_type')
+    if mascara is not None and mascara.any():
+        yield from blocos_enum(sujeitos[mascara], GTFS_URI.routeType, inteiro(df.loc[mascara, 'route_type']), ROUTE_TYPE_MAP)
+
+    yield from blocos_opcionais(df, sujeitos, [
+        ('route_url', FOAF.page, texto, None),
+        ('route_color', GTFS_URI.color, texto, XSD.string),
+        ('route_textColor', GTFS_URI.textColor, texto, XSD.string),
+    ])
+
+def triplas_stops(df: panda.DataFrame):
+    "Versão colunar de add_stops_to_rdf."
+
+    sujeitos = uri("stops/", df['stop_id'])
+    yield Bloco(sujeitos, DC.identifier, texto(df['stop_id']))
+
+    if 'location_type' in df.columns:
+        estacao = texto(df['location_type']) == "1"
+    else:
+        estacao = panda.Series(False, index=df.index)
+    parada = ~estacao
+
+    yield Bloco(sujeitos[estacao], RDF.type, str(GTFS_URI.Station), iri=True)
+    yield Bloco(sujeitos[parada], RDF.type, str(GTFS_URI.Stop), iri=True)
+
+    mascara = preenchidas(df, 'parent_station')
+    if mascara is not None:
+        mascara &= parada
+        yield Bloco(sujeitos[mascara], GTFS_URI.parentStation, texto(df.loc[mascara, 'parent_station']))
+
+    mascara = preenchidas(df, 'zone_id')
+    if mascara is not None:
+        mascara &= parada
+        zonas = uri("zones/", df.loc[mascara, 'zone_id'])
+        yield Bloco(zonas, RDF.type, str(GTFS_URI.Zone), iri=True)
+        yield Bloco(sujeitos[mascara], GTFS_URI.zone, zonas, iri=True)
+
+    yield from blocos_opcionais(df, sujeitos, [
+        ('stop_code', GTFS_URI.code, texto, None),
+        ('stop_name', FOAF.name, texto, None),
+        ('stop_desc', DC.description, texto, None),
+        ('stop_lat', GEO_URI.lat, texto, XSD.double),
+        ('stop_lon', GEO_URI.long, texto, XSD.double),
+        ('stop_url', FOAF.page, texto, None),
+    ])
+
+    # Geometria GeoSPARQL (ponto WKT, lon lat) das paradas com as duas coordenadas.
+    mascara = preenchidas(df, 'stop_lat')
+    if mascara is not None and 'stop_lon' in df.columns:
+        mascara &= df['stop_lon'].notna()
+        geometrias = sujeitos[mascara] + "/geometry"
+        pontos = "POINT(" + texto(df.loc[mascara, 'stop_lon']) + " " + texto(df.loc[mascara, 'stop_lat']) + ")"
+        yield Bloco(sujeitos[mascara], GEOSPARQL_URI.hasGeometry, geometrias, iri=True)
+        yield Bloco(geometrias, RDF.type, str(GEOSPARQL_URI.Geometry), iri=True)
+        yield Bloco(geometrias, GEOSPARQL_URI.asWKT, pontos, datatype=GEOSPARQL_URI.wktLiteral)
+
+    mascara = preenchidas(df, 'wheelchair_boarding')
+    if mascara is not None and mascara.any():
+        yield from blocos_enum(sujeitos[mascara], GTFS_URI.wheelchairAccessible, texto(df.loc[mascara, 'wheelchair_boarding']), WHEELCHAIR_MAP)
+
+def triplas_stop_times(df: panda.DataFrame):
+    "Versão colunar de add_stop_times_to_rdf."
+
+    trip_ids, stop_ids = texto(df['trip_id']), texto(df['stop_id'])
+    sujeitos = str(GTFS_URI) + "trip/" + trip_ids + "/stop/" + stop_ids
+
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.StopTime), iri=True)
+    yield Bloco(sujeitos, GTFS_URI.stop, str(GTFS_URI) + "stops/" + stop_ids, iri=True)
+    yield Bloco(sujeitos, GTFS_URI.trip, str(GTFS_URI) + "trips/" + trip_ids, iri=True)
+
+    yield from blocos_opcionais(df, sujeitos, [
+        ('arrival_time', GTFS_URI.arrivalTime, texto, XSD.string),
+        ('departure_time', GTFS_URI.departureTime, texto, XSD.string),
+        ('stop_sequence', GTFS_URI.stopSequence, inteiro, XSD.nonNegativeInteger),
+        ('stop_headsign', GTFS_URI.headsign, texto, XSD.string),
+    ])
+
+    mascara = preenchidas(df, 'pickup_type')
+    if mascara is not None and mascara.any():
+        yield from blocos_enum(sujeitos[mascara], GTFS_URI.pickupType, inteiro(df.loc[mascara, 'pickup_type']), PICKUP_TYPE_MAP)
+
+    yield from blocos_opcionais(df, sujeitos, [
+        ('shape_dist_traveled', GTFS_URI.distanceTraveled, inteiro, XSD.nonNegativeInteger),
+    ])
+
+def triplas_trips(df: panda.DataFrame):
+    "Versão colunar de add_trips_to_rdf."
+
+    sujeitos = uri("trips/", df['trip_id'])
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.Trip), iri=True)
+
+    mascara = preenchidas(df, 'route_id')
+    if mascara is not None and mascara.any():
+        yield Bloco(sujeitos[mascara], GTFS_URI.route, uri("routes/", df.loc[mascara, 'route_id']), iri=True)
+
+    mascara = preenchidas(df, 'service_id')
+    if mascara is not None and mascara.any():
+        yield Bloco(sujeitos[mascara], GTFS_URI.service, uri("services/", df.loc[mascara, 'service_id']), iri=True)
+
+    yield from blocos_opcionais(df, sujeitos, [
+        ('trip_headsign', GTFS_URI.headsign, texto, XSD.string),
+        ('trip_short_name', GTFS_URI.shortName, texto, XSD.string),
+        ('direction_id', GTFS_URI.direction, booleano, XSD.boolean),
+    ])
+
+    mascara = preenchidas(df, 'shape_id')
+    if mascara is not None and mascara.any():
+        shapes = uri("shapes/", df.loc[mascara, 'shape_id'])
+        yield Bloco(shapes, RDF.type, str(GTFS_URI.Shape), iri=True)
+        yield Bloco(sujeitos[mascara], GTFS_URI.shape, shapes, iri=True)
+
+def triplas_shapes(df: panda.DataFrame):
+    "Versão colunar de add_shapes_to_rdf: uma geometria WKT por shape."
+
+    wkt = csvToRdf.wkt_shapes(df)
+    ids = panda.Series(wkt.index, dtype=object)
+    sujeitos = uri("shapes/", ids)
+    geometrias = sujeitos + "/geometry"
+
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.Shape), iri=True)
+    yield Bloco(sujeitos, GEOSPARQL_URI.hasGeometry, geometrias, iri=True)
+    yield Bloco(geometrias, RDF.type, str(GEOSPARQL_URI.Geometry), iri=True)
+    yield Bloco(geometrias, GEOSPARQL_URI.asWKT, panda.Series(wkt.to_numpy(), dtype=object), datatype=GEOSPARQL_URI.wktLiteral)
+
+def triplas_padroes(stop_times: panda.DataFrame, trips: panda.DataFrame):
+    "Versão colunar de add_patterns_to_rdf."
+
+    paradas, viagens = csvToRdf.padroes_de_parada(stop_times, trips)
+
+    atendidas = paradas.drop_duplicates(['route_id', 'stop_id'])
+    yield Bloco(uri("routes/", atendidas['route_id']), GTFS_URI.servesStop, uri("stops/", atendidas['stop_id']), iri=True)
+
+    padroes = paradas.drop_duplicates('pattern_id')
+    sujeitos = uri("patterns/", padroes['pattern_id'])
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.StopPattern), iri=True)
+    yield Bloco(sujeitos, GTFS_URI.route, uri("routes/", padroes['route_id']), iri=True)
+
+    padroes = uri("patterns/", paradas['pattern_id'])
+    sujeitos = padroes + "/stops/" + texto(paradas['posicao'])
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.PatternStop), iri=True)
+    yield Bloco(sujeitos, GTFS_URI.pattern, padroes, iri=True)
+    yield Bloco(sujeitos, GTFS_URI.stop, uri("stops/", paradas['stop_id']), iri=True)
+    yield Bloco(sujeitos, GTFS_URI.stopSequence, texto(paradas['posicao']), datatype=XSD.nonNegativeInteger)
+
+    yield Bloco(uri("trips/", viagens['trip_id']), GTFS_URI.pattern, uri("patterns/", viagens['pattern_id']), iri=True)
+
+#-------------------------------------------------------------------------------
+
+CONVERSORES = {
+    'agency': triplas_agency,
+    'frequencies': triplas_frequencies,
+    'routes': triplas_routes,
+    'shapes': triplas_shapes,
+    'stops': triplas_stops,
+    'stop_times': triplas_stop_times,
+    'trips': triplas_trips,
+}
+
+def _termos(valores, iri: bool, datatype):
+    """
+    Materializa uma coluna de texto em termos rdflib. Os valores são
+    codificados por dicionário antes, então cada termo distinto (ex.: a URI de
+    uma parada referenciada por milhares de stop_times) é criado uma só vez.
+    """
+    codigos, unicos = panda.factorize(valores)
+    if iri:
+        termos = [URIRef(v) for v in unicos]
+    else:
+        termos = [Literal(v, datatype=datatype) for v in unicos]
+    return [termos[c] for c in codigos]
+
+def adicionar_blocos(grafo: Graph, blocos) -> int:
+    "Adiciona os blocos ao grafo rdflib e retorna o número de triplas geradas."
+
+    total = 0
+    for bloco in blocos:
+        if not len(bloco):
+            continue
+        sujeitos = _termos(bloco.sujeitos, True, None)
+        if isinstance(bloco.objetos, panda.Series):
+            objetos = _termos(bloco.objetos, bloco.iri, bloco.datatype)
+        else:
+            termo = URIRef(bloco.objetos) if bloco.iri else Literal(bloco.objetos, datatype=bloco.datatype)
+            objetos = [termo] * len(sujeitos)
+        grafo.addN((s, bloco.predicado, o, grafo) for s, o in zip(sujeitos, objetos))
+        total += len(sujeitos)
+    return total
+
+def adicionar_tabela(grafo: Graph, nome: str, df: panda.DataFrame) -> int:
+    "Converte uma tabela GTFS pelo motor colunar e adiciona suas triplas ao grafo."
+
+    return adicionar_blocos(grafo, CONVERSORES[nome](df))
+
+#-------------------------------------------------------------------------------
+
+LEGADO = {
+    'agency': csvToRdf.add_agency_to_rdf,
+    'frequencies': csvToRdf.add_frequencies_to_rdf,
+    'routes': csvToRdf.add_routes_to_rdf,
+    'shapes': csvToRdf.add_shapes_to_rdf,
+    'stops': csvToRdf.add_stops_to_rdf,
+    'stop_times': csvToRdf.add_stop_times_to_rdf,
+    'trips': csvToRdf.add_trips_to_rdf,
+}
+
+def verificar_paridade(df_dict: dict) -> dict:
+    """
+    Compara, tabela a tabela, as triplas do motor colunar com as das funções
+    add_*_to_rdf. Retorna {tabela: (faltando, sobrando)} apenas para as tabelas
+    em que os dois conjuntos diferem.
+    """
+    diferencas = {}
+    grafo_original = csvToRdf.mainGraph
+    try:
+        for nome, df in df_dict.items():
+            if nome not in CONVERSORES:
+                continue
+            csvToRdf.mainGraph = Graph()
+            LEGADO[nome](df)
+            esperado = set(csvToRdf.mainGraph)
+
+            obtido = Graph()
+            adicionar_tabela(obtido, nome, df)
+            obtido = set(obtido)
+
+            if esperado != obtido:
+                diferencas[nome] = (esperado - obtido, obtido - esperado)
+
+        if 'stop_times' in df_dict and 'trips' in df_dict:
+            csvToRdf.mainGraph = Graph()
+            csvToRdf.add_patterns_to_rdf(df_dict['stop_times'], df_dict['trips'])
+            esperado = set(csvToRdf.mainGraph)
+
+            obtido = Graph()
+            adicionar_blocos(obtido, triplas_padroes(df_dict['stop_times'], df_dict['trips']))
+            obtido = set(obtido)
+
+            if esperado != obtido:
+                diferencas['padroes'] = (esperado - obtido, obtido - esperado)
+    finally:
+        csvToRdf.mainGraph = grafo_original
+    return diferencas
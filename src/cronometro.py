@@ -0,0 +1,38 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Cronometragem por etapa. As funções do projeto marcam trechos com
+# `etapa('consulta')`, `etapa('renderizacao')` etc.; os tempos só são
+# acumulados enquanto algum `registrando()` estiver ativo, então fora dos
+# benchmarks a marcação custa apenas uma verificação.
+
+_trava = threading.Lock()
+_registro = None
+
+@contextmanager
+def etapa(nome: str):
+    "Acumula o tempo do bloco na etapa `nome` do registro ativo, se houver."
+
+    if _registro is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        with _trava:
+            if _registro is not None:
+                _registro[nome] = _registro.get(nome, 0.0) + duracao
+
+@contextmanager
+def registrando():
+    "Ativa o registro das etapas e entrega o dicionário {etapa: segundos} preenchido durante o bloco."
+
+    global _registro
+    anterior, _registro = _registro, {}
+    try:
+        yield _registro
+    finally:
+        _registro = anterior
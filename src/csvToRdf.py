@@ -1,8 +1,12 @@
+import numpy as np
 import pandas as panda
 from rdflib import Graph, Literal
 from rdflib.namespace import RDF, FOAF, XSD, Namespace, DC
 
-BASE_DIR = '../assets/gtfs-rio-de-janeiro'
+import versao_dados
+from geometria import douglas_peucker
+
+BASE_DIR = versao_dados.BASE_DIR
 FILE_NAMES = [
     'agency',
     # 'calendar',
@@ -21,16 +25,133 @@ FILE_NAMES = [
 GTFS_URI = Namespace("http://vocab.gtfs.org/terms#/")
 TIME_URI = Namespace("http://www.w3.org/2006/time#/")
 GEO_URI = Namespace("http://www.w3.org/2003/01/geo/wgs84_pos#/")
+GEOSPARQL_URI = Namespace("http://www.opengis.net/ont/geosparql#")
 mainGraph = Graph()
 
+# Tolerância, em graus (~5 m), da simplificação Douglas-Peucker dos shapes.
+TOLERANCIA_SHAPES = 0.00005
+
+#-------------------------------------------------------------------------------
+
+# Esquema de leitura de cada tabela: só as colunas listadas são lidas, com
+# IDs como texto (ou categoria, quando se repetem muito), códigos como
+# inteiros pequenos anuláveis e horários mantidos como texto.
+ESQUEMAS = {
+    'agency': {
+        'agency_id': 'str', 'agency_name': 'str', 'agency_url': 'str',
+        'agency_timezone': 'category',
+    },
+    'frequencies': {
+        'trip_id': 'str', 'start_time': 'str', 'end_time': 'str',
+        'headway_secs': 'Int32', 'exact_times': 'Int8',
+    },
+    'routes': {
+        'route_id': 'str', 'agency_id': 'category', 'route_short_name': 'str',
+        'route_long_name': 'str', 'route_desc': 'str', 'route_type': 'Int16',
+        'route_url': 'str', 'route_color': 'category', 'route_textColor': 'category',
+    },
+    'shapes': {
+        'shape_id': 'category', 'shape_pt_lat': 'float64', 'shape_pt_lon': 'float64',
+        'shape_pt_sequence': 'UInt32', 'shape_dist_traveled': 'float64',
+    },
+    'stops': {
+        'stop_id': 'str', 'stop_code': 'str', 'stop_name': 'str',
+        'stop_desc': 'str', 'stop_lat': 'float64', 'stop_lon': 'float64',
+        'zone_id': 'category', 'stop_url': 'str', 'location_type': 'Int8',
+        'parent_station': 'str', 'wheelchair_boarding': 'Int8',
+    },
+    'stop_times': {
+        'trip_id': 'category', 'arrival_time': 'str', 'departure_time': 'str',
+        'stop_id': 'category', 'stop_sequence': 'UInt16', 'stop_headsign': 'category',
+        'pickup_type': 'Int8', 'shape_dist_traveled': 'float64',
+    },
+    'trips': {
+        'route_id': 'category', 'service_id': 'category', 'trip_id': 'str',
+        'trip_headsign': 'category', 'trip_short_name': 'str', 'direction_id': 'Int8',
+        'shape_id': 'category',
+    },
+}
+
+# Colunas de horário GTFS (HH:MM:SS, podendo passar de 24h).
+COLUNAS_HORARIO = ['arrival_time', 'departure_time', 'start_time', 'end_time']
+
 #-------------------------------------------------------------------------------
 
+def segundos_gtfs(serie: panda.Series) -> panda.Series:
+    "Converte uma coluna de horários GTFS (HH:MM:SS) em segundos desde o início do dia de serviço."
+
+    partes = serie.astype('string').str.split(':', expand=True)
+    if partes.shape[1] < 3:
+        return panda.Series(panda.NA, index=serie.index, dtype='Int32')
+    partes = partes.iloc[:, :3].apply(panda.to_numeric, errors='coerce')
+    return (partes[0] * 3600 + partes[1] * 60 + partes[2]).astype('Int32')
+
+def horario_gtfs(segundos: panda.Series) -> panda.Series:
+    "Inverso de segundos_gtfs: formata segundos desde o início do dia de serviço como HH:MM:SS."
+
+    segundos = segundos.astype('Int64')
+    texto = ((segundos // 3600).astype('string').str.zfill(2) + ":"
+        + (segundos % 3600 // 60).astype('string').str.zfill(2) + ":"
+        + (segundos % 60).astype('string').str.zfill(2))
+    return texto.astype(object).where(segundos.notna().to_numpy(), None)
+
+def opcoes_leitura(nome: str, caminho: str, colunas=None) -> dict:
+    """
+    Parâmetros de read_csv (usecols e dtype) de uma tabela, restritos às
+    colunas presentes no arquivo (e, se informadas, às `colunas` pedidas).
+    """
+    presentes = panda.read_csv(caminho, nrows=0).columns
+    esquema = ESQUEMAS.get(nome)
+    if esquema is None:
+        return {} if colunas is None else {'usecols': [c for c in presentes if c in colunas]}
+    usadas = [c for c in presentes if c in esquema and (colunas is None or c in colunas)]
+    return {'usecols': usadas, 'dtype': {c: esquema[c] for c in usadas}}
+
+def _com_horarios(df: panda.DataFrame) -> panda.DataFrame:
+    for coluna in COLUNAS_HORARIO:
+        if coluna in df.columns:
+            df[f'{coluna}_s'] = segundos_gtfs(df[coluna])
+    return df
+
+def ler_tabela(nome: str, chunksize: int = None, engine: str = 'c', parse_horarios: bool = False, colunas=None):
+    """
+    Lê uma tabela GTFS com o esquema tipado de ESQUEMAS (só as `colunas`
+    informadas, se houver). Sem `chunksize`,
+    retorna o DataFrame inteiro; com ele, retorna um iterador de DataFrames
+    para que a tabela seja convertida em fluxo e liberada bloco a bloco.
+    `engine='pyarrow'` usa o leitor multithread do Arrow quando instalado (ele
+    não lê em blocos, então a tabela é lida inteira e fatiada depois). Com
+    `parse_horarios`, cada coluna de horário ganha uma coluna `<nome>_s` em segundos.
+    """
+    caminho = f'{BASE_DIR}/{nome}.csv'
+    opcoes = opcoes_leitura(nome, caminho, colunas)
+
+    if engine == 'pyarrow':
+        import importlib.util
+        if importlib.util.find_spec('pyarrow') is None:
+            engine = 'c'
+
+    if engine == 'pyarrow':
+        df = panda.read_csv(caminho, engine='pyarrow', **opcoes)
+        if parse_horarios:
+            df = _com_horarios(df)
+        if chunksize is None:
+            return df
+        return (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+
+    if chunksize is None:
+        df = panda.read_csv(caminho, **opcoes)
+        return _com_horarios(df) if parse_horarios else df
+
+    leitor = panda.read_csv(caminho, chunksize=chunksize, **opcoes)
+    return (_com_horarios(df) for df in leitor) if parse_horarios else iter(leitor)
+
 def read_csv_file(printSteps: bool = False ):
     "Lê os arquivos csv GTFS do Rio de Janeiro e retorna um objeto de DataFrames do pandas."
 
     if(printSteps): print("Lendo arquivos CSV do GTFS do Rio de Janeiro...")
     return {
-        file_name: panda.read_csv(f'{BASE_DIR}/{file_name}.csv') for file_name in FILE_NAMES
+        file_name: ler_tabela(file_name) for file_name in FILE_NAMES
     }
 
 #-------------------------------------------------------------------------------
@@ -70,13 +191,13 @@ def add_frequencies_to_rdf(df: panda.DataFrame):
             mainGraph.add((freq_uri, RDF.type, GTFS_URI.Frequency))
             mainGraph.add((freq_uri, GTFS_URI.startTime, Literal(row['start_time'], datatype=XSD.string)))
             mainGraph.add((freq_uri, GTFS_URI.endTime, Literal(row['end_time'], datatype=XSD.string)))
-            mainGraph.add((freq_uri, GTFS_URI.headwaySeconds, Literal(str(row['headway_secs']), datatype=XSD.string)))
+            mainGraph.add((freq_uri, GTFS_URI.headwaySeconds, Literal(str(int(row['headway_secs'])), datatype=XSD.nonNegativeInteger)))
 
             if 'exact_times' in row and not panda.isna(row['exact_times']):
                 valor_bool = str(row['exact_times']) == "1"
-                mainGraph.add((freq_uri, GTFS_URI.headwaySeconds, Literal(valor_bool, datatype=XSD.boolean)))
+                mainGraph.add((freq_uri, GTFS_URI.exactTimes, Literal(valor_bool, datatype=XSD.boolean)))
             else:
-                mainGraph.add((freq_uri, GTFS_URI.headwaySeconds, Literal(False, datatype=XSD.boolean)))
+                mainGraph.add((freq_uri, GTFS_URI.exactTimes, Literal(False, datatype=XSD.boolean)))
         else:
             print("Frequency doesn't contain all required fields")
 
@@ -161,10 +282,19 @@ def add_stops_to_rdf(df: panda.DataFrame):
             mainGraph.add((stop_uri, DC.description, Literal(str(row['stop_desc']))))
 
         if 'stop_lat' in row and not panda.isna(row['stop_lat']):
-            mainGraph.add((stop_uri, GEO_URI.lat, Literal(str(row['stop_lat']))))
+            mainGraph.add((stop_uri, GEO_URI.lat, Literal(str(row['stop_lat']), datatype=XSD.double)))
 
         if 'stop_lon' in row and not panda.isna(row['stop_lon']):
-            mainGraph.add((stop_uri, GEO_URI.long, Literal(str(row['stop_lon']))))
+            mainGraph.add((stop_uri, GEO_URI.long, Literal(str(row['stop_lon']), datatype=XSD.double)))
+
+        if (
+            'stop_lat' in row and not panda.isna(row['stop_lat']) and
+            'stop_lon' in row and not panda.isna(row['stop_lon'])
+        ):
+            geometry_uri = GTFS_URI[f"stops/{stop_id}/geometry"]
+            mainGraph.add((stop_uri, GEOSPARQL_URI.hasGeometry, geometry_uri))
+            mainGraph.add((geometry_uri, RDF.type, GEOSPARQL_URI.Geometry))
+            mainGraph.add((geometry_uri, GEOSPARQL_URI.asWKT, Literal(f"POINT({row['stop_lon']} {row['stop_lat']})", datatype=GEOSPARQL_URI.wktLiteral)))
 
         if 'stop_url' in row and not panda.isna(row['stop_url']):
             mainGraph.add((stop_uri, FOAF.page, Literal(str(row['stop_url']))))
@@ -254,22 +384,263 @@ def add_trips_to_rdf(df: panda.DataFrame):
             mainGraph.add((trip_uri, GTFS_URI.shape, shape_uri))
 
 
+def wkt_shapes(df: panda.DataFrame, tolerancia: float = TOLERANCIA_SHAPES) -> panda.Series:
+    """
+    Converte os pontos de shapes.csv numa LINESTRING WKT por shape_id (pontos
+    ordenados por shape_pt_sequence, lon lat com 6 casas), opcionalmente
+    simplificada por Douglas-Peucker. Retorna uma Series indexada por shape_id.
+    """
+    df = df.dropna(subset=['shape_id', 'shape_pt_lat', 'shape_pt_lon'])
+    df = df.assign(shape_id=df['shape_id'].astype(str)).sort_values(['shape_id', 'shape_pt_sequence'], kind='stable')
+
+    if tolerancia:
+        lats, lons = df['shape_pt_lat'].to_numpy(), df['shape_pt_lon'].to_numpy()
+        cortes = np.flatnonzero(df['shape_id'].to_numpy()[1:] != df['shape_id'].to_numpy()[:-1]) + 1
+        manter = np.concatenate([
+            douglas_peucker(lats[a:b], lons[a:b], tolerancia)
+            for a, b in zip(np.concatenate([[0], cortes]), np.concatenate([cortes, [len(df)]]))
+        ]) if len(df) else np.zeros(0, dtype=bool)
+        df = df[manter]
+
+    pontos = df['shape_pt_lon'].round(6).astype(str) + " " + df['shape_pt_lat'].round(6).astype(str)
+    linhas = pontos.groupby(df['shape_id'].to_numpy(), sort=False).agg(", ".join)
+    return "LINESTRING(" + linhas + ")"
+
+def add_shapes_to_rdf(df: panda.DataFrame):
+    "Adiciona os shapes ao grafo RDF como uma geometria WKT (GeoSPARQL) por shape."
+
+    for shape_id, wkt in wkt_shapes(df).items():
+        shape_uri = GTFS_URI[f"shapes/{shape_id}"]
+        geometry_uri = GTFS_URI[f"shapes/{shape_id}/geometry"]
+
+        mainGraph.add((shape_uri, RDF.type, GTFS_URI.Shape))
+        mainGraph.add((shape_uri, GEOSPARQL_URI.hasGeometry, geometry_uri))
+        mainGraph.add((geometry_uri, RDF.type, GEOSPARQL_URI.Geometry))
+        mainGraph.add((geometry_uri, GEOSPARQL_URI.asWKT, Literal(wkt, datatype=GEOSPARQL_URI.wktLiteral)))
+
+#-------------------------------------------------------------------------------
+
+# Triplas derivadas: atalhos pré-computados a partir de stop_times e trips,
+# para que as consultas não precisem percorrer trip→stop_time→stop. Viagens de
+# uma mesma linha com a mesma sequência de paradas compartilham um padrão.
+
+COLUNAS_PADROES = {
+    'stop_times': ['trip_id', 'stop_id', 'stop_sequence'],
+    'trips': ['trip_id', 'route_id'],
+}
+
+def padroes_de_parada(stop_times: panda.DataFrame, trips: panda.DataFrame):
+    """
+    Agrupa as viagens em padrões de parada (linha + sequência de paradas).
+    Retorna (paradas, viagens): `paradas` tem uma linha por parada de cada
+    padrão (pattern_id, route_id, posicao, stop_id) e `viagens` associa cada
+    trip_id ao seu pattern_id. O pattern_id é um hash estável do padrão, então
+    não muda entre execuções.
+    """
+    st = stop_times.dropna(subset=['trip_id', 'stop_id'])
+    st = st.assign(trip_id=st['trip_id'].astype(str), stop_id=st['stop_id'].astype(str))
+    st = st.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+    sequencias = st.groupby('trip_id', sort=False)['stop_id'].agg('\x1f'.join)
+
+    rotas = trips.dropna(subset=['trip_id', 'route_id']).drop_duplicates('trip_id')
+    rotas = panda.Series(rotas['route_id'].astype(str).to_numpy(), index=rotas['trip_id'].astype(str).to_numpy())
+
+    viagens = panda.DataFrame({
+        'trip_id': sequencias.index.to_numpy(),
+        'route_id': rotas.reindex(sequencias.index).to_numpy(),
+        'sequencia': sequencias.to_numpy(),
+    }).dropna(subset=['route_id'])
+
+    codigos, unicos = panda.factorize(viagens['route_id'] + '\n' + viagens['sequencia'])
+    hashes = panda.util.hash_pandas_object(panda.Series(unicos), index=False)
+    sufixos = np.array([format(h, '016x') for h in hashes.to_numpy()], dtype=object)
+    viagens['pattern_id'] = viagens['route_id'].to_numpy() + '-' + sufixos[codigos]
+
+    padroes = viagens.drop_duplicates('pattern_id')
+    paradas = padroes.assign(stop_id=padroes['sequencia'].str.split('\x1f'))[['pattern_id', 'route_id', 'stop_id']].explode('stop_id')
+    paradas['posicao'] = paradas.groupby('pattern_id', sort=False).cumcount() + 1
+    return paradas.reset_index(drop=True), viagens[['trip_id', 'pattern_id']].reset_index(drop=True)
+
+def add_patterns_to_rdf(stop_times: panda.DataFrame, trips: panda.DataFrame):
+    "Adiciona ao grafo as triplas derivadas: route servesStop stop e os padrões de parada das viagens."
+
+    paradas, viagens = padroes_de_parada(stop_times, trips)
+
+    for _, row in paradas.drop_duplicates(['route_id', 'stop_id']).iterrows():
+        mainGraph.add((GTFS_URI[f"routes/{row['route_id']}"], GTFS_URI.servesStop, GTFS_URI[f"stops/{row['stop_id']}"]))
+
+    for _, row in paradas.iterrows():
+        pattern_uri = GTFS_URI[f"patterns/{row['pattern_id']}"]
+        pattern_stop_uri = GTFS_URI[f"patterns/{row['pattern_id']}/stops/{row['posicao']}"]
+
+        mainGraph.add((pattern_uri, RDF.type, GTFS_URI.StopPattern))
+        mainGraph.add((pattern_uri, GTFS_URI.route, GTFS_URI[f"routes/{row['route_id']}"]))
+        mainGraph.add((pattern_stop_uri, RDF.type, GTFS_URI.PatternStop))
+        mainGraph.add((pattern_stop_uri, GTFS_URI.pattern, pattern_uri))
+        mainGraph.add((pattern_stop_uri, GTFS_URI.stop, GTFS_URI[f"stops/{row['stop_id']}"]))
+        mainGraph.add((pattern_stop_uri, GTFS_URI.stopSequence, Literal(int(row['posicao']), datatype=XSD.nonNegativeInteger)))
+
+    for _, row in viagens.iterrows():
+        mainGraph.add((GTFS_URI[f"trips/{row['trip_id']}"], GTFS_URI.pattern, GTFS_URI[f"patterns/{row['pattern_id']}"]))
+
 #-------------------------------------------------------------------------------
 
-def generate_rdf_graph(printSteps: bool = False):
-    "Gera o grafo RDF a partir dos arquivos CSV do GTFS do Rio de Janeiro."
+# Tabelas convertidas em RDF, na ordem de conversão.
+TABELAS_CONVERTIDAS = ['agency', 'frequencies', 'routes', 'shapes', 'stops', 'stop_times', 'trips']
+
+# Tabelas que não podem ser convertidas em blocos de linhas arbitrários, pois
+# todas as linhas de uma mesma chave precisam estar juntas.
+TABELAS_AGRUPADAS = {'shapes': 'shape_id'}
+
+def _fatias(df: panda.DataFrame, tamanho: int):
+    "Divide um DataFrame em fatias de até `tamanho` linhas (para acompanhar o progresso)."
+
+    if not tamanho or len(df) <= tamanho:
+        return [df]
+    return [df.iloc[i:i + tamanho] for i in range(0, len(df), tamanho)]
+
+def generate_rdf_graph(
+    printSteps: bool = False,
+    vetorizado: bool = True,
+    compacto: bool = False,
+    metricas: str = None,
+    perfil: str = None,
+    fatia: int = 50_000,
+):
+    """
+    Gera o grafo RDF a partir dos arquivos CSV do GTFS do Rio de Janeiro.
+    Com `vetorizado`, as tabelas passam pelo motor colunar (colunar.py), que
+    emite as mesmas triplas das funções add_*_to_rdf sem usar iterrows. Com
+    `compacto`, stop_times é modelado por padrões de jornada (jornadas.py).
+    Além das tabelas, são gravadas as triplas derivadas dos padrões de parada
+    e do nível de serviço (partidas por hora; ver frequencias.py).
+
+    Cada tabela é convertida em fatias de `fatia` linhas e medida (tempo,
+    linhas, triplas, RSS; ver metricas.py); com `printSteps`, o progresso das
+    tabelas longas é impresso durante a conversão. `metricas` grava as
+    métricas num arquivo JSON e `perfil`, um dump do cProfile da execução.
+    Retorna o resumo das métricas.
+    """
+    import colunar
+    from metricas import MetricasConversao, perfilando
+
+    adicionar_legado = {
+        'agency': add_agency_to_rdf,
+        'frequencies': add_frequencies_to_rdf,
+        'routes': add_routes_to_rdf,
+        'shapes': add_shapes_to_rdf,
+        'stops': add_stops_to_rdf,
+        'stop_times': add_stop_times_to_rdf,
+        'trips': add_trips_to_rdf,
+    }
+    coletor = MetricasConversao(printSteps)
+
+    with perfilando(perfil):
+        if(printSteps): print("Gerando grafo RDF...")
+
+        with coletor.tabela('leitura') as acompanhamento:
+            df_dict = read_csv_file(printSteps)
+            acompanhamento.avancar(linhas=sum(len(df) for df in df_dict.values()))
+
+        for nome in TABELAS_CONVERTIDAS:
+            df = df_dict[nome]
+            with coletor.tabela(nome, len(df)) as acompanhamento:
+                if compacto and nome == 'stop_times':
+                    import jornadas
+                    triplas = colunar.adicionar_blocos(mainGraph, jornadas.triplas_stop_times_compactas(df, df_dict['trips']))
+                    acompanhamento.avancar(len(df), triplas)
+                    continue
+                for parte in ([df] if nome in TABELAS_AGRUPADAS else _fatias(df, fatia)):
+                    if vetorizado:
+                        triplas = colunar.adicionar_tabela(mainGraph, nome, parte)
+                    else:
+                        antes = len(mainGraph)
+                        adicionar_legado[nome](parte)
+                        triplas = len(mainGraph) - antes
+                    acompanhamento.avancar(len(parte), triplas)
+
+        with coletor.tabela('padroes', len(df_dict['stop_times'])) as acompanhamento:
+            if vetorizado:
+                triplas = colunar.adicionar_blocos(mainGraph, colunar.triplas_padroes(df_dict['stop_times'], df_dict['trips']))
+            else:
+                antes = len(mainGraph)
+                add_patterns_to_rdf(df_dict['stop_times'], df_dict['trips'])
+                triplas = len(mainGraph) - antes
+            acompanhamento.avancar(len(df_dict['stop_times']), triplas)
 
-    if(printSteps): print("Gerando grafo RDF...")
+        with coletor.tabela('partidas', len(df_dict['stop_times'])) as acompanhamento:
+            import frequencias
+            triplas = colunar.adicionar_blocos(mainGraph, frequencias.triplas_partidas(
+                df_dict['stop_times'], df_dict['trips'], df_dict['frequencies']))
+            acompanhamento.avancar(len(df_dict['stop_times']), triplas)
 
-    df_dict = read_csv_file(printSteps)
+        if(printSteps): print("Grafo RDF gerado com sucesso!")
 
-    add_agency_to_rdf(df_dict['agency'])
-    add_frequencies_to_rdf(df_dict['frequencies'])
-    add_routes_to_rdf(df_dict['routes'])
-    add_stops_to_rdf(df_dict['stops'])
-    add_stop_times_to_rdf(df_dict['stop_times'])
-    add_trips_to_rdf(df_dict['trips'])
+        with coletor.tabela('serializacao') as acompanhamento:
+            mainGraph.serialize(destination='./gtfs.ttl', format='ttl')
+            acompanhamento.avancar(triplas=len(mainGraph))
 
-    if(printSteps): print("Grafo RDF gerado com sucesso!")
+    if metricas:
+        coletor.salvar(metricas)
+    return coletor.resumo()
+
+#-------------------------------------------------------------------------------
 
-    mainGraph.serialize(destination='./gtfs.ttl', format='ttl')
\ No newline at end of file
+def generate_rdf_stream(
+    destino: str = './gtfs.nt.gz',
+    chunksize: int = 200_000,
+    printSteps: bool = False,
+    compacto: bool = False,
+    metricas: str = None,
+    perfil: str = None,
+):
+    """
+    Gera o RDF do GTFS em streaming, gravando N-Triples (comprimido se o destino
+    terminar em .gz) tabela a tabela e em blocos de `chunksize` linhas. A
+    memória fica limitada pelo tamanho do bloco, e não pelo tamanho do feed.
+    Com `compacto`, stop_times é lido inteiro e modelado por padrões de jornada.
+    `metricas` e `perfil` funcionam como em generate_rdf_graph.
+    Retorna o número de triplas gravadas.
+    """
+    import colunar
+    from metricas import MetricasConversao, perfilando
+    from ntriples import EscritorNTriples
+
+    coletor = MetricasConversao(printSteps)
+
+    with perfilando(perfil):
+        if(printSteps): print(f"Gerando RDF em streaming para {destino}...")
+
+        with EscritorNTriples(destino) as escritor:
+            for nome in TABELAS_CONVERTIDAS:
+                with coletor.tabela(nome) as acompanhamento:
+                    if compacto and nome == 'stop_times':
+                        import jornadas
+                        df = ler_tabela('stop_times')
+                        triplas = escritor.escrever_blocos(jornadas.triplas_stop_times_compactas(
+                            df, ler_tabela('trips', colunas=COLUNAS_PADROES['trips'])))
+                        acompanhamento.avancar(len(df), triplas)
+                        continue
+                    partes = [ler_tabela(nome)] if nome in TABELAS_AGRUPADAS else ler_tabela(nome, chunksize=chunksize)
+                    for df in partes:
+                        acompanhamento.avancar(len(df), escritor.escrever_blocos(colunar.CONVERSORES[nome](df)))
+
+            # Os padrões precisam das viagens inteiras, mas só de três colunas de stop_times.
+            with coletor.tabela('padroes') as acompanhamento:
+                stop_times = ler_tabela('stop_times', colunas=COLUNAS_PADROES['stop_times'])
+                triplas = escritor.escrever_blocos(colunar.triplas_padroes(
+                    stop_times, ler_tabela('trips', colunas=COLUNAS_PADROES['trips'])))
+                acompanhamento.avancar(len(stop_times), triplas)
+
+            # Nível de serviço (partidas por hora de cada parada e linha).
+            with coletor.tabela('partidas') as acompanhamento:
+                import frequencias
+                stop_times, trips, frequencies = frequencias.ler_tabelas()
+                triplas = escritor.escrever_blocos(frequencias.triplas_partidas(stop_times, trips, frequencies))
+                acompanhamento.avancar(len(stop_times), triplas)
+
+        if(printSteps): print("RDF gerado com sucesso!")
+
+    if metricas:
+        coletor.salvar(metricas)
+    return escritor.triplas
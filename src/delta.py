@@ -0,0 +1,252 @@
+import itertools
+import json
+import os
+
+import pandas as panda
+
+import colunar
+import csvToRdf
+from ntriples import linhas_bloco
+
+# Regeração incremental: cada tabela GTFS recebe uma impressão digital por
+# chave (agência, rota, parada, viagem...) que é comparada com o manifesto da
+# execução anterior. Só as chaves alteradas são convertidas, e o resultado é a
+# diferença de triplas entre o feed antigo e o novo.
+
+# Coluna que agrupa as linhas de cada tabela. stop_times e frequencies são
+# comparadas no nível da viagem.
+CHAVES = {
+    'agency': 'agency_id',
+    'frequencies': 'trip_id',
+    'routes': 'route_id',
+    'shapes': 'shape_id',
+    'stops': 'stop_id',
+    'stop_times': 'trip_id',
+    'trips': 'trip_id',
+}
+
+# Tabelas que geram triplas compartilhadas entre chaves e entre tabelas (ex.:
+# o rdf:type de um shape, gerado por shapes e por trips). Uma tripla delas só
+# é removida se nenhuma linha dessas tabelas no feed novo ainda a produzir.
+TRIPLAS_COMPARTILHADAS = ('shapes', 'stops', 'trips')
+
+# Linhas de tabela convertidas por vez quando as triplas são geradas em
+# streaming (primeira execução, chaves novas e a verificação das compartilhadas).
+PEDACO = 200_000
+
+DIR_ESTADO = './delta'
+
+#-------------------------------------------------------------------------------
+
+def impressoes(df: panda.DataFrame, chave: str) -> panda.Series:
+    """
+    Calcula a impressão digital de cada chave de uma tabela: a soma (módulo
+    2^64) dos hashes das suas linhas. Não depende da ordem das linhas no CSV.
+    """
+    hashes = panda.util.hash_pandas_object(df, index=False)
+    return hashes.groupby(df[chave].astype(str).to_numpy()).sum()
+
+def _pedacos_linhas(nome: str, df: panda.DataFrame):
+    """
+    Linhas N-Triples geradas por uma tabela, uma lista por bloco, convertendo
+    até PEDACO linhas da tabela por vez (as tabelas agrupadas vão inteiras).
+    """
+    fatias = [df] if nome in csvToRdf.TABELAS_AGRUPADAS else (df.iloc[i:i + PEDACO] for i in range(0, len(df), PEDACO))
+    for fatia in fatias:
+        for bloco in colunar.CONVERSORES[nome](fatia):
+            if len(bloco):
+                yield linhas_bloco(bloco).unique().tolist()
+
+def _linhas(nome: str, df: panda.DataFrame) -> set:
+    "Conjunto das linhas N-Triples geradas por um pedaço de uma tabela."
+
+    return set(itertools.chain.from_iterable(_pedacos_linhas(nome, df)))
+
+def _blocos_derivados(stop_times: panda.DataFrame, trips: panda.DataFrame, frequencies: panda.DataFrame):
+    "Linhas N-Triples derivadas, uma lista por bloco: padrões de parada e nível de serviço."
+
+    import frequencias
+
+    blocos = itertools.chain(
+        colunar.triplas_padroes(stop_times, trips),
+        frequencias.triplas_partidas(stop_times, trips, frequencies),
+    )
+    for bloco in blocos:
+        if len(bloco):
+            yield linhas_bloco(bloco).unique().tolist()
+
+def _ainda_geradas(linhas: set, tabelas: dict) -> set:
+    "Linhas de `linhas` que as tabelas com triplas compartilhadas do feed novo ainda geram."
+
+    geradas = set()
+    if not linhas:
+        return geradas
+    for nome in TRIPLAS_COMPARTILHADAS:
+        for pedaco in _pedacos_linhas(nome, tabelas[nome]):
+            geradas.update(linha for linha in pedaco if linha in linhas)
+    return geradas
+
+def _filtrar(df: panda.DataFrame, chave: str, chaves) -> panda.DataFrame:
+    "Linhas da tabela cujas chaves estão no conjunto informado."
+
+    return df[df[chave].astype(str).isin(chaves)]
+
+#-------------------------------------------------------------------------------
+
+def _carregar_manifesto(dir_estado: str) -> dict:
+    caminho = f'{dir_estado}/manifest.json'
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+def _carregar_tabela_anterior(dir_estado: str, nome: str, colunas) -> panda.DataFrame:
+    caminho = f'{dir_estado}/{nome}.pkl'
+    if not os.path.exists(caminho):
+        return panda.DataFrame(columns=colunas)
+    return panda.read_pickle(caminho)
+
+def _salvar_estado(dir_estado: str, manifesto: dict, tabelas: dict):
+    os.makedirs(dir_estado, exist_ok=True)
+    for nome, df in tabelas.items():
+        df.to_pickle(f'{dir_estado}/{nome}.pkl')
+    with open(f'{dir_estado}/manifest.json', 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f)
+
+#-------------------------------------------------------------------------------
+
+def _comparar(dir_estado: str, printSteps: bool = False):
+    """
+    Compara o feed atual com o estado salvo. Retorna (remover, inserir,
+    manifesto, tabelas): `remover` é um conjunto de linhas N-Triples e
+    `inserir` um iterável de listas de linhas. As chaves sem linhas no estado
+    anterior (todas, na primeira execução) não são comparadas: as suas triplas
+    são geradas sob demanda, em pedaços, quando `inserir` é percorrido.
+    """
+    manifesto_antigo = _carregar_manifesto(dir_estado)
+    manifesto_novo, tabelas = {}, {}
+    remover, inserir = set(), []
+    compartilhadas = set()
+    mudaram = set()
+
+    for nome, chave in CHAVES.items():
+        df = csvToRdf.ler_tabela(nome)
+        tabelas[nome] = df
+
+        novas = {k: str(v) for k, v in impressoes(df, chave).items()}
+        antigas = manifesto_antigo.get(nome, {})
+        manifesto_novo[nome] = novas
+
+        alteradas = {k for k in novas.keys() | antigas.keys() if novas.get(k) != antigas.get(k)}
+        if(printSteps): print(f"{nome}: {len(alteradas)} de {len(novas)} chaves alteradas")
+        if not alteradas:
+            continue
+        mudaram.add(nome)
+
+        df_antigo = _filtrar(_carregar_tabela_anterior(dir_estado, nome, df.columns), chave, alteradas)
+        if df_antigo.empty:
+            inserir.append(_pedacos_linhas(nome, _filtrar(df, chave, alteradas)))
+            continue
+        linhas_antigas = _linhas(nome, df_antigo)
+        linhas_novas = _linhas(nome, _filtrar(df, chave, alteradas))
+
+        removidas = linhas_antigas - linhas_novas
+        if nome in TRIPLAS_COMPARTILHADAS:
+            compartilhadas |= removidas
+        else:
+            remover |= removidas
+        inserir.append([sorted(linhas_novas - linhas_antigas)])
+
+    remover |= compartilhadas - _ainda_geradas(compartilhadas, tabelas)
+
+    # Os padrões, os atalhos servesStop e as partidas por hora dependem de
+    # stop_times, trips e frequencies juntos e são compartilhados entre
+    # viagens, então são recalculados por inteiro.
+    if mudaram & {'stop_times', 'trips', 'frequencies'}:
+        anteriores = [
+            _carregar_tabela_anterior(dir_estado, nome, tabelas[nome].columns)
+            for nome in ('stop_times', 'trips', 'frequencies')
+        ]
+        atuais = (tabelas['stop_times'], tabelas['trips'], tabelas['frequencies'])
+        if anteriores[0].empty:
+            inserir.append(_blocos_derivados(*atuais))
+        else:
+            antigas = set(itertools.chain.from_iterable(_blocos_derivados(*anteriores)))
+            novas = set(itertools.chain.from_iterable(_blocos_derivados(*atuais)))
+            remover |= antigas - novas
+            inserir.append([sorted(novas - antigas)])
+
+    return remover, (linha for pedacos in inserir for pedaco in pedacos for linha in pedaco), manifesto_novo, tabelas
+
+def calcular_delta(dir_estado: str = DIR_ESTADO, salvar: bool = True, printSteps: bool = False):
+    """
+    Compara o feed atual em BASE_DIR com o da execução anterior e retorna
+    (remover, inserir), dois conjuntos de linhas N-Triples. Com `salvar`, o
+    manifesto e as tabelas atuais passam a ser a referência da próxima execução.
+    Na primeira execução (sem manifesto) todas as triplas são inseridas; para
+    gravá-las sem montar os conjuntos na memória, use aplicar_delta.
+    """
+    remover, inserir, manifesto, tabelas = _comparar(dir_estado, printSteps)
+    inserir = set(inserir)
+    if(printSteps): print(f"Delta: {len(remover)} triplas a remover, {len(inserir)} a inserir")
+    if salvar:
+        _salvar_estado(dir_estado, manifesto, tabelas)
+    return remover, inserir
+
+#-------------------------------------------------------------------------------
+
+def escrever_ntriples(remover: set, inserir: set, prefixo: str = './gtfs-delta'):
+    "Grava o delta como um par de arquivos N-Triples: <prefixo>-removidas.nt e <prefixo>-inseridas.nt."
+
+    for sufixo, linhas in [('removidas', remover), ('inseridas', inserir)]:
+        with open(f'{prefixo}-{sufixo}.nt', 'w', encoding='utf-8') as f:
+            f.writelines(sorted(linhas))
+
+def _lotes(linhas, tamanho: int):
+    "Agrupa um iterável de linhas em listas de até `tamanho` linhas."
+
+    linhas = iter(linhas)
+    while True:
+        lote = list(itertools.islice(linhas, tamanho))
+        if not lote:
+            return
+        yield lote
+
+def escrever_sparql_update(remover, inserir, destino: str = './gtfs-delta.ru', lote: int = 50_000) -> int:
+    """
+    Grava o delta como uma requisição SPARQL UPDATE com operações DELETE DATA e
+    INSERT DATA de até `lote` triplas cada. Linhas N-Triples são sintaxe válida
+    dentro desses blocos, então são copiadas sem conversão. `remover` e
+    `inserir` podem ser conjuntos (gravados em ordem) ou iteráveis de linhas,
+    gravados à medida que são percorridos. Retorna o número de triplas gravadas.
+    """
+    triplas = 0
+    with open(destino, 'w', encoding='utf-8') as f:
+        for operacao, linhas in [('DELETE DATA', remover), ('INSERT DATA', inserir)]:
+            if isinstance(linhas, (set, frozenset)):
+                linhas = sorted(linhas)
+            for pedaco in _lotes(linhas, lote):
+                if triplas:
+                    f.write(" ;\n")
+                f.write(f"{operacao} {{\n{''.join(pedaco)}}}")
+                triplas += len(pedaco)
+        f.write("\n")
+    return triplas
+
+def aplicar_delta(dir_estado: str = DIR_ESTADO, destino: str = './gtfs-delta.ru', printSteps: bool = False):
+    """
+    Calcula o delta do feed atual, grava a atualização SPARQL e a aplica no
+    repositório do GraphDB. As triplas a inserir são gravadas em streaming.
+    """
+    from ntriples import carregar_no_graphdb
+
+    remover, inserir, manifesto, tabelas = _comparar(dir_estado, printSteps)
+    triplas = escrever_sparql_update(remover, inserir, destino)
+    if(printSteps): print(f"Delta: {triplas} triplas ({len(remover)} a remover)")
+    if triplas:
+        carregar_no_graphdb(destino, content_type='application/sparql-update')
+    elif(printSteps):
+        print("Nenhuma alteração no feed.")
+
+    # O estado só avança depois que o repositório aceitou a atualização.
+    _salvar_estado(dir_estado, manifesto, tabelas)
@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+import pandas as panda
+
+import csvToRdf
+from indice_espacial import IndiceParadas, haversine
+
+# Gerador de feeds GTFS sintéticos para benchmarks. As paradas são sorteadas
+# na área do Rio de Janeiro; cada linha percorre paradas vizinhas (para que
+# haja baldeações realistas entre linhas que se cruzam), nos dois sentidos, e
+# as viagens se distribuem ao longo do dia.
+
+AREA = {'lat': (-23.08, -22.75), 'lon': (-43.79, -43.10)}
+VELOCIDADE_ONIBUS = 20 / 3.6        # m/s
+TEMPO_PARADO = 20                   # segundos em cada parada
+PARADAS_POR_LINHA = (15, 40)
+PONTOS_SHAPE_POR_TRECHO = 4
+
+def _percurso(indice: IndiceParadas, rng, tamanho: int) -> list:
+    "Sequência de paradas vizinhas, sem repetição, a partir de uma parada sorteada."
+
+    atual = int(rng.integers(len(indice)))
+    percurso, visitadas = [atual], {atual}
+    direcao = rng.normal(size=2)
+    vizinhos = min(12, len(indice))
+    while len(percurso) < tamanho:
+        indices, _ = indice.k_mais_proximas(indice.lats[atual], indice.lons[atual], vizinhos)
+        candidatos = [int(i) for i in np.ravel(indices) if int(i) not in visitadas]
+        if not candidatos:
+            break
+        # Prefere seguir na mesma direção, para a linha não andar em círculos.
+        passos = np.array([[indice.lats[c] - indice.lats[atual], indice.lons[c] - indice.lons[atual]] for c in candidatos])
+        atual = candidatos[int(np.argmax(passos @ direcao + rng.normal(0, 1e-3, len(candidatos))))]
+        percurso.append(atual)
+        visitadas.add(atual)
+    return percurso
+
+def gerar_feed(destino: str, paradas: int = 2000, linhas: int = 50, viagens: int = 2000, semente: int = 0) -> dict:
+    """
+    Gera um feed GTFS sintético em `destino` (agency, routes, stops, trips,
+    stop_times, frequencies e shapes) com a escala pedida e retorna o número
+    de linhas de cada tabela. A mesma `semente` gera sempre o mesmo feed.
+    """
+    rng = np.random.default_rng(semente)
+    os.makedirs(destino, exist_ok=True)
+
+    stops = panda.DataFrame({
+        'stop_id': [f'S{i}' for i in range(paradas)],
+        'stop_name': [f'Parada {i}' for i in range(paradas)],
+        'stop_lat': rng.uniform(*AREA['lat'], paradas).round(6),
+        'stop_lon': rng.uniform(*AREA['lon'], paradas).round(6),
+        'location_type': 0,
+        'wheelchair_boarding': rng.integers(0, 3, paradas),
+    })
+    indice = IndiceParadas(stops['stop_id'], stops['stop_lat'], stops['stop_lon'])
+
+    routes = panda.DataFrame({
+        'route_id': [f'R{i}' for i in range(linhas)],
+        'agency_id': 'A1',
+        'route_short_name': [str(100 + i) for i in range(linhas)],
+        'route_long_name': [f'Linha sintética {i}' for i in range(linhas)],
+        'route_type': 3,
+        'route_color': 'FF0000',
+    })
+
+    # Dois padrões (ida e volta) por linha, com os tempos acumulados entre paradas.
+    padroes = []
+    for _ in range(linhas):
+        ida = _percurso(indice, rng, int(rng.integers(*PARADAS_POR_LINHA)))
+        padroes += [ida, ida[::-1]]
+    offsets = []
+    for padrao in padroes:
+        distancias = haversine(stops['stop_lat'].to_numpy()[padrao[:-1]], stops['stop_lon'].to_numpy()[padrao[:-1]],
+                               stops['stop_lat'].to_numpy()[padrao[1:]], stops['stop_lon'].to_numpy()[padrao[1:]])
+        offsets.append(np.concatenate([[0], np.cumsum(np.round(distancias / VELOCIDADE_ONIBUS) + TEMPO_PARADO)]).astype(np.int64))
+
+    escolhidos = rng.integers(len(padroes), size=viagens)
+    inicios = np.sort(rng.integers(5 * 3600, 22 * 3600, viagens))
+    trips = panda.DataFrame({
+        'route_id': [f'R{p // 2}' for p in escolhidos],
+        'service_id': 'U',
+        'trip_id': [f'T{i}' for i in range(viagens)],
+        'trip_headsign': [f'Sentido {p % 2}' for p in escolhidos],
+        'direction_id': escolhidos % 2,
+        'shape_id': [f'SH{p}' for p in escolhidos],
+    })
+
+    tamanhos = np.array([len(padroes[p]) for p in escolhidos])
+    viagem = np.repeat(np.arange(viagens), tamanhos)
+    posicao = np.arange(tamanhos.sum()) - np.repeat(np.cumsum(tamanhos) - tamanhos, tamanhos)
+    parada = np.concatenate([padroes[p] for p in escolhidos]) if viagens else np.array([], dtype=np.int64)
+    chegada = inicios[viagem] + np.concatenate([offsets[p] for p in escolhidos]) if viagens else np.array([], dtype=np.int64)
+    stop_times = panda.DataFrame({
+        'trip_id': trips['trip_id'].to_numpy()[viagem],
+        'arrival_time': csvToRdf.horario_gtfs(panda.Series(chegada)).to_numpy(),
+        'departure_time': csvToRdf.horario_gtfs(panda.Series(chegada + TEMPO_PARADO)).to_numpy(),
+        'stop_id': stops['stop_id'].to_numpy()[parada],
+        'stop_sequence': posicao + 1,
+    })
+
+    # Uma viagem por linha também roda por frequência no pico da manhã.
+    primeiras = trips.drop_duplicates('route_id')['trip_id']
+    frequencies = panda.DataFrame({
+        'trip_id': primeiras.to_numpy(),
+        'start_time': '06:00:00',
+        'end_time': '09:00:00',
+        'headway_secs': 600,
+        'exact_times': 0,
+    })
+
+    pontos = []
+    for p, padrao in enumerate(padroes):
+        t = np.linspace(0, len(padrao) - 1, (len(padrao) - 1) * PONTOS_SHAPE_POR_TRECHO + 1)
+        lats = np.interp(t, np.arange(len(padrao)), stops['stop_lat'].to_numpy()[padrao])
+        lons = np.interp(t, np.arange(len(padrao)), stops['stop_lon'].to_numpy()[padrao])
+        pontos.append(panda.DataFrame({
+            'shape_id': f'SH{p}', 'shape_pt_lat': lats.round(6), 'shape_pt_lon': lons.round(6),
+            'shape_pt_sequence': np.arange(1, len(t) + 1),
+        }))
+    shapes = panda.concat(pontos, ignore_index=True)
+
+    agency = panda.DataFrame({
+        'agency_id': ['A1'], 'agency_name': ['Agência sintética'],
+        'agency_url': ['http://example.org'], 'agency_timezone': ['America/Sao_Paulo'],
+    })
+
+    tabelas = {
+        'agency': agency, 'frequencies': frequencies, 'routes': routes, 'shapes': shapes,
+        'stops': stops, 'stop_times': stop_times, 'trips': trips,
+    }
+    for nome, df in tabelas.items():
+        df.to_csv(f'{destino}/{nome}.csv', index=False)
+    return {nome: len(df) for nome, df in tabelas.items()}
@@ -0,0 +1,179 @@
+import os
+
+import numpy as np
+import pandas as panda
+from rdflib.namespace import RDF, XSD
+
+import csvToRdf
+from colunar import Bloco, texto, uri
+from csvToRdf import GTFS_URI
+
+# Frequências e nível de serviço. As janelas de frequencies.txt (uma
+# viagem-modelo repetida a cada headway_secs entre start_time e end_time) são
+# expandidas de forma vetorizada nas partidas que representam, em segundos
+# desde o início do dia de serviço. A partir delas e dos horários de
+# stop_times são calculadas as partidas por hora de cada parada e de cada
+# linha, gravadas no RDF como triplas derivadas: as consultas (heatmaps,
+# pesos de roteamento) leem o nível de serviço pronto, sem percorrer
+# stop_times. O calendário (calendar.txt) não é considerado: as contagens são
+# de um dia com todos os serviços ativos.
+
+# Colunas lidas de cada tabela para calcular as partidas por hora.
+COLUNAS = {
+    'stop_times': ['trip_id', 'stop_id', 'stop_sequence', 'arrival_time', 'departure_time'],
+    'trips': ['trip_id', 'route_id'],
+}
+
+#-------------------------------------------------------------------------------
+
+def _segundos(df: panda.DataFrame, coluna: str) -> panda.Series:
+    "Coluna de horário em segundos: a `<coluna>_s` de ler_tabela(parse_horarios=True) ou convertida agora."
+
+    if f'{coluna}_s' in df.columns:
+        return df[f'{coluna}_s']
+    if coluna in df.columns:
+        return csvToRdf.segundos_gtfs(df[coluna])
+    return panda.Series(panda.NA, index=df.index, dtype='Int32')
+
+def partidas_frequencias(frequencies: panda.DataFrame) -> panda.DataFrame:
+    """
+    Expande as janelas de frequencies.txt nas partidas que elas representam.
+    Retorna um DataFrame com uma linha por partida (trip_id, inicio em
+    segundos como int64, headway_secs e exact_times). Janelas incompletas ou
+    com headway nulo são descartadas; a última partida é a anterior a end_time.
+    """
+    colunas = {'trip_id': object, 'inicio': 'int64', 'headway_secs': 'int64', 'exact_times': bool}
+    if frequencies is None or frequencies.empty:
+        return panda.DataFrame({c: panda.Series(dtype=t) for c, t in colunas.items()})
+
+    freq = panda.DataFrame({
+        'trip_id': frequencies['trip_id'],
+        'inicio': _segundos(frequencies, 'start_time'),
+        'fim': _segundos(frequencies, 'end_time'),
+        'headway_secs': frequencies['headway_secs'],
+        'exact_times': panda.to_numeric(frequencies['exact_times'], errors='coerce').eq(1).fillna(False)
+            if 'exact_times' in frequencies.columns else False,
+    }).dropna(subset=['trip_id', 'inicio', 'fim', 'headway_secs'])
+    freq = freq[freq['headway_secs'] > 0]
+
+    inicio = freq['inicio'].to_numpy('int64')
+    headway = freq['headway_secs'].to_numpy('int64')
+    quantidade = np.maximum(-(-(freq['fim'].to_numpy('int64') - inicio) // headway), 0)
+
+    # Posição de cada partida dentro da sua janela (uma viagem pode ter várias janelas).
+    janela = np.repeat(np.arange(len(freq)), quantidade)
+    ordem = np.arange(quantidade.sum()) - np.repeat(np.cumsum(quantidade) - quantidade, quantidade)
+    return panda.DataFrame({
+        'trip_id': freq['trip_id'].astype(str).to_numpy()[janela],
+        'inicio': inicio[janela] + ordem * headway[janela],
+        'headway_secs': headway[janela],
+        'exact_times': freq['exact_times'].to_numpy(bool)[janela],
+    })
+
+def expandir_frequencias(stop_times: panda.DataFrame, frequencies: panda.DataFrame) -> panda.DataFrame:
+    """
+    Substitui as viagens-modelo de frequencies.txt pelas viagens que elas
+    representam: uma cópia deslocada a cada `headway_secs` entre start_time e
+    end_time. As cópias recebem o trip_id '<trip_id>@<partida em segundos>'.
+    As colunas arrival_time_s e departure_time_s presentes são deslocadas.
+    """
+    partidas = partidas_frequencias(frequencies)
+    if partidas.empty:
+        return stop_times
+
+    modelos = stop_times[stop_times['trip_id'].astype(str).isin(partidas['trip_id'])]
+    if modelos.empty:
+        return stop_times
+
+    # Horários relativos à primeira partida de cada viagem-modelo.
+    horarios = [c for c in ('arrival_time_s', 'departure_time_s') if c in modelos.columns]
+    modelos = modelos.assign(trip_id=modelos['trip_id'].astype(str))
+    primeira = modelos.groupby('trip_id', sort=False)['departure_time_s'].transform('min')
+    modelos = modelos.assign(**{c: modelos[c] - primeira for c in horarios})
+
+    expandidas = modelos.merge(partidas[['trip_id', 'inicio']], on='trip_id')
+    for coluna in horarios:
+        expandidas[coluna] += expandidas['inicio']
+    expandidas['trip_id'] = expandidas['trip_id'] + '@' + expandidas['inicio'].astype(str)
+
+    restantes = stop_times[~stop_times['trip_id'].astype(str).isin(partidas['trip_id'])]
+    return panda.concat(
+        [restantes.assign(trip_id=restantes['trip_id'].astype(str)), expandidas.drop(columns='inicio')],
+        ignore_index=True,
+    )
+
+#-------------------------------------------------------------------------------
+
+def partidas_por_hora(stop_times: panda.DataFrame, trips: panda.DataFrame, frequencies: panda.DataFrame = None):
+    """
+    Nível de serviço por hora, com as viagens de frequencies.txt expandidas.
+    Retorna (por_parada, por_linha): `por_parada` tem (stop_id, hora,
+    partidas), o número de partidas de viagens na parada naquela hora, e
+    `por_linha` tem (route_id, hora, partidas), o número de viagens da linha
+    que partem do ponto inicial naquela hora. `hora` é a hora do dia de
+    serviço e pode passar de 23. Paradas sem horário herdam o da parada
+    anterior da mesma viagem.
+    """
+    st = stop_times.dropna(subset=['trip_id', 'stop_id'])
+    st = panda.DataFrame({
+        'trip_id': st['trip_id'].astype(str).to_numpy(),
+        'stop_id': st['stop_id'].astype(str).to_numpy(),
+        'stop_sequence': st['stop_sequence'].to_numpy(),
+        'departure_time_s': _segundos(st, 'departure_time').fillna(_segundos(st, 'arrival_time'))
+            .astype('float64').to_numpy(),
+    })
+    st = st.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+    st['departure_time_s'] = st.groupby('trip_id', sort=False)['departure_time_s'].ffill()
+    st = expandir_frequencias(st.dropna(subset=['departure_time_s']), frequencies)
+    st['hora'] = (st['departure_time_s'] // 3600).astype('int64')
+
+    por_parada = st.groupby(['stop_id', 'hora']).size().rename('partidas').reset_index()
+
+    rotas = trips.dropna(subset=['trip_id', 'route_id']).drop_duplicates('trip_id')
+    rotas = panda.Series(rotas['route_id'].astype(str).to_numpy(), index=rotas['trip_id'].astype(str).to_numpy())
+    inicios = st.groupby('trip_id', sort=False)['departure_time_s'].min()
+    viagens = panda.DataFrame({
+        'route_id': rotas.reindex(inicios.index.str.split('@').str[0]).to_numpy(),
+        'hora': (inicios.to_numpy() // 3600).astype('int64'),
+    }).dropna(subset=['route_id'])
+    por_linha = viagens.groupby(['route_id', 'hora']).size().rename('partidas').reset_index()
+
+    return por_parada, por_linha
+
+#-------------------------------------------------------------------------------
+
+def _blocos_nivel(prefixo: str, chave: str, predicado, tabela: panda.DataFrame):
+    "Triplas do nível de serviço de `tabela` (parada ou linha): um nó por hora e o total do dia."
+
+    donos = uri(prefixo, tabela[chave])
+    sujeitos = donos + "/departures/" + texto(tabela['hora'])
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.HourlyDepartures), iri=True)
+    yield Bloco(sujeitos, predicado, donos, iri=True)
+    yield Bloco(sujeitos, GTFS_URI.hour, texto(tabela['hora']), datatype=XSD.nonNegativeInteger)
+    yield Bloco(sujeitos, GTFS_URI.departures, texto(tabela['partidas']), datatype=XSD.nonNegativeInteger)
+
+    totais = tabela.groupby(chave, sort=False)['partidas'].sum()
+    yield Bloco(uri(prefixo, panda.Series(totais.index, dtype=object)), GTFS_URI.departuresPerDay,
+                texto(panda.Series(totais.to_numpy())), datatype=XSD.nonNegativeInteger)
+
+def triplas_partidas(stop_times: panda.DataFrame, trips: panda.DataFrame, frequencies: panda.DataFrame = None):
+    """
+    Triplas derivadas do nível de serviço: stops/{id}/departures/{hora} e
+    routes/{id}/departures/{hora} (gtfs:HourlyDepartures, com gtfs:stop ou
+    gtfs:route, gtfs:hour e gtfs:departures) e o total gtfs:departuresPerDay
+    de cada parada e linha.
+    """
+    por_parada, por_linha = partidas_por_hora(stop_times, trips, frequencies)
+    yield from _blocos_nivel("stops/", 'stop_id', GTFS_URI.stop, por_parada)
+    yield from _blocos_nivel("routes/", 'route_id', GTFS_URI.route, por_linha)
+
+def ler_tabelas() -> tuple:
+    "Lê de csvToRdf.BASE_DIR as colunas de stop_times, trips e frequencies usadas por triplas_partidas."
+
+    frequencies = csvToRdf.ler_tabela('frequencies') \
+        if os.path.exists(f'{csvToRdf.BASE_DIR}/frequencies.csv') else None
+    return (
+        csvToRdf.ler_tabela('stop_times', colunas=COLUNAS['stop_times']),
+        csvToRdf.ler_tabela('trips', colunas=COLUNAS['trips']),
+        frequencies,
+    )
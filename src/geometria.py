@@ -0,0 +1,70 @@
+import numpy as np
+
+# Operações sobre polilinhas em graus (lat, lon), usadas na conversão dos
+# shapes (csvToRdf.wkt_shapes) e no recorte dos traçados por tile do servidor
+# de mapa (servidor_mapa.Tracados). Só dependem do NumPy.
+
+def douglas_peucker(lats, lons, tolerancia: float) -> np.ndarray:
+    "Máscara dos pontos mantidos pela simplificação Douglas-Peucker de uma linha."
+
+    n = len(lats)
+    manter = np.zeros(n, dtype=bool)
+    manter[0] = manter[-1] = True
+    pilha = [(0, n - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        dy, dx = lats[fim] - lats[inicio], lons[fim] - lons[inicio]
+        py, px = lats[inicio + 1:fim] - lats[inicio], lons[inicio + 1:fim] - lons[inicio]
+        comprimento = np.hypot(dx, dy)
+        if comprimento == 0:
+            distancias = np.hypot(px, py)
+        else:
+            distancias = np.abs(dx * py - dy * px) / comprimento
+        maior = int(np.argmax(distancias))
+        if distancias[maior] > tolerancia:
+            meio = inicio + 1 + maior
+            manter[meio] = True
+            pilha += [(inicio, meio), (meio, fim)]
+    return manter
+
+def recortar_linha(lats, lons, area) -> list:
+    """
+    Recorta uma linha no retângulo `area` = (lat_min, lon_min, lat_max,
+    lon_max), com o Liang-Barsky aplicado a todos os segmentos de uma vez.
+    Retorna a lista de trechos dentro do retângulo, cada um um par
+    (lats, lons); uma linha que sai e volta ao retângulo gera vários trechos.
+    """
+    lats, lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+    if len(lats) < 2:
+        return []
+    lat_min, lon_min, lat_max, lon_max = area
+    x0, y0 = lons[:-1], lats[:-1]
+    dx, dy = np.diff(lons), np.diff(lats)
+
+    # Parâmetros t de entrada e saída de cada segmento P0 + t * (dx, dy).
+    entrada, saida = np.zeros(len(dx)), np.ones(len(dx))
+    visivel = np.ones(len(dx), dtype=bool)
+    for p, q in ((-dx, x0 - lon_min), (dx, lon_max - x0), (-dy, y0 - lat_min), (dy, lat_max - y0)):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = q / p
+        visivel &= (p != 0) | (q >= 0)
+        entrada = np.where(p < 0, np.maximum(entrada, t), entrada)
+        saida = np.where(p > 0, np.minimum(saida, t), saida)
+    # Segmentos que só tocam um canto ou uma borda do retângulo são descartados.
+    visivel &= (entrada < saida) | ((dx == 0) & (dy == 0))
+
+    segmentos = np.flatnonzero(visivel)
+    if not len(segmentos):
+        return []
+    # Um trecho continua no segmento seguinte só se a linha não sai do retângulo entre os dois.
+    continua = (np.diff(segmentos) == 1) & (saida[segmentos[:-1]] >= 1) & (entrada[segmentos[1:]] <= 0)
+    cortes = np.flatnonzero(~continua) + 1
+
+    trechos = []
+    for grupo in np.split(segmentos, cortes):
+        t = np.concatenate([[entrada[grupo[0]]], saida[grupo]])
+        base = np.concatenate([[grupo[0]], grupo])
+        trechos.append((y0[base] + t * dy[base], x0[base] + t * dx[base]))
+    return trechos
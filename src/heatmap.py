@@ -0,0 +1,99 @@
+import json
+import os
+
+import numpy as np
+
+# Agregação dos pontos do heatmap. Em vez de embutir cada parada no HTML, os
+# pontos são somados numa grade cujo tamanho de célula acompanha o zoom (uma
+# célula ocupa PIXELS_POR_CELULA pixels na tela), e cada célula vira um único
+# ponto ponderado no centróide dos pontos que caíram nela.
+
+PIXELS_POR_CELULA = 8
+ZOOMS = range(10, 17)
+
+def tamanho_celula(zoom: int) -> float:
+    "Lado da célula da grade, em graus de longitude, para um nível de zoom do mapa."
+
+    return 360.0 / (256 * 2**zoom) * PIXELS_POR_CELULA
+
+def agregar_grade(lats, lons, pesos=None, celula: float = 0.002):
+    """
+    Soma os pesos dos pontos numa grade regular de `celula` graus. Retorna
+    (lats, lons, pesos) das células ocupadas, com cada célula posicionada no
+    centróide ponderado dos seus pontos.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    pesos = np.ones_like(lats) if pesos is None else np.asarray(pesos, dtype=np.float64)
+    if not len(lats):
+        return lats, lons, pesos
+
+    linhas = np.floor(lats / celula).astype(np.int64)
+    colunas = np.floor(lons / celula).astype(np.int64)
+    _, celulas = np.unique(np.stack([linhas, colunas], axis=1), axis=0, return_inverse=True)
+    celulas = celulas.ravel()
+
+    soma = np.bincount(celulas, weights=pesos)
+    com_peso = soma > 0
+    lat_media = np.bincount(celulas, weights=lats * pesos)[com_peso] / soma[com_peso]
+    lon_media = np.bincount(celulas, weights=lons * pesos)[com_peso] / soma[com_peso]
+    return lat_media, lon_media, soma[com_peso]
+
+def agregar_niveis(lats, lons, pesos=None, zooms=ZOOMS) -> dict:
+    "Agrega os pontos em cada nível de zoom: {zoom: (lats, lons, pesos)}."
+
+    return {z: agregar_grade(lats, lons, pesos, tamanho_celula(z)) for z in zooms}
+
+def pontos_ponderados(lats, lons, pesos, casas: int = 5) -> list:
+    """
+    Lista [lat, lon, peso] para o HeatMap do folium, com os pesos normalizados
+    para [0, 1] e as coordenadas arredondadas (5 casas ~ 1 m) para encurtar o HTML.
+    """
+    if not len(pesos):
+        return []
+    normalizados = np.asarray(pesos) / np.max(pesos)
+    return np.column_stack([np.round(lats, casas), np.round(lons, casas), np.round(normalizados, 4)]).tolist()
+
+#-------------------------------------------------------------------------------
+
+def tile_xy(lats, lons, zoom: int):
+    "Índices (x, y) dos tiles Web Mercator (esquema XYZ) que contêm os pontos."
+
+    n = 2**zoom
+    lat = np.radians(np.clip(np.asarray(lats, dtype=np.float64), -85.0511, 85.0511))
+    x = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / 360.0 * n).astype(np.int64)
+    y = np.floor((1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+def limites_tile(x: int, y: int, zoom: int):
+    "Retângulo (lat_min, lon_min, lat_max, lon_max) coberto pelo tile Web Mercator (x, y) do nível `zoom`."
+
+    n = 2**zoom
+    lon_min, lon_max = x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+    lat_max = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+    lat_min = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + 1) / n))))
+    return float(lat_min), float(lon_min), float(lat_max), float(lon_max)
+
+def exportar_tiles(niveis: dict, destino: str) -> int:
+    """
+    Grava os pontos agregados de cada nível como tiles {zoom}/{x}/{y}.json,
+    cada um com a lista [lat, lon, peso] das células que caem nele. Os pesos
+    são normalizados pelo maior peso do nível. Retorna o número de tiles gravados.
+    """
+    total = 0
+    for zoom, (lats, lons, pesos) in niveis.items():
+        if not len(pesos):
+            continue
+        x, y = tile_xy(lats, lons, zoom)
+        pontos = np.asarray(pontos_ponderados(lats, lons, pesos))
+        ordem = np.lexsort((y, x))
+        x, y, pontos = x[ordem], y[ordem], pontos[ordem]
+        cortes = np.flatnonzero((np.diff(x) != 0) | (np.diff(y) != 0)) + 1
+
+        for bloco_x, bloco_y, bloco in zip(np.split(x, cortes), np.split(y, cortes), np.split(pontos, cortes)):
+            pasta = f'{destino}/{zoom}/{bloco_x[0]}'
+            os.makedirs(pasta, exist_ok=True)
+            with open(f'{pasta}/{bloco_y[0]}.json', 'w', encoding='utf-8') as f:
+                json.dump(bloco.tolist(), f, separators=(',', ':'))
+            total += 1
+    return total
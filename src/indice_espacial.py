@@ -0,0 +1,127 @@
+import numpy as np
+
+# Índice espacial das paradas. As coordenadas são projetadas na esfera
+# unitária (x, y, z): a distância euclidiana entre esses pontos (a corda) cresce
+# junto com a distância sobre a superfície, então uma KD-tree em 3D responde
+# consultas de vizinhos mais próximos que são exatas em distância haversine.
+# Sem o scipy, as consultas caem num varrimento vetorizado em NumPy.
+
+RAIO_TERRA_M = 6_371_008.8
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+#-------------------------------------------------------------------------------
+
+def _cartesianas(lats, lons) -> np.ndarray:
+    "Projeta latitudes/longitudes (graus) na esfera unitária."
+
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+def _corda_para_metros(corda):
+    return 2 * RAIO_TERRA_M * np.arcsin(np.clip(corda / 2, 0, 1))
+
+def _metros_para_corda(metros):
+    return 2 * np.sin(np.minimum(metros / RAIO_TERRA_M, np.pi) / 2)
+
+def haversine(lat1, lon1, lat2, lon2):
+    "Distância em metros entre pontos (graus), vetorizada."
+
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * RAIO_TERRA_M * np.arcsin(np.sqrt(a))
+
+#-------------------------------------------------------------------------------
+
+class IndiceParadas:
+    """
+    Índice de vizinhança sobre as coordenadas das paradas. Os métodos aceitam
+    um ponto ou arrays de pontos (consulta em lote); as distâncias retornadas
+    são em metros.
+    """
+
+    def __init__(self, uris, lats, lons):
+        self.uris = np.asarray(uris, dtype=object)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self._pontos = _cartesianas(self.lats, self.lons)
+        self._arvore = cKDTree(self._pontos) if cKDTree is not None and len(self.uris) else None
+
+    def __len__(self):
+        return len(self.uris)
+
+    def k_mais_proximas(self, lat, lon, k: int = 1):
+        """
+        Retorna (indices, distancias) das `k` paradas mais próximas de cada
+        ponto, com formato (..., k).
+        """
+        k = min(k, len(self))
+        alvo = _cartesianas(lat, lon)
+
+        if self._arvore is not None:
+            cordas, indices = self._arvore.query(alvo, k=k)
+            cordas, indices = np.asarray(cordas).reshape(alvo.shape[:-1] + (k,)), np.asarray(indices).reshape(alvo.shape[:-1] + (k,))
+        else:
+            produtos = np.clip(alvo @ self._pontos.T, -1, 1)
+            indices = np.argpartition(-produtos, k - 1, axis=-1)[..., :k]
+            ordem = np.argsort(-np.take_along_axis(produtos, indices, axis=-1), axis=-1)
+            indices = np.take_along_axis(indices, ordem, axis=-1)
+            cordas = np.sqrt(np.maximum(2 - 2 * np.take_along_axis(produtos, indices, axis=-1), 0))
+
+        return indices, _corda_para_metros(cordas)
+
+    def no_raio(self, lat: float, lon: float, raio_m: float):
+        "Retorna (indices, distancias) das paradas a até `raio_m` metros do ponto, da mais próxima à mais distante."
+
+        alvo = _cartesianas(lat, lon)
+        corda = _metros_para_corda(raio_m)
+
+        if self._arvore is not None:
+            indices = np.asarray(self._arvore.query_ball_point(alvo, corda), dtype=np.intp)
+        else:
+            indices = np.flatnonzero(np.linalg.norm(self._pontos - alvo, axis=-1) <= corda)
+
+        distancias = haversine(lat, lon, self.lats[indices], self.lons[indices])
+        ordem = np.argsort(distancias)
+        return indices[ordem], distancias[ordem]
+
+    def pares_no_raio(self, raio_m: float, bloco: int = 2048):
+        """
+        Todos os pares (i, j) de paradas distintas a até `raio_m` metros uma da
+        outra, nos dois sentidos, numa única consulta à KD-tree. Retorna
+        (origens, destinos, distancias) ordenados por origem e distância.
+        """
+        corda = _metros_para_corda(raio_m)
+        if self._arvore is not None:
+            pares = self._arvore.query_pairs(corda, output_type='ndarray')
+            origens = np.concatenate([pares[:, 0], pares[:, 1]])
+            destinos = np.concatenate([pares[:, 1], pares[:, 0]])
+        else:
+            # Sem o scipy: produtos escalares em blocos de `bloco` paradas.
+            limite = 1 - corda**2 / 2
+            origens, destinos = [], []
+            for inicio in range(0, len(self), bloco):
+                i, j = np.nonzero(self._pontos[inicio:inicio + bloco] @ self._pontos.T >= limite)
+                i += inicio
+                origens.append(i[i != j])
+                destinos.append(j[i != j])
+            origens = np.concatenate(origens) if origens else np.empty(0, np.intp)
+            destinos = np.concatenate(destinos) if destinos else np.empty(0, np.intp)
+
+        distancias = haversine(self.lats[origens], self.lons[origens], self.lats[destinos], self.lons[destinos])
+        ordem = np.lexsort((distancias, origens))
+        return origens[ordem], destinos[ordem], distancias[ordem]
+
+    def mais_proxima(self, lat: float, lon: float):
+        "Parada mais próxima de um ponto, como (uri, lat, lon), ou None se o índice estiver vazio."
+
+        if not len(self):
+            return None
+        indices, _ = self.k_mais_proximas(lat, lon, 1)
+        i = int(indices.ravel()[0])
+        return (self.uris[i], float(self.lats[i]), float(self.lons[i]))
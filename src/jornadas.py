@@ -0,0 +1,245 @@
+import time
+
+import pandas as panda
+from rdflib import Graph
+from rdflib.namespace import RDF, XSD
+
+import colunar
+import csvToRdf
+from colunar import Bloco, texto, inteiro, uri, preenchidas, blocos_opcionais, blocos_enum, PICKUP_TYPE_MAP
+from csvToRdf import GTFS_URI
+
+# Modelagem compacta de stop_times por padrões de jornada. A maioria das
+# viagens repete a mesma sequência de paradas com os horários deslocados: a
+# sequência, com os horários relativos ao início da viagem (offsets em
+# segundos) e os demais atributos de cada parada, é gravada uma vez por padrão
+# de jornada, e cada viagem guarda apenas o seu padrão e o horário de início.
+# A expansão reconstrói o stop_times original (com horários normalizados
+# para HH:MM:SS).
+
+# Atributos de cada parada que, além do stop_id e dos offsets, fazem parte da
+# identidade do padrão de jornada (para que a expansão não perca nada).
+ATRIBUTOS = ['stop_sequence', 'pickup_type', 'stop_headsign', 'shape_dist_traveled']
+
+_SEP_CAMPO, _SEP_LINHA = '\x1f', '\x1e'
+
+#-------------------------------------------------------------------------------
+
+def compactar(stop_times: panda.DataFrame, trips: panda.DataFrame):
+    """
+    Agrupa as viagens de stop_times em padrões de jornada. Retorna
+    (paradas, viagens): `paradas` tem uma linha por parada de cada padrão
+    (journey_pattern_id, pattern_id, posicao, stop_id, arrival_offset,
+    departure_offset e os ATRIBUTOS presentes) e `viagens` associa cada trip_id
+    ao seu journey_pattern_id e horário de início (start_time e inicio, em
+    segundos). Os ids são hashes estáveis do conteúdo do padrão.
+    """
+    st = stop_times.dropna(subset=['trip_id', 'stop_id'])
+    st = st.assign(trip_id=st['trip_id'].astype(str), stop_id=st['stop_id'].astype(str))
+    st = st.sort_values(['trip_id', 'stop_sequence'], kind='stable').reset_index(drop=True)
+
+    chegadas = csvToRdf.segundos_gtfs(st['arrival_time']) if 'arrival_time' in st.columns else panda.Series(panda.NA, index=st.index, dtype='Int32')
+    partidas = csvToRdf.segundos_gtfs(st['departure_time']) if 'departure_time' in st.columns else panda.Series(panda.NA, index=st.index, dtype='Int32')
+    inicio = partidas.fillna(chegadas).groupby(st['trip_id'], sort=False).transform('first')
+
+    paradas = panda.DataFrame({
+        'trip_id': st['trip_id'],
+        'posicao': st.groupby('trip_id', sort=False).cumcount() + 1,
+        'stop_id': st['stop_id'],
+        'arrival_offset': (chegadas - inicio.fillna(0)).astype('Int32'),
+        'departure_offset': (partidas - inicio.fillna(0)).astype('Int32'),
+    })
+    atributos = [c for c in ATRIBUTOS if c in st.columns]
+    for coluna in atributos:
+        paradas[coluna] = st[coluna]
+
+    # Assinatura de cada viagem: todos os campos de todas as paradas, em ordem.
+    campos = ['stop_id', 'arrival_offset', 'departure_offset'] + atributos
+    linhas = paradas[campos[0]].astype(str)
+    for coluna in campos[1:]:
+        linhas = linhas + _SEP_CAMPO + paradas[coluna].astype('string').fillna('')
+    assinaturas = linhas.groupby(paradas['trip_id'], sort=False).agg(_SEP_LINHA.join)
+
+    _, padroes = csvToRdf.padroes_de_parada(st[['trip_id', 'stop_id', 'stop_sequence']], trips)
+    padroes = panda.Series(padroes['pattern_id'].to_numpy(), index=padroes['trip_id'].to_numpy())
+
+    viagens = panda.DataFrame({
+        'trip_id': assinaturas.index.to_numpy(),
+        'pattern_id': padroes.reindex(assinaturas.index).to_numpy(),
+    })
+    codigos, unicos = panda.factorize(viagens['pattern_id'].fillna('') + '\n' + assinaturas.to_numpy())
+    hashes = panda.util.hash_pandas_object(panda.Series(unicos), index=False)
+    ids = panda.Series([format(h, '016x') for h in hashes.to_numpy()], dtype=object).to_numpy()
+    viagens['journey_pattern_id'] = ids[codigos]
+
+    inicios = inicio.groupby(st['trip_id'], sort=False).first().reindex(viagens['trip_id']).to_numpy()
+    viagens['inicio'] = panda.array(inicios, dtype='Int32')
+    viagens['start_time'] = csvToRdf.horario_gtfs(viagens['inicio']).to_numpy()
+
+    representantes = viagens.drop_duplicates('journey_pattern_id')
+    paradas = paradas.merge(representantes[['trip_id', 'journey_pattern_id', 'pattern_id']], on='trip_id')
+    paradas = paradas.drop(columns='trip_id')[['journey_pattern_id', 'pattern_id', 'posicao', 'stop_id', 'arrival_offset', 'departure_offset'] + atributos]
+    return paradas, viagens[['trip_id', 'journey_pattern_id', 'start_time', 'inicio']]
+
+def expandir(paradas: panda.DataFrame, viagens: panda.DataFrame) -> panda.DataFrame:
+    "Reconstrói stop_times a partir dos padrões de jornada e dos horários de início das viagens."
+
+    inicio = viagens['inicio'] if 'inicio' in viagens.columns else csvToRdf.segundos_gtfs(viagens['start_time'])
+    viagens = viagens.assign(inicio=panda.array(inicio, dtype='Int32').fillna(0))[['trip_id', 'journey_pattern_id', 'inicio']]
+
+    df = viagens.merge(paradas, on='journey_pattern_id', sort=False)
+    df = df.sort_values(['trip_id', 'posicao'], kind='stable').reset_index(drop=True)
+
+    colunas = {
+        'trip_id': df['trip_id'],
+        'arrival_time': csvToRdf.horario_gtfs(df['inicio'] + df['arrival_offset']),
+        'departure_time': csvToRdf.horario_gtfs(df['inicio'] + df['departure_offset']),
+        'stop_id': df['stop_id'],
+    }
+    for coluna in ATRIBUTOS:
+        if coluna in df.columns:
+            colunas[coluna] = df[coluna]
+    return panda.DataFrame(colunas)
+
+#-------------------------------------------------------------------------------
+
+def triplas_jornadas(paradas: panda.DataFrame, viagens: panda.DataFrame):
+    "Blocos de triplas do modo compacto, no formato do motor colunar (colunar.py)."
+
+    padroes = paradas.drop_duplicates('journey_pattern_id')
+    sujeitos = uri("journeyPatterns/", padroes['journey_pattern_id'])
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.JourneyPattern), iri=True)
+    mascara = preenchidas(padroes, 'pattern_id')
+    if mascara.any():
+        yield Bloco(sujeitos[mascara], GTFS_URI.pattern, uri("patterns/", padroes.loc[mascara, 'pattern_id']), iri=True)
+
+    jornadas = uri("journeyPatterns/", paradas['journey_pattern_id'])
+    sujeitos = jornadas + "/stops/" + texto(paradas['posicao'])
+    yield Bloco(sujeitos, RDF.type, str(GTFS_URI.JourneyPatternStop), iri=True)
+    yield Bloco(sujeitos, GTFS_URI.journeyPattern, jornadas, iri=True)
+    yield Bloco(sujeitos, GTFS_URI.stop, uri("stops/", paradas['stop_id']), iri=True)
+    yield Bloco(sujeitos, GTFS_URI.position, texto(paradas['posicao']), datatype=XSD.nonNegativeInteger)
+
+    yield from blocos_opcionais(paradas, sujeitos, [
+        ('arrival_offset', GTFS_URI.arrivalOffset, texto, XSD.integer),
+        ('departure_offset', GTFS_URI.departureOffset, texto, XSD.integer),
+        ('stop_sequence', GTFS_URI.stopSequence, inteiro, XSD.nonNegativeInteger),
+        ('stop_headsign', GTFS_URI.headsign, texto, XSD.string),
+    ])
+
+    mascara = preenchidas(paradas, 'pickup_type')
+    if mascara is not None and mascara.any():
+        yield from blocos_enum(sujeitos[mascara], GTFS_URI.pickupType, inteiro(paradas.loc[mascara, 'pickup_type']), PICKUP_TYPE_MAP)
+
+    yield from blocos_opcionais(paradas, sujeitos, [
+        ('shape_dist_traveled', GTFS_URI.distanceTraveled, inteiro, XSD.nonNegativeInteger),
+    ])
+
+    sujeitos = uri("trips/", viagens['trip_id'])
+    yield Bloco(sujeitos, GTFS_URI.journeyPattern, uri("journeyPatterns/", viagens['journey_pattern_id']), iri=True)
+    yield from blocos_opcionais(viagens, sujeitos, [
+        ('start_time', GTFS_URI.startTime, texto, XSD.string),
+    ])
+
+def triplas_stop_times_compactas(stop_times: panda.DataFrame, trips: panda.DataFrame):
+    "Substituto de colunar.triplas_stop_times no modo compacto."
+
+    return triplas_jornadas(*compactar(stop_times, trips))
+
+#-------------------------------------------------------------------------------
+
+def ler_do_grafo(grafo: Graph):
+    "Lê os padrões de jornada e as viagens de um grafo rdflib no formato de `compactar`."
+
+    prefixos = f"PREFIX gtfs: <{GTFS_URI}>\n"
+    linhas = grafo.query(prefixos + """
+    SELECT ?jornada ?padrao ?posicao ?stop ?chegada ?partida ?sequencia ?pickup ?headsign ?distancia
+    WHERE {
+      ?parada gtfs:journeyPattern ?jornada ; gtfs:position ?posicao ; gtfs:stop ?stop .
+      OPTIONAL { ?jornada gtfs:pattern ?padrao }
+      OPTIONAL { ?parada gtfs:arrivalOffset ?chegada }
+      OPTIONAL { ?parada gtfs:departureOffset ?partida }
+      OPTIONAL { ?parada gtfs:stopSequence ?sequencia }
+      OPTIONAL { ?parada gtfs:pickupType ?pickup }
+      OPTIONAL { ?parada gtfs:headsign ?headsign }
+      OPTIONAL { ?parada gtfs:distanceTraveled ?distancia }
+    }
+    """)
+    sufixo = lambda uri, prefixo: None if uri is None else str(uri)[len(str(GTFS_URI) + prefixo):]
+    codigos_pickup = {str(uri): int(codigo) for codigo, uri in PICKUP_TYPE_MAP.items()}
+    paradas = panda.DataFrame([{
+        'journey_pattern_id': sufixo(r.jornada, "journeyPatterns/"),
+        'pattern_id': sufixo(r.padrao, "patterns/"),
+        'posicao': int(r.posicao),
+        'stop_id': sufixo(r.stop, "stops/"),
+        'arrival_offset': None if r.chegada is None else int(r.chegada),
+        'departure_offset': None if r.partida is None else int(r.partida),
+        'stop_sequence': None if r.sequencia is None else int(r.sequencia),
+        'pickup_type': None if r.pickup is None else codigos_pickup.get(str(r.pickup)),
+        'stop_headsign': None if r.headsign is None else str(r.headsign),
+        'shape_dist_traveled': None if r.distancia is None else int(r.distancia),
+    } for r in linhas])
+    for coluna in ['arrival_offset', 'departure_offset']:
+        paradas[coluna] = paradas[coluna].astype('Int32')
+    for coluna in ['stop_sequence', 'pickup_type']:
+        paradas[coluna] = paradas[coluna].astype('Int64')
+
+    linhas = grafo.query(prefixos + f"""
+    SELECT ?trip ?jornada ?inicio
+    WHERE {{
+      ?trip gtfs:journeyPattern ?jornada .
+      FILTER(STRSTARTS(STR(?trip), "{GTFS_URI}trips/"))
+      OPTIONAL {{ ?trip gtfs:startTime ?inicio }}
+    }}
+    """)
+    viagens = panda.DataFrame([{
+        'trip_id': sufixo(r.trip, "trips/"),
+        'journey_pattern_id': sufixo(r.jornada, "journeyPatterns/"),
+        'start_time': None if r.inicio is None else str(r.inicio),
+    } for r in linhas])
+    return paradas, viagens
+
+#-------------------------------------------------------------------------------
+
+def relatorio(printSteps: bool = True) -> dict:
+    """
+    Compara, para o feed em BASE_DIR, a modelagem de stop_times por linha com
+    a compacta: número de triplas, tempo de carga num grafo rdflib e se a
+    expansão reconstrói o stop_times original.
+    """
+    stop_times = csvToRdf.ler_tabela('stop_times')
+    trips = csvToRdf.ler_tabela('trips', colunas=csvToRdf.COLUNAS_PADROES['trips'])
+
+    resultado = {}
+    for modo, blocos in [
+        ('por_linha', lambda: colunar.triplas_stop_times(stop_times)),
+        ('compacto', lambda: triplas_stop_times_compactas(stop_times, trips)),
+    ]:
+        inicio = time.perf_counter()
+        triplas = colunar.adicionar_blocos(Graph(), blocos())
+        resultado[modo] = {'triplas': triplas, 'segundos': time.perf_counter() - inicio}
+
+    paradas, viagens = compactar(stop_times, trips)
+    resultado['viagens'] = len(viagens)
+    resultado['padroes_jornada'] = paradas['journey_pattern_id'].nunique()
+    resultado['reducao'] = resultado['por_linha']['triplas'] / max(resultado['compacto']['triplas'], 1)
+
+    expandido = expandir(paradas, viagens)
+    original = stop_times.dropna(subset=['trip_id', 'stop_id']).assign(
+        trip_id=lambda df: df['trip_id'].astype(str), stop_id=lambda df: df['stop_id'].astype(str))
+    original = original.sort_values(['trip_id', 'stop_sequence'], kind='stable').reset_index(drop=True)
+    for coluna in ['arrival_time', 'departure_time']:
+        if coluna in original.columns:
+            original[coluna] = csvToRdf.horario_gtfs(csvToRdf.segundos_gtfs(original[coluna]))
+    resultado['expansao_identica'] = bool(
+        expandido.astype(str).equals(original[expandido.columns].astype(str)))
+
+    if(printSteps):
+        print(f"stop_times por linha: {resultado['por_linha']['triplas']} triplas ({resultado['por_linha']['segundos']:.2f}s)")
+        print(f"stop_times compacto:  {resultado['compacto']['triplas']} triplas ({resultado['compacto']['segundos']:.2f}s)")
+        print(f"{resultado['viagens']} viagens em {resultado['padroes_jornada']} padrões de jornada; redução de {resultado['reducao']:.1f}x")
+        print(f"Expansão idêntica ao original: {resultado['expansao_identica']}")
+    return resultado
+
+if __name__ == '__main__':
+    relatorio()
@@ -0,0 +1,45 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import sparql
+
+# Geração em lote dos mapas de paradas por linha: uma query traz as paradas e
+# outra os traçados de todas as linhas, o resultado é particionado em memória e os
+# arquivos HTML são renderizados por um pool de processos. Só o processo
+# principal consulta: os workers recebem os dados prontos e, como o
+# sparql.cliente é criado sob demanda, nunca montam um backend próprio.
+
+def _renderizar(item):
+    route_short_name, coords, tracados = item
+    return sparql.salvar_mapa_paradas_linha(route_short_name, coords, tracados)
+
+def gerar_mapas_linhas(route_short_names=None, workers: int = None, printSteps: bool = True) -> tuple:
+    """
+    Gera ../map/paradas_linha_<linha>.html para todas as linhas (ou para as
+    informadas). Retorna a lista dos arquivos gerados e o tempo, em segundos,
+    de cada etapa.
+    """
+    tempos = {}
+
+    inicio = time.perf_counter()
+    linhas = sparql.coordenadas_paradas_por_linha(route_short_names)
+    tracados = sparql.tracados_por_linha(route_short_names)
+    tempos['consulta'] = time.perf_counter() - inicio
+
+    if route_short_names is not None:
+        faltando = set(map(str, route_short_names)) - linhas.keys()
+        for nome in sorted(faltando):
+            print(f'Linha {nome} não encontrada ou sem paradas.')
+
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        arquivos = list(pool.map(_renderizar, ((nome, coords, tracados.get(nome, [])) for nome, coords in linhas.items()), chunksize=8))
+    tempos['renderização'] = time.perf_counter() - inicio
+    tempos['total'] = tempos['consulta'] + tempos['renderização']
+
+    if(printSteps):
+        print(f"{len(linhas)} mapas gerados")
+        for etapa, segundos in tempos.items():
+            print(f"  {etapa}: {segundos:.2f}s")
+    return arquivos, tempos
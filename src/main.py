@@ -1,6 +1,257 @@
-import sparql
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
 
-sparql.generate_heatmap_paradas_geral_folium()
-sparql.generate_heatmap_paradas_linha("O0636AAA0A")
-sparql.plot_paradas_linha(43)
-# sparql.melhor_rota(-22.882405, -43.341696, -22.839038, -43.239646)
\ No newline at end of file
+# Linha de comando do projeto. Cada subcomando importa só os módulos de que
+# precisa (folium, matplotlib, rdflib e o roteador pesam segundos na
+# importação), então os comandos leves iniciam rápido. Os resultados dos
+# comandos de consulta ficam num cache em disco, com chave pelos argumentos e
+# pela versão dos dados (do repositório SPARQL ou dos CSVs do feed): repetir
+# um comando com os dados inalterados devolve o resultado gravado sem
+# consultar nada, enquanto os arquivos gerados continuarem lá.
+#
+#   python main.py converter [--modo grafo|stream|paralelo] [--compacto] ...
+#   python main.py heatmap [--peso paradas|partidas] [--hora H] [--linha ROUTE_ID] ...
+#   python main.py linha ROUTE_SHORT_NAME
+#   python main.py rota LAT LON LAT LON [--partida HH:MM:SS]
+#   python main.py lote [ROUTE_SHORT_NAME ...]
+#   python main.py od ORIGENS.csv DESTINOS.csv [--saida PREFIXO] ...
+#   python main.py servidor [--porta 8000]
+
+# O cache fica na raiz do projeto, qualquer que seja a pasta de onde o main.py é chamado.
+DIR_CACHE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache_main')
+
+#-------------------------------------------------------------------------------
+
+def versao_feed(base_dir: str = None) -> str:
+    "Versão dos CSVs do feed (tamanho e data de modificação de cada um)."
+
+    import versao_dados
+    assinatura = versao_dados.assinatura_feed(base_dir or versao_dados.BASE_DIR)
+    return hashlib.sha1(json.dumps(assinatura, sort_keys=True).encode()).hexdigest()
+
+class _Copia(io.StringIO):
+    "Guarda o que é impresso sem deixar de repassar para a saída original."
+
+    def __init__(self, saida):
+        super().__init__()
+        self._saida = saida
+
+    def write(self, texto):
+        self._saida.write(texto)
+        return super().write(texto)
+
+def _chave(comando: str, argumentos: dict, versao: str) -> str:
+    texto = json.dumps([comando, argumentos, versao], sort_keys=True, default=str)
+    return hashlib.sha1(texto.encode()).hexdigest()
+
+def _assinatura(caminho: str):
+    estado = os.stat(caminho)
+    return [estado.st_size, estado.st_mtime_ns]
+
+def executar_com_cache(comando: str, argumentos: dict, versao, funcao, dir_cache: str = DIR_CACHE) -> str:
+    """
+    Executa `funcao()` (que imprime o resultado e retorna a lista dos arquivos
+    gerados) ou, se o mesmo comando já rodou sobre a mesma `versao` dos dados
+    e os arquivos gerados estão intactos, só repete a saída gravada. `versao`
+    é uma função, chamada apenas aqui; se falhar, o comando roda sem cache.
+    Retorna a saída do comando.
+    """
+    try:
+        chave = _chave(comando, argumentos, versao())
+    except Exception as erro:
+        print(f"(cache desativado: versão dos dados indisponível: {erro})", file=sys.stderr)
+        chave = None
+
+    caminho = f'{dir_cache}/{chave}.json'
+    if chave and os.path.exists(caminho):
+        with open(caminho, encoding='utf-8') as f:
+            registro = json.load(f)
+        if all(os.path.exists(a) and _assinatura(a) == s for a, s in registro['arquivos']):
+            print(registro['saida'], end='')
+            print("(resultado do cache)", file=sys.stderr)
+            return registro['saida']
+
+    saida = _Copia(sys.stdout)
+    with contextlib.redirect_stdout(saida):
+        arquivos = funcao() or []
+
+    if chave:
+        os.makedirs(dir_cache, exist_ok=True)
+        registro = {
+            'comando': comando, 'argumentos': argumentos, 'saida': saida.getvalue(),
+            'arquivos': [[a, _assinatura(a)] for a in arquivos if os.path.exists(a)],
+        }
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(registro, f, ensure_ascii=False)
+    return saida.getvalue()
+
+#-------------------------------------------------------------------------------
+
+def _versao_repositorio():
+    from backends import versao_repositorio
+    return versao_repositorio()
+
+def cmd_converter(args):
+    import csvToRdf
+
+    if args.modo == 'grafo':
+        resumo = csvToRdf.generate_rdf_graph(args.verboso, compacto=args.compacto, metricas=args.metricas)
+        print(f"{resumo['triplas']} triplas em ./gtfs.ttl ({resumo['segundos']:.1f}s)")
+    elif args.modo == 'stream':
+        triplas = csvToRdf.generate_rdf_stream(args.destino, compacto=args.compacto, printSteps=args.verboso, metricas=args.metricas)
+        print(f"{triplas} triplas em {args.destino}")
+    else:
+        import paralelo
+        triplas = paralelo.generate_rdf_paralelo(args.destino, workers=args.workers, compacto=args.compacto, printSteps=args.verboso)
+        print(f"{triplas} triplas em {args.destino}")
+
+def cmd_heatmap(args):
+    def gerar():
+        import sparql
+        if args.linha:
+            sparql.generate_heatmap_paradas_linha(args.linha)
+            return [f'../map/heatmap_paradas_linha_{args.linha}.html']
+        sparql.generate_heatmap_paradas_geral_folium(peso=args.peso, hora=args.hora, area=args.area)
+        return ['../map/heatmap_paradas_geral.html']
+
+    argumentos = {'linha': args.linha, 'peso': args.peso, 'hora': args.hora, 'area': args.area}
+    _executar(args, 'heatmap', argumentos, _versao_repositorio, gerar)
+
+def cmd_linha(args):
+    def gerar():
+        import sparql
+        sparql.plot_paradas_linha(args.route_short_name)
+        return [f'../map/paradas_linha_{args.route_short_name}.html']
+
+    _executar(args, 'linha', {'linha': args.route_short_name}, _versao_repositorio, gerar)
+
+def cmd_rota(args):
+    def gerar():
+        import sparql
+        sparql.melhor_rota(args.lat_origem, args.lon_origem, args.lat_destino, args.lon_destino, args.partida)
+        return ['../map/melhor_rota.html']
+
+    argumentos = {'pontos': [args.lat_origem, args.lon_origem, args.lat_destino, args.lon_destino], 'partida': args.partida}
+    _executar(args, 'rota', argumentos, versao_feed, gerar)
+
+def cmd_lote(args):
+    def gerar():
+        import lote
+        arquivos, _ = lote.gerar_mapas_linhas(args.linhas or None, workers=args.workers)
+        return arquivos
+
+    _executar(args, 'lote', {'linhas': args.linhas}, _versao_repositorio, gerar)
+
+def cmd_od(args):
+    def gerar():
+        import pandas as panda
+
+        from matriz_od import matriz_od
+        origens = panda.read_csv(args.origens, index_col=0)
+        destinos = panda.read_csv(args.destinos, index_col=0)
+        resultado = matriz_od(origens, destinos, args.partida, workers=args.workers, mapa=args.mapa)
+
+        arquivos = [f'{args.saida}_tempos.csv', f'{args.saida}_transferencias.csv']
+        resultado.tempos.to_csv(arquivos[0])
+        resultado.transferencias.to_csv(arquivos[1])
+        alcancados = resultado.tempos.notna().to_numpy().mean() if resultado.tempos.size else 0.0
+        print(f"Matriz {len(origens)} x {len(destinos)} ({alcancados:.0%} dos pares alcançáveis) salva em {', '.join(arquivos)}")
+        return arquivos + ([args.mapa] if args.mapa else [])
+
+    argumentos = {
+        'origens': [args.origens, _assinatura(args.origens)], 'destinos': [args.destinos, _assinatura(args.destinos)],
+        'partida': args.partida, 'saida': args.saida, 'mapa': args.mapa,
+    }
+    _executar(args, 'od', argumentos, versao_feed, gerar)
+
+def cmd_servidor(args):
+    import threading
+
+    from servidor_mapa import ServidorMapa
+    with ServidorMapa(args.porta, peso=args.peso) as servidor:
+        print(f"Mapa em {servidor.url} (Ctrl+C para sair)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+def _executar(args, comando, argumentos, versao, funcao):
+    if args.sem_cache:
+        funcao()
+    else:
+        executar_com_cache(comando, dict(argumentos, backend=os.environ.get('GTFS_SPARQL')), versao, funcao)
+
+#-------------------------------------------------------------------------------
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='main.py', description='GTFS do Rio de Janeiro em RDF: conversão, consultas e mapas.')
+    parser.add_argument('--backend', help='URL do endpoint SPARQL ou caminho de um arquivo RDF (padrão: $GTFS_SPARQL ou o GraphDB local)')
+    parser.add_argument('--sem-cache', action='store_true', help='ignora o cache de resultados em disco')
+    comandos = parser.add_subparsers(dest='comando', metavar='comando')
+
+    p = comandos.add_parser('converter', help='converte os CSVs do GTFS em RDF')
+    p.add_argument('--modo', choices=['grafo', 'stream', 'paralelo'], default='stream')
+    p.add_argument('--destino', default='./gtfs.nt.gz', help='arquivo N-Triples (modos stream e paralelo)')
+    p.add_argument('--compacto', action='store_true', help='modela stop_times por padrões de jornada')
+    p.add_argument('--workers', type=int)
+    p.add_argument('--metricas', help='grava as métricas da conversão neste JSON (modos grafo e stream)')
+    p.add_argument('-v', '--verboso', action='store_true')
+    p.set_defaults(funcao=cmd_converter)
+
+    p = comandos.add_parser('heatmap', help='heatmap das paradas (geral ou de uma linha)')
+    p.add_argument('--linha', metavar='ROUTE_ID', help='heatmap só das paradas desta linha')
+    p.add_argument('--peso', choices=['paradas', 'partidas'], default='paradas')
+    p.add_argument('--hora', type=int, help='com --peso partidas, só as partidas desta hora')
+    p.add_argument('--area', type=float, nargs=4, metavar=('LAT_MIN', 'LON_MIN', 'LAT_MAX', 'LON_MAX'))
+    p.set_defaults(funcao=cmd_heatmap)
+
+    p = comandos.add_parser('linha', help='mapa das paradas e traçados de uma linha')
+    p.add_argument('route_short_name')
+    p.set_defaults(funcao=cmd_linha)
+
+    p = comandos.add_parser('rota', help='melhor rota entre dois pontos')
+    for nome in ('lat_origem', 'lon_origem', 'lat_destino', 'lon_destino'):
+        p.add_argument(nome, type=float)
+    p.add_argument('--partida', default='08:00:00', help='horário de partida (HH:MM:SS)')
+    p.set_defaults(funcao=cmd_rota)
+
+    p = comandos.add_parser('lote', help='mapas de paradas de todas as linhas (ou das informadas)')
+    p.add_argument('linhas', nargs='*', metavar='ROUTE_SHORT_NAME')
+    p.add_argument('--workers', type=int)
+    p.set_defaults(funcao=cmd_lote)
+
+    p = comandos.add_parser('od', help='matriz origem-destino de tempos de viagem')
+    p.add_argument('origens', help='CSV com um rótulo na primeira coluna e colunas lat e lon')
+    p.add_argument('destinos', help='CSV no mesmo formato das origens')
+    p.add_argument('--partida', default='08:00:00', help='horário de partida (HH:MM:SS)')
+    p.add_argument('--saida', default='./matriz_od', help='prefixo dos CSVs de tempos e transferências')
+    p.add_argument('--workers', type=int)
+    p.add_argument('--mapa', help='grava também um mapa HTML do tempo médio de cada origem')
+    p.set_defaults(funcao=cmd_od)
+
+    p = comandos.add_parser('servidor', help='servidor do mapa interativo')
+    p.add_argument('--porta', type=int, default=8000)
+    p.add_argument('--peso', choices=['paradas', 'partidas'], default='partidas')
+    p.set_defaults(funcao=cmd_servidor)
+
+    return parser
+
+def main(argv=None):
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if args.comando is None:
+        parser.print_help()
+        return 1
+    if args.backend:
+        # Lido por backends.criar_backend quando o sparql.py é importado.
+        os.environ['GTFS_SPARQL'] = args.backend
+    args.funcao(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as panda
+
+import roteamento
+from indice_espacial import haversine
+from roteamento import INFINITO, MAX_TRANSFERENCIAS, VELOCIDADE_CAMINHADA
+
+# Matrizes origem-destino em lote. As origens e os destinos (pontos quaisquer,
+# ex.: centróides de zonas) são associados de uma vez às paradas mais próximas
+# pelo índice espacial do roteador. O RAPTOR calcula, numa única execução, a
+# chegada mais cedo a todas as paradas a partir de uma origem, então cada
+# origem distinta é roteada uma só vez e a matriz sai das chegadas nas paradas
+# de destino. As origens são distribuídas entre os processos de um pool.
+
+RAIO_ACESSO = 1000          # m: distância máxima a pé entre um ponto e a sua parada
+
+class MatrizOD(NamedTuple):
+    "Resultado de matriz_od: DataFrames origens x destinos e as paradas associadas a cada ponto."
+
+    tempos: panda.DataFrame             # segundos de porta a porta (NaN se inalcançável)
+    transferencias: panda.DataFrame     # baldeações do itinerário (<NA> se inalcançável)
+    paradas_origem: panda.Series        # stop_id mais próximo de cada origem (None se longe demais)
+    paradas_destino: panda.Series
+
+#-------------------------------------------------------------------------------
+
+def _pontos(pontos) -> panda.DataFrame:
+    "Normaliza os pontos (DataFrame com lat/lon ou array n x 2 de [lat, lon]) num DataFrame lat, lon."
+
+    if isinstance(pontos, panda.DataFrame):
+        return pontos[['lat', 'lon']].astype('float64')
+    pontos = np.asarray(pontos, dtype=np.float64).reshape(-1, 2)
+    return panda.DataFrame({'lat': pontos[:, 0], 'lon': pontos[:, 1]})
+
+def _associar(roteador, pontos: panda.DataFrame, raio_m: float):
+    "Parada mais próxima de cada ponto (índice, -1 se além de `raio_m`) e a caminhada até ela em segundos."
+
+    if not len(pontos):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    indices, distancias = roteador.indice.k_mais_proximas(pontos['lat'].to_numpy(), pontos['lon'].to_numpy(), 1)
+    indices, distancias = indices[..., 0].astype(np.int64), distancias[..., 0]
+    indices[distancias > raio_m] = -1
+    return indices, np.ceil(distancias / VELOCIDADE_CAMINHADA).astype(np.int64)
+
+#-------------------------------------------------------------------------------
+
+_roteador_worker = None
+
+def _iniciar_worker(roteador):
+    global _roteador_worker
+    _roteador_worker = roteador
+
+def _rotear(tarefa):
+    """
+    Roteia um lote de origens (roda no worker). Retorna, para cada (parada,
+    horário de partida) do lote, as chegadas e o número de viagens usadas nas
+    paradas de destino.
+    """
+    origens, destinos, max_transferencias = tarefa
+    chegadas = np.empty((len(origens), len(destinos)), np.int64)
+    viagens = np.empty((len(origens), len(destinos)), np.int64)
+    for i, (parada, partida) in enumerate(origens):
+        tau, rodada = _roteador_worker.chegadas_indice(int(parada), int(partida), max_transferencias)
+        chegadas[i], viagens[i] = tau[destinos], rodada[destinos]
+    return chegadas, viagens
+
+def _lotes(itens, tamanho: int):
+    return [itens[i:i + tamanho] for i in range(0, len(itens), tamanho)]
+
+#-------------------------------------------------------------------------------
+
+def matriz_od(
+    origens,
+    destinos,
+    horario_partida: str = "08:00:00",
+    workers: int = None,
+    max_transferencias: int = MAX_TRANSFERENCIAS,
+    raio_acesso: float = RAIO_ACESSO,
+    roteador=None,
+    mapa: str = None,
+) -> MatrizOD:
+    """
+    Calcula os tempos de viagem e o número de baldeações entre todas as
+    `origens` e todos os `destinos` (DataFrames com colunas lat e lon, cujo
+    índice rotula a matriz, ou arrays n x 2 de [lat, lon]), saindo a
+    `horario_partida`. O tempo inclui as caminhadas do ponto à parada mais
+    próxima e da parada ao destino; pontos a até `raio_acesso` metros um do
+    outro também podem ir a pé direto. As origens são roteadas por `workers`
+    processos (1 roda no próprio processo). Nenhum mapa é gerado, a não ser
+    que `mapa` informe o caminho do HTML com o tempo médio de cada origem.
+    """
+    roteador = roteador or roteamento.roteador_padrao()
+    origens, destinos = _pontos(origens), _pontos(destinos)
+    h, m, s = (int(parte) for parte in horario_partida.split(':'))
+    partida = h * 3600 + m * 60 + s
+
+    parada_origem, acesso = _associar(roteador, origens, raio_acesso)
+    parada_destino, egresso = _associar(roteador, destinos, raio_acesso)
+
+    # Cada par (parada, horário de chegada à parada) distinto é roteado uma vez.
+    validas = parada_origem >= 0
+    pares, inverso = np.unique(
+        np.stack([parada_origem[validas], partida + acesso[validas]], axis=1).reshape(-1, 2),
+        axis=0, return_inverse=True,
+    )
+    alvos, posicao_alvo = np.unique(parada_destino[parada_destino >= 0], return_inverse=True)
+
+    chegadas = np.full((len(pares), len(alvos)), INFINITO, np.int64)
+    viagens = np.zeros((len(pares), len(alvos)), np.int64)
+    if len(pares) and len(alvos):
+        workers = workers or os.cpu_count()
+        lotes = _lotes(pares, max(1, -(-len(pares) // (workers * 4))))
+        tarefas = [(lote, alvos, max_transferencias) for lote in lotes]
+        if workers == 1:
+            _iniciar_worker(roteador)
+            resultados = map(_rotear, tarefas)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_worker, initargs=(roteador,))
+            resultados = pool.map(_rotear, tarefas)
+        try:
+            inicio = 0
+            for lote_chegadas, lote_viagens in resultados:
+                chegadas[inicio:inicio + len(lote_chegadas)] = lote_chegadas
+                viagens[inicio:inicio + len(lote_viagens)] = lote_viagens
+                inicio += len(lote_chegadas)
+        finally:
+            if workers != 1:
+                pool.shutdown()
+
+    # Matriz por ponto: linhas das origens válidas, colunas dos destinos válidos.
+    tempos = np.full((len(origens), len(destinos)), np.nan)
+    baldeacoes = np.full((len(origens), len(destinos)), -1, np.int64)
+    linhas, colunas = np.flatnonzero(validas), np.flatnonzero(parada_destino >= 0)
+    if len(linhas) and len(colunas):
+        chegada = chegadas[np.ix_(inverso.ravel(), posicao_alvo.ravel())]
+        alcancado = chegada < INFINITO
+        tempo = np.where(alcancado, chegada + egresso[colunas] - partida, np.nan)
+        tempos[np.ix_(linhas, colunas)] = tempo
+        baldeacoes[np.ix_(linhas, colunas)] = np.where(alcancado, np.maximum(viagens[np.ix_(inverso.ravel(), posicao_alvo.ravel())] - 1, 0), -1)
+
+    # Caminhada direta entre pontos próximos.
+    if len(origens) and len(destinos):
+        distancias = haversine(
+            origens['lat'].to_numpy()[:, None], origens['lon'].to_numpy()[:, None],
+            destinos['lat'].to_numpy()[None, :], destinos['lon'].to_numpy()[None, :],
+        )
+        a_pe = np.where(distancias <= raio_acesso, np.ceil(distancias / VELOCIDADE_CAMINHADA), np.inf)
+        direto = a_pe < np.where(np.isnan(tempos), np.inf, tempos)
+        tempos[direto] = a_pe[direto]
+        baldeacoes[direto] = 0
+
+    def stop_ids(indices, pontos):
+        return panda.Series(np.where(indices >= 0, roteador.stop_ids[indices], None), index=pontos.index, dtype=object)
+
+    resultado = MatrizOD(
+        tempos=panda.DataFrame(tempos, index=origens.index, columns=destinos.index),
+        transferencias=panda.DataFrame(baldeacoes, index=origens.index, columns=destinos.index)
+            .astype('Int64').mask(lambda df: df < 0),
+        paradas_origem=stop_ids(parada_origem, origens),
+        paradas_destino=stop_ids(parada_destino, destinos),
+    )
+    if mapa:
+        salvar_mapa(resultado, origens, mapa)
+    return resultado
+
+def salvar_mapa(resultado: MatrizOD, origens, destino: str):
+    "Mapa das origens coloridas pelo tempo médio (em minutos) até os destinos alcançáveis."
+
+    import folium
+    import matplotlib
+
+    origens = _pontos(origens)
+    medias = resultado.tempos.mean(axis=1, skipna=True).to_numpy() / 60
+    escala = matplotlib.colormaps['viridis_r']
+    maior = np.nanmax(medias) if np.isfinite(medias).any() else 1.0
+
+    m = folium.Map(location=[origens['lat'].mean(), origens['lon'].mean()], zoom_start=11, tiles="cartodbpositron")
+    for (rotulo, ponto), media in zip(origens.iterrows(), medias):
+        cor = matplotlib.colors.to_hex(escala(media / maior)) if np.isfinite(media) else '#999999'
+        texto = f"{rotulo}: {media:.0f} min" if np.isfinite(media) else f"{rotulo}: inalcançável"
+        folium.CircleMarker([ponto['lat'], ponto['lon']], radius=6, color=cor, fill=True, fill_opacity=0.8, popup=texto).add_to(m)
+    m.save(destino)
@@ -0,0 +1,138 @@
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Instrumentação da conversão CSV → RDF. Para cada tabela são registrados o
+# tempo, as linhas lidas, as triplas emitidas, as taxas (linhas/s e
+# triplas/s) e a memória residente (RSS) ao final e de pico. Em tabelas
+# longas, o progresso é impresso periodicamente. As métricas podem ser
+# gravadas num arquivo JSON e a execução inteira num dump do cProfile.
+
+INTERVALO_PROGRESSO = 10        # segundos entre duas linhas de progresso
+
+# Etapas medidas que não convertem tabelas (e não entram nos totais do resumo).
+ETAPAS_AUXILIARES = {'leitura', 'serializacao'}
+
+try:
+    import resource
+except ImportError:             # Windows
+    resource = None
+
+def rss_atual_mb() -> float:
+    "Memória residente atual do processo, em MB (0 se não for possível medir)."
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        return 0.0
+
+def rss_pico_mb() -> float:
+    "Pico de memória residente do processo desde o início, em MB."
+
+    if resource is None:
+        return rss_atual_mb()
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS.
+    pico = pico / 2**20 if sys.platform == 'darwin' else pico / 2**10
+    return max(pico, rss_atual_mb())
+
+#-------------------------------------------------------------------------------
+
+class _Tabela:
+    "Acompanhamento de uma tabela em conversão; `avancar` é chamado a cada bloco convertido."
+
+    def __init__(self, nome: str, total_linhas, printSteps: bool):
+        self.nome, self.total_linhas, self.printSteps = nome, total_linhas, printSteps
+        self.linhas = self.triplas = 0
+        self.inicio = self._ultimo_aviso = time.perf_counter()
+
+    def avancar(self, linhas: int = 0, triplas: int = 0):
+        self.linhas += linhas
+        self.triplas += triplas
+        agora = time.perf_counter()
+        if self.printSteps and agora - self._ultimo_aviso >= INTERVALO_PROGRESSO:
+            self._ultimo_aviso = agora
+            decorrido = agora - self.inicio
+            total = f"/{self.total_linhas}" if self.total_linhas else ""
+            print(f"  {self.nome}: {self.linhas}{total} linhas, {self.triplas} triplas, "
+                  f"{self.linhas / decorrido:,.0f} linhas/s, RSS {rss_atual_mb():,.0f} MB")
+
+class MetricasConversao:
+    """
+    Coletor das métricas de uma conversão. Cada tabela é medida dentro de
+    `with metricas.tabela(nome) as t:`, informando o avanço com
+    `t.avancar(linhas, triplas)`.
+    """
+
+    def __init__(self, printSteps: bool = False):
+        self.printSteps = printSteps
+        self.tabelas = {}
+        self.inicio = time.perf_counter()
+
+    @contextmanager
+    def tabela(self, nome: str, total_linhas: int = None):
+        acompanhamento = _Tabela(nome, total_linhas, self.printSteps)
+        yield acompanhamento
+
+        segundos = time.perf_counter() - acompanhamento.inicio
+        metricas = {
+            'segundos': segundos,
+            'linhas': acompanhamento.linhas,
+            'triplas': acompanhamento.triplas,
+            'linhas_por_segundo': acompanhamento.linhas / segundos if segundos else None,
+            'triplas_por_segundo': acompanhamento.triplas / segundos if segundos else None,
+            'rss_mb': rss_atual_mb(),
+            'rss_pico_mb': rss_pico_mb(),
+        }
+        anterior = self.tabelas.get(nome)
+        if anterior:
+            # A mesma tabela medida em mais de uma etapa (ex.: partes de stop_times).
+            for chave in ('segundos', 'linhas', 'triplas'):
+                metricas[chave] += anterior[chave]
+            metricas['linhas_por_segundo'] = metricas['linhas'] / metricas['segundos'] if metricas['segundos'] else None
+            metricas['triplas_por_segundo'] = metricas['triplas'] / metricas['segundos'] if metricas['segundos'] else None
+        self.tabelas[nome] = metricas
+
+        if self.printSteps:
+            print(f"{nome}: {acompanhamento.linhas} linhas, {acompanhamento.triplas} triplas em {segundos:.2f}s "
+                  f"(RSS {metricas['rss_mb']:,.0f} MB, pico {metricas['rss_pico_mb']:,.0f} MB)")
+
+    def resumo(self) -> dict:
+        convertidas = [t for nome, t in self.tabelas.items() if nome not in ETAPAS_AUXILIARES]
+        return {
+            'segundos': time.perf_counter() - self.inicio,
+            'linhas': sum(t['linhas'] for t in convertidas),
+            'triplas': sum(t['triplas'] for t in convertidas),
+            'rss_pico_mb': rss_pico_mb(),
+            'tabelas': self.tabelas,
+        }
+
+    def salvar(self, caminho: str):
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(self.resumo(), f, indent=1)
+
+#-------------------------------------------------------------------------------
+
+@contextmanager
+def perfilando(caminho: str = None):
+    "Com `caminho`, perfila o bloco com o cProfile e grava o dump (legível com pstats ou snakeviz)."
+
+    if not caminho:
+        yield
+        return
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        perfil.dump_stats(caminho)
@@ -0,0 +1,120 @@
+import gzip
+import urllib.parse
+import pandas as panda
+
+# Escrita em streaming de N-Triples: os blocos do motor colunar (colunar.py)
+# são formatados como linhas de texto de forma vetorizada e gravados direto no
+# arquivo, sem passar por objetos do rdflib nem pelo mainGraph.
+
+def _escapar(serie: panda.Series) -> panda.Series:
+    "Escapa a forma léxica dos literais conforme a gramática do N-Triples."
+
+    return (serie
+        .str.replace('\\', '\\\\', regex=False)
+        .str.replace('"', '\\"', regex=False)
+        .str.replace('\n', '\\n', regex=False)
+        .str.replace('\r', '\\r', regex=False))
+
+def _objetos(bloco):
+    "Formata a coluna de objetos de um bloco (IRI, literal simples ou tipado)."
+
+    objetos = bloco.objetos
+    if not isinstance(objetos, panda.Series):
+        objetos = panda.Series(objetos, index=bloco.sujeitos.index, dtype=object)
+    objetos = objetos.astype(str)
+
+    if bloco.iri:
+        return "<" + objetos + ">"
+    if bloco.datatype is None:
+        return '"' + _escapar(objetos) + '"'
+    return '"' + _escapar(objetos) + '"^^<' + str(bloco.datatype) + ">"
+
+def linhas_bloco(bloco) -> panda.Series:
+    "Converte um bloco de triplas em linhas N-Triples."
+
+    return "<" + bloco.sujeitos.astype(str) + "> <" + str(bloco.predicado) + "> " + _objetos(bloco) + " .\n"
+
+#-------------------------------------------------------------------------------
+
+class EscritorNTriples:
+    """
+    Grava blocos de triplas num arquivo N-Triples, comprimido com gzip se o
+    destino terminar em .gz. Deve ser usado como gerenciador de contexto.
+    """
+
+    def __init__(self, destino: str):
+        self.destino = destino
+        self.triplas = 0
+        self._arquivo = None
+
+    def __enter__(self):
+        if self.destino.endswith('.gz'):
+            self._arquivo = gzip.open(self.destino, 'wt', encoding='utf-8', compresslevel=6)
+        else:
+            self._arquivo = open(self.destino, 'w', encoding='utf-8')
+        return self
+
+    def __exit__(self, *exc):
+        self._arquivo.close()
+        self._arquivo = None
+
+    def escrever_blocos(self, blocos) -> int:
+        "Escreve os blocos no arquivo e retorna quantas triplas foram gravadas."
+
+        total = 0
+        for bloco in blocos:
+            if not len(bloco):
+                continue
+            self._arquivo.writelines(linhas_bloco(bloco).tolist())
+            total += len(bloco)
+        self.triplas += total
+        return total
+
+#-------------------------------------------------------------------------------
+
+def _ler_pedacos(arquivo: str, tamanho: int = 1 << 20):
+    "Lê um arquivo N-Triples (comprimido ou não) em pedaços de bytes."
+
+    abrir = gzip.open if arquivo.endswith('.gz') else open
+    with abrir(arquivo, 'rb') as f:
+        while True:
+            pedaco = f.read(tamanho)
+            if not pedaco:
+                break
+            yield pedaco
+
+def _enviar(conexao, caminho: str, corpo, content_type: str, descricao: str):
+    conexao.request(
+        'POST', caminho + '/statements',
+        body=corpo,
+        headers={'Content-Type': content_type},
+        encode_chunked=not isinstance(corpo, (str, bytes)),
+    )
+    resposta = conexao.getresponse()
+    dados = resposta.read()
+    if resposta.status >= 300:
+        raise RuntimeError(f"GraphDB recusou {descricao}: {resposta.status} {dados[:500]!r}")
+
+def carregar_no_graphdb(
+    arquivo: str,
+    repositorio: str = "http://localhost:7200/repositories/gtfs-rj",
+    content_type: str = 'application/n-triples',
+):
+    """
+    Envia um arquivo para o repositório do GraphDB (endpoint /statements do
+    RDF4J) em streaming, sem carregá-lo inteiro na memória. Por padrão o
+    arquivo é N-Triples; com content_type='application/sparql-update' ele é
+    executado como uma atualização SPARQL. Em seguida troca o marcador de
+    versão do repositório (versao_dados.py), invalidando os caches das
+    consultas mesmo quando o número de triplas não muda.
+    """
+    from cliente_sparql import conexao_http
+    from versao_dados import update_versao
+
+    url = urllib.parse.urlsplit(repositorio)
+    conexao = conexao_http(url)
+    try:
+        _enviar(conexao, url.path, _ler_pedacos(arquivo), content_type, arquivo)
+        _enviar(conexao, url.path, update_versao(), 'application/sparql-update', 'o marcador de versão')
+    finally:
+        conexao.close()
@@ -0,0 +1,211 @@
+import io
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as panda
+
+import colunar
+import csvToRdf
+from ntriples import EscritorNTriples
+
+# Conversão paralela: as tabelas grandes são divididas em partições, e cada
+# partição é convertida por um processo em seu próprio shard N-Triples. Os
+# shards podem ser concatenados num único arquivo ou entregues como diretório
+# ao carregador em massa do GraphDB (importrdf).
+
+TABELAS_PEQUENAS = ['agency', 'frequencies', 'routes', 'stops', 'trips']
+
+# Tabelas particionadas e a coluna usada no particionamento por hash.
+TABELAS_PARTICIONADAS = {
+    'shapes': 'shape_id',
+    'stop_times': 'trip_id',
+}
+
+#-------------------------------------------------------------------------------
+
+def intervalos_bytes(caminho: str, particoes: int):
+    """
+    Divide um CSV em `particoes` intervalos de bytes alinhados com o início das
+    linhas. Retorna o cabeçalho e a lista de (inicio, fim). Campos entre aspas
+    com quebras de linha não são suportados (não ocorrem nos feeds GTFS).
+    """
+    tamanho = os.path.getsize(caminho)
+    with open(caminho, 'rb') as f:
+        cabecalho = f.readline()
+        inicio_dados = f.tell()
+
+        cortes = [inicio_dados]
+        for i in range(1, particoes):
+            alvo = inicio_dados + (tamanho - inicio_dados) * i // particoes
+            if alvo <= cortes[-1]:
+                continue
+            f.seek(alvo)
+            f.readline()
+            corte = min(f.tell(), tamanho)
+            if corte > cortes[-1]:
+                cortes.append(corte)
+        cortes.append(tamanho)
+
+    intervalos = [(a, b) for a, b in zip(cortes, cortes[1:]) if b > a]
+    return cabecalho, intervalos
+
+def _ler_intervalo(nome: str, caminho: str, cabecalho: bytes, inicio: int, fim: int, chunksize: int):
+    "Lê um intervalo de bytes do CSV como DataFrames de até `chunksize` linhas."
+
+    with open(caminho, 'rb') as f:
+        f.seek(inicio)
+        dados = f.read(fim - inicio)
+    opcoes = csvToRdf.opcoes_leitura(nome, caminho)
+    yield from panda.read_csv(io.BytesIO(cabecalho + dados), chunksize=chunksize, **opcoes)
+
+def _ler_hash(nome: str, caminho: str, coluna: str, particao: int, particoes: int, chunksize: int):
+    """
+    Lê o CSV inteiro e mantém só as linhas cuja `coluna` cai nesta partição.
+    Garante que todas as linhas de uma mesma viagem (ou shape) fiquem juntas,
+    ao custo de cada processo percorrer o arquivo todo.
+    """
+    opcoes = csvToRdf.opcoes_leitura(nome, caminho)
+    for df in panda.read_csv(caminho, chunksize=chunksize, **opcoes):
+        chaves = panda.util.hash_pandas_object(df[coluna].astype(str), index=False)
+        yield df[(chaves % particoes).to_numpy() == particao]
+
+#-------------------------------------------------------------------------------
+
+def _converter_particao(tarefa):
+    "Converte uma partição de uma tabela em um shard N-Triples (roda no worker)."
+
+    nome, caminho, destino, leitura, chunksize = tarefa
+    with EscritorNTriples(destino) as escritor:
+        if leitura[0] == 'bytes':
+            _, cabecalho, inicio, fim = leitura
+            partes = _ler_intervalo(nome, caminho, cabecalho, inicio, fim, chunksize)
+        else:
+            _, coluna, particao, particoes = leitura
+            partes = _ler_hash(nome, caminho, coluna, particao, particoes, chunksize)
+
+        if nome in csvToRdf.TABELAS_AGRUPADAS:
+            # Os pontos de um shape precisam ser convertidos juntos.
+            partes = [panda.concat(list(partes), ignore_index=True)]
+        for df in partes:
+            escritor.escrever_blocos(colunar.CONVERSORES[nome](df))
+    return destino, escritor.triplas
+
+def _converter_pequenas(tarefa):
+    "Converte as tabelas pequenas num único shard (roda no worker)."
+
+    tabelas, base_dir, destino = tarefa
+    csvToRdf.BASE_DIR = base_dir
+    with EscritorNTriples(destino) as escritor:
+        for nome in tabelas:
+            escritor.escrever_blocos(colunar.CONVERSORES[nome](csvToRdf.ler_tabela(nome)))
+    return destino, escritor.triplas
+
+def _converter_padroes(tarefa):
+    "Gera as triplas derivadas dos padrões de parada num shard próprio (roda no worker)."
+
+    base_dir, destino = tarefa
+    csvToRdf.BASE_DIR = base_dir
+    with EscritorNTriples(destino) as escritor:
+        escritor.escrever_blocos(colunar.triplas_padroes(
+            csvToRdf.ler_tabela('stop_times', colunas=csvToRdf.COLUNAS_PADROES['stop_times']),
+            csvToRdf.ler_tabela('trips', colunas=csvToRdf.COLUNAS_PADROES['trips']),
+        ))
+    return destino, escritor.triplas
+
+def _converter_partidas(tarefa):
+    "Gera as triplas derivadas do nível de serviço (partidas por hora) num shard próprio (roda no worker)."
+
+    import frequencias
+    base_dir, destino = tarefa
+    csvToRdf.BASE_DIR = base_dir
+    with EscritorNTriples(destino) as escritor:
+        escritor.escrever_blocos(frequencias.triplas_partidas(*frequencias.ler_tabelas()))
+    return destino, escritor.triplas
+
+def _converter_jornadas(tarefa):
+    "Converte stop_times no modo compacto (padrões de jornada) num shard próprio (roda no worker)."
+
+    import jornadas
+    base_dir, destino = tarefa
+    csvToRdf.BASE_DIR = base_dir
+    with EscritorNTriples(destino) as escritor:
+        escritor.escrever_blocos(jornadas.triplas_stop_times_compactas(
+            csvToRdf.ler_tabela('stop_times'),
+            csvToRdf.ler_tabela('trips', colunas=csvToRdf.COLUNAS_PADROES['trips']),
+        ))
+    return destino, escritor.triplas
+
+def _tarefas(nome, caminho, dir_shards, extensao, workers, modo, chunksize):
+    "Monta as tarefas de conversão das partições de uma tabela grande."
+
+    if modo == 'hash' or nome in csvToRdf.TABELAS_AGRUPADAS:
+        coluna = TABELAS_PARTICIONADAS[nome]
+        leituras = [('hash', coluna, i, workers) for i in range(workers)]
+    else:
+        cabecalho, intervalos = intervalos_bytes(caminho, workers)
+        leituras = [('bytes', cabecalho, inicio, fim) for inicio, fim in intervalos]
+
+    return [
+        (nome, caminho, f'{dir_shards}/{nome}-{i:04d}{extensao}', leitura, chunksize)
+        for i, leitura in enumerate(leituras)
+    ]
+
+#-------------------------------------------------------------------------------
+
+def generate_rdf_paralelo(
+    destino: str = './gtfs.nt.gz',
+    workers: int = None,
+    modo: str = 'linhas',
+    chunksize: int = 200_000,
+    concatenar: bool = True,
+    printSteps: bool = False,
+    compacto: bool = False,
+):
+    """
+    Gera o RDF do GTFS usando um pool de processos. `modo` escolhe como as
+    tabelas grandes são particionadas: 'linhas' (intervalos de bytes do CSV,
+    cada processo lê só sua fatia) ou 'hash' (pela coluna de agrupamento, ex.:
+    trip_id; shapes são sempre particionados assim). Com `concatenar`, os shards viram o arquivo `destino`; senão,
+    ficam no diretório `destino + '.shards'` para o carregador em massa.
+    Com `compacto`, stop_times é modelado por padrões de jornada num único
+    processo, já que os padrões dependem de todas as viagens.
+    """
+    workers = workers or os.cpu_count()
+    extensao = '.nt.gz' if destino.endswith('.gz') else '.nt'
+    dir_shards = destino + '.shards'
+    os.makedirs(dir_shards, exist_ok=True)
+
+    tarefas = []
+    for nome in TABELAS_PARTICIONADAS:
+        if compacto and nome == 'stop_times':
+            continue
+        caminho = f'{csvToRdf.BASE_DIR}/{nome}.csv'
+        if os.path.exists(caminho):
+            tarefas += _tarefas(nome, caminho, dir_shards, extensao, workers, modo, chunksize)
+
+    if(printSteps): print(f"Convertendo {len(tarefas)} partições com {workers} processos...")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pequenas = pool.submit(_converter_pequenas, (TABELAS_PEQUENAS, csvToRdf.BASE_DIR, f'{dir_shards}/tabelas{extensao}'))
+        padroes = pool.submit(_converter_padroes, (csvToRdf.BASE_DIR, f'{dir_shards}/padroes{extensao}'))
+        partidas = pool.submit(_converter_partidas, (csvToRdf.BASE_DIR, f'{dir_shards}/partidas{extensao}'))
+        extras = [padroes, partidas]
+        if compacto:
+            extras.append(pool.submit(_converter_jornadas, (csvToRdf.BASE_DIR, f'{dir_shards}/jornadas{extensao}')))
+        resultados = list(pool.map(_converter_particao, tarefas))
+        shards = [pequenas.result()] + [f.result() for f in extras] + resultados
+
+    total = sum(triplas for _, triplas in shards)
+    if(printSteps): print(f"{total} triplas em {len(shards)} shards")
+
+    if concatenar:
+        # Membros gzip concatenados formam um arquivo gzip válido, então os
+        # shards podem ser unidos byte a byte nos dois formatos.
+        with open(destino, 'wb') as saida:
+            for shard, _ in shards:
+                with open(shard, 'rb') as entrada:
+                    shutil.copyfileobj(entrada, saida, 1 << 20)
+        shutil.rmtree(dir_shards)
+
+    return total
@@ -0,0 +1,347 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as panda
+
+import csvToRdf
+import versao_dados
+from frequencias import expandir_frequencias
+from indice_espacial import IndiceParadas, haversine
+
+# Motor de roteamento em memória (RAPTOR, Delling et al.). As viagens são
+# agrupadas em padrões (sequências idênticas de paradas) e, para cada padrão,
+# os horários ficam em matrizes viagens x paradas ordenadas pelo horário de
+# partida. A consulta avança em rodadas: a rodada k encontra a chegada mais
+# cedo usando até k viagens, com caminhadas entre paradas próximas.
+
+VELOCIDADE_CAMINHADA = 1.2      # m/s
+RAIO_TRANSFERENCIA = 400        # m
+MAX_TRANSFERENCIAS = 4
+
+INFINITO = np.iinfo(np.int32).max
+
+_SEM_PAI, _PAI_VIAGEM, _PAI_CAMINHADA = 0, 1, 2
+
+#-------------------------------------------------------------------------------
+
+class Roteador:
+    """
+    Estruturas do RAPTOR. Tudo é indexado por inteiros: paradas (0..S-1),
+    padrões (0..P-1) e viagens dentro de cada padrão (ordenadas pela partida).
+    """
+
+    def __init__(self, stops, stop_times, trips, frequencies=None):
+        # Paradas
+        stops = stops.dropna(subset=['stop_lat', 'stop_lon'])
+        self.stop_ids = stops['stop_id'].astype(str).to_numpy(dtype=object)
+        self.indice = IndiceParadas(self.stop_ids, stops['stop_lat'], stops['stop_lon'])
+        posicao_parada = panda.Series(np.arange(len(self.stop_ids)), index=self.stop_ids)
+        self._posicao = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+
+        # Horários: segundos, com os horários em branco interpolados dentro de
+        # cada viagem. Os que ficam antes do primeiro ou depois do último
+        # horário conhecido da viagem continuam em branco e a parada é descartada.
+        st = stop_times[['trip_id', 'stop_id', 'stop_sequence', 'arrival_time_s', 'departure_time_s']].copy()
+        st['trip_id'] = st['trip_id'].astype(str)
+        st = st.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+        st['arrival_time_s'] = st['arrival_time_s'].fillna(st['departure_time_s'])
+        st['departure_time_s'] = st['departure_time_s'].fillna(st['arrival_time_s'])
+        horarios = ['arrival_time_s', 'departure_time_s']
+        st[horarios] = st[horarios].astype('float64')
+        st[horarios] = st.groupby('trip_id', sort=False)[horarios].transform(lambda s: s.interpolate(limit_area='inside'))
+        st = expandir_frequencias(st, frequencies)
+        st = st.sort_values(['trip_id', 'stop_sequence'], kind='stable')
+
+        st['parada'] = posicao_parada.reindex(st['stop_id'].astype(str)).to_numpy()
+        st = st.dropna(subset=['parada', 'arrival_time_s', 'departure_time_s'])
+        st['parada'] = st['parada'].astype(np.int32)
+
+        # Padrões: viagens com a mesma sequência de paradas.
+        sequencias = st.groupby('trip_id', sort=False)['parada'].agg(tuple)
+        codigos, unicos = panda.factorize(sequencias)
+        viagens = panda.DataFrame({'trip_id': sequencias.index, 'padrao': codigos})
+        viagens['partida'] = st.groupby('trip_id', sort=False)['departure_time_s'].first().to_numpy()
+        viagens = viagens.sort_values(['padrao', 'partida', 'trip_id'], kind='stable').reset_index(drop=True)
+
+        rotas = trips.assign(trip_id=trips['trip_id'].astype(str)).set_index('trip_id')['route_id'].astype(str)
+        base_ids = viagens['trip_id'].str.split('@').str[0]
+        viagens['route_id'] = rotas.reindex(base_ids).to_numpy()
+
+        st = st.merge(viagens[['trip_id', 'padrao', 'partida']], on='trip_id')
+        st = st.sort_values(['padrao', 'partida', 'trip_id', 'stop_sequence'], kind='stable')
+
+        self.padrao_paradas = [np.asarray(u, dtype=np.int32) for u in unicos]
+        self.padrao_chegadas, self.padrao_partidas, self.padrao_viagens, self.padrao_rotas = [], [], [], []
+        chegadas = st['arrival_time_s'].to_numpy(np.int32)
+        partidas = st['departure_time_s'].to_numpy(np.int32)
+        inicio = 0
+        for p, grupo in viagens.groupby('padrao', sort=True):
+            n_viagens, n_paradas = len(grupo), len(self.padrao_paradas[p])
+            fim = inicio + n_viagens * n_paradas
+            self.padrao_chegadas.append(chegadas[inicio:fim].reshape(n_viagens, n_paradas))
+            self.padrao_partidas.append(partidas[inicio:fim].reshape(n_viagens, n_paradas))
+            self.padrao_viagens.append(grupo['trip_id'].to_numpy(dtype=object))
+            self.padrao_rotas.append(grupo['route_id'].to_numpy(dtype=object))
+            inicio = fim
+
+        # Parada -> padrões que passam por ela (CSR).
+        pares = np.concatenate([np.stack([paradas, np.full(len(paradas), p, np.int32)], axis=1) for p, paradas in enumerate(self.padrao_paradas)]) \
+            if self.padrao_paradas else np.empty((0, 2), np.int32)
+        pares = np.unique(pares, axis=0)
+        self.parada_padroes_ptr = np.searchsorted(pares[:, 0], np.arange(len(self.stop_ids) + 1)).astype(np.int64)
+        self.parada_padroes = pares[:, 1].astype(np.int32)
+
+        # Transferências a pé entre paradas próximas (CSR).
+        self._montar_caminhadas()
+
+    def _montar_caminhadas(self):
+        origens, destinos, distancias = self.indice.pares_no_raio(RAIO_TRANSFERENCIA)
+        self.caminhada_ptr = np.searchsorted(origens, np.arange(len(self.stop_ids) + 1)).astype(np.int64)
+        self.caminhada_destinos = destinos.astype(np.int32)
+        self.caminhada_duracoes = np.ceil(distancias / VELOCIDADE_CAMINHADA).astype(np.int32)
+
+    @classmethod
+    def do_feed(cls):
+        "Monta o roteador a partir dos CSVs em csvToRdf.BASE_DIR."
+
+        frequencies = None
+        if os.path.exists(f'{csvToRdf.BASE_DIR}/frequencies.csv'):
+            frequencies = csvToRdf.ler_tabela('frequencies', parse_horarios=True)
+        return cls(
+            csvToRdf.ler_tabela('stops'),
+            csvToRdf.ler_tabela('stop_times', parse_horarios=True),
+            csvToRdf.ler_tabela('trips'),
+            frequencies,
+        )
+
+    #---------------------------------------------------------------------------
+
+    def _relaxar_caminhadas(self, tau, melhor, marcadas, pai):
+        "Propaga as chegadas das paradas marcadas para as vizinhas a pé."
+
+        origens = np.flatnonzero(marcadas)
+        if not len(origens):
+            return
+        inicios, fins = self.caminhada_ptr[origens], self.caminhada_ptr[origens + 1]
+        tamanhos = fins - inicios
+        if not tamanhos.sum():
+            return
+        arestas = np.repeat(inicios - np.cumsum(tamanhos) + tamanhos, tamanhos) + np.arange(tamanhos.sum())
+        de = np.repeat(origens, tamanhos)
+        para = self.caminhada_destinos[arestas]
+        chegada = tau[de].astype(np.int64) + self.caminhada_duracoes[arestas]
+
+        melhora = chegada < melhor[para]
+        de, para, chegada = de[melhora], para[melhora], chegada[melhora]
+        ordem = np.lexsort((chegada, para))
+        de, para, chegada = de[ordem], para[ordem], chegada[ordem]
+        primeiro = np.ones(len(para), bool)
+        primeiro[1:] = para[1:] != para[:-1]
+        de, para, chegada = de[primeiro], para[primeiro], chegada[primeiro]
+
+        tau[para] = chegada
+        melhor[para] = chegada
+        marcadas[para] = True
+        pai['tipo'][para] = _PAI_CAMINHADA
+        pai['de'][para] = de
+
+    def _rodadas(self, origem: int, partida: int, max_transferencias: int):
+        "Executa o RAPTOR a partir de uma parada; retorna (taus, pais) por rodada."
+
+        n = len(self.stop_ids)
+        melhor = np.full(n, INFINITO, np.int64)
+        tau = np.full(n, INFINITO, np.int64)
+        tau[origem] = melhor[origem] = partida
+        marcadas = np.zeros(n, bool)
+        marcadas[origem] = True
+
+        def novo_pai():
+            return {campo: np.full(n, -1, np.int32) for campo in ('tipo', 'de', 'padrao', 'viagem', 'embarque', 'desembarque')}
+
+        pai = novo_pai()
+        pai['tipo'][:] = _SEM_PAI
+        self._relaxar_caminhadas(tau, melhor, marcadas, pai)
+        taus, pais = [tau.copy()], [pai]
+
+        for _ in range(max_transferencias + 1):
+            anterior = taus[-1]
+            tau = anterior.copy()
+            pai = novo_pai()
+            pai['tipo'][:] = _SEM_PAI
+            novas = np.zeros(n, bool)
+
+            paradas = np.flatnonzero(marcadas)
+            tamanhos = self.parada_padroes_ptr[paradas + 1] - self.parada_padroes_ptr[paradas]
+            indices = np.repeat(self.parada_padroes_ptr[paradas] - np.cumsum(tamanhos) + tamanhos, tamanhos) + np.arange(tamanhos.sum())
+            padroes = np.unique(self.parada_padroes[indices])
+
+            for p in padroes:
+                sequencia = self.padrao_paradas[p]
+                partidas = self.padrao_partidas[p]
+                limites = anterior[sequencia]
+
+                # Primeira viagem que pode ser tomada em cada posição...
+                pode = partidas >= limites
+                embarque = np.where(pode.any(axis=0), pode.argmax(axis=0), len(partidas))
+                embarque[limites >= INFINITO] = len(partidas)
+
+                # ...e a viagem em que se está em cada posição, embarcando antes dela.
+                tamanho = len(sequencia)
+                chave = np.minimum.accumulate(embarque.astype(np.int64) * tamanho + np.arange(tamanho))
+                chave = np.concatenate([[len(partidas) * tamanho], chave[:-1]])
+                viagem, posicao_embarque = chave // tamanho, chave % tamanho
+
+                validas = np.flatnonzero(viagem < len(partidas))
+                if not len(validas):
+                    continue
+                chegada = self.padrao_chegadas[p][viagem[validas], validas].astype(np.int64)
+                destinos = sequencia[validas]
+                melhora = chegada < melhor[destinos]
+                if not melhora.any():
+                    continue
+
+                for i, destino, valor in zip(validas[melhora], destinos[melhora], chegada[melhora]):
+                    if valor < melhor[destino]:
+                        tau[destino] = melhor[destino] = valor
+                        novas[destino] = True
+                        pai['tipo'][destino] = _PAI_VIAGEM
+                        pai['padrao'][destino] = p
+                        pai['viagem'][destino] = viagem[i]
+                        pai['embarque'][destino] = posicao_embarque[i]
+                        pai['desembarque'][destino] = i
+
+            if not novas.any():
+                break
+            marcadas = novas
+            self._relaxar_caminhadas(tau, melhor, marcadas, pai)
+            taus.append(tau)
+            pais.append(pai)
+
+        return taus, pais
+
+    #---------------------------------------------------------------------------
+
+    def chegadas(self, origem_stop_id, partida: int, max_transferencias: int = MAX_TRANSFERENCIAS):
+        """
+        Horário de chegada mais cedo (em segundos, INFINITO se inalcançável) e
+        número de viagens usadas para todas as paradas, partindo de uma parada.
+        """
+        return self.chegadas_indice(self._parada(origem_stop_id), partida, max_transferencias)
+
+    def chegadas_indice(self, origem: int, partida: int, max_transferencias: int = MAX_TRANSFERENCIAS):
+        "Como `chegadas`, com a origem dada pela posição da parada em self.stop_ids (a mesma do índice espacial)."
+
+        taus, _ = self._rodadas(origem, partida, max_transferencias)
+        taus = np.stack(taus)
+        return taus.min(axis=0), np.argmin(taus, axis=0)
+
+    def consultar(self, origem_stop_id, destino_stop_id, partida: int, max_transferencias: int = MAX_TRANSFERENCIAS):
+        """
+        Itinerário de chegada mais cedo entre duas paradas, saindo a partir de
+        `partida` (segundos desde o início do dia de serviço). Retorna uma lista
+        de trechos (dicts com 'tipo' 'viagem' ou 'caminhada') ou None.
+        """
+        origem, destino = self._parada(origem_stop_id), self._parada(destino_stop_id)
+        taus, pais = self._rodadas(origem, partida, max_transferencias)
+
+        rodadas = [k for k, tau in enumerate(taus) if tau[destino] < INFINITO]
+        if not rodadas:
+            return None
+        k = min(rodadas, key=lambda r: (taus[r][destino], r))
+        return self._reconstruir(pais, k, origem, destino)
+
+    def _parada(self, stop_id) -> int:
+        try:
+            return self._posicao[str(stop_id)]
+        except KeyError:
+            raise KeyError(f"Parada {stop_id} não existe no feed") from None
+
+    def _reconstruir(self, pais, k, origem, destino):
+        trechos = []
+        parada = destino
+        while parada != origem:
+            pai = pais[k]
+            tipo = pai['tipo'][parada]
+            if tipo == _PAI_CAMINHADA:
+                de = int(pai['de'][parada])
+                distancia = haversine(self.indice.lats[de], self.indice.lons[de], self.indice.lats[parada], self.indice.lons[parada])
+                trechos.append({
+                    'tipo': 'caminhada',
+                    'paradas': [self.stop_ids[de], self.stop_ids[parada]],
+                    'coordenadas': [self._coordenada(de), self._coordenada(parada)],
+                    'duracao': int(np.ceil(distancia / VELOCIDADE_CAMINHADA)),
+                })
+                parada = de
+            elif tipo == _PAI_VIAGEM:
+                p, v = pai['padrao'][parada], pai['viagem'][parada]
+                i, j = pai['embarque'][parada], pai['desembarque'][parada]
+                sequencia = self.padrao_paradas[p][i:j + 1]
+                trechos.append({
+                    'tipo': 'viagem',
+                    'trip_id': self.padrao_viagens[p][v],
+                    'route_id': self.padrao_rotas[p][v],
+                    'paradas': [self.stop_ids[s] for s in sequencia],
+                    'coordenadas': [self._coordenada(s) for s in sequencia],
+                    'horarios': [int(self.padrao_partidas[p][v, i])] + [int(h) for h in self.padrao_chegadas[p][v, i + 1:j + 1]],
+                })
+                parada = int(self.padrao_paradas[p][i])
+                k -= 1
+            else:
+                # Chegada herdada de uma rodada anterior.
+                k -= 1
+        return trechos[::-1]
+
+    def _coordenada(self, parada):
+        return (float(self.indice.lats[parada]), float(self.indice.lons[parada]))
+
+#-------------------------------------------------------------------------------
+
+_roteador = None
+_roteador_assinatura = None
+
+def roteador_padrao(cache: str = None) -> Roteador:
+    """
+    Roteador do feed em csvToRdf.BASE_DIR, mantido em memória e salvo em
+    `cache` (por padrão, roteador.pkl dentro de BASE_DIR) para que as próximas
+    execuções não precisem remontá-lo. O cache guarda a assinatura do feed
+    (versao_dados.assinatura_feed) e só é usado se ela for a atual, então mudar de feed ou
+    alterar qualquer CSV refaz o roteador. `cache=''` desliga o arquivo.
+    """
+    global _roteador, _roteador_assinatura
+
+    assinatura = versao_dados.assinatura_feed(csvToRdf.BASE_DIR)
+    if _roteador is not None and _roteador_assinatura == assinatura:
+        return _roteador
+
+    if cache is None:
+        cache = os.path.join(assinatura['base_dir'], 'roteador.pkl')
+    if cache and os.path.exists(cache):
+        # A assinatura vem antes do roteador no arquivo: um cache de outro
+        # feed é descartado sem desserializar o roteador.
+        with open(cache, 'rb') as f:
+            if pickle.load(f) == assinatura:
+                _roteador, _roteador_assinatura = pickle.load(f), assinatura
+                return _roteador
+
+    _roteador, _roteador_assinatura = Roteador.do_feed(), assinatura
+    if cache:
+        try:
+            with open(cache, 'wb') as f:
+                pickle.dump(assinatura, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(_roteador, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as erro:
+            print(f"Aviso: não foi possível salvar o roteador em {cache}: {erro}")
+    return _roteador
+
+def descartar_roteador(remover_cache: bool = False):
+    """
+    Descarta o roteador em memória de roteador_padrao e, com `remover_cache`,
+    também o roteador.pkl do feed atual, para que o próximo seja remontado.
+    """
+    global _roteador, _roteador_assinatura
+
+    _roteador, _roteador_assinatura = None, None
+    cache = os.path.join(csvToRdf.BASE_DIR, 'roteador.pkl')
+    if remover_cache and os.path.exists(cache):
+        os.remove(cache)
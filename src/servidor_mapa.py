@@ -0,0 +1,378 @@
+import json
+import sys
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import heatmap
+import sparql
+from geometria import douglas_peucker, recortar_linha
+
+# Servidor de mapa interativo. Em vez de um HTML estático com todos os pontos
+# embutidos, a página base (um mapa folium vazio) busca, a cada movimento do
+# mapa, só os tiles Web Mercator visíveis de cada camada, como GeoJSON:
+#   - calor: paradas agregadas na grade do zoom (heatmap.py), com peso;
+#   - linhas: traçados dos shapes recortados no tile, simplificados a ~1 pixel;
+#   - paradas: cada parada do tile (só a partir de ZOOM_PARADAS).
+# As paradas de cada tile são filtradas no repositório pelo retângulo do tile
+# (sparql.paradas_na_area). As respostas ficam num cache LRU por tile, que é
+# esvaziado quando a versão do repositório muda.
+
+ZOOM_MIN, ZOOM_MAX = heatmap.ZOOMS[0], heatmap.ZOOMS[-1]     # níveis dos tiles pedidos
+ZOOM_LINHAS = 11            # a partir deste zoom os traçados são desenhados
+ZOOM_PARADAS = 14           # a partir deste zoom as paradas são desenhadas uma a uma
+CAPACIDADE_CACHE = 4096     # tiles mantidos em memória
+CAMADAS = ('calor', 'linhas', 'paradas')
+CENTRO = (-22.9, -43.4)
+
+#-------------------------------------------------------------------------------
+
+class CacheTiles:
+    "Cache LRU das respostas já codificadas, por chave (versão, camada, zoom, x, y)."
+
+    def __init__(self, capacidade: int = CAPACIDADE_CACHE):
+        self.capacidade = capacidade
+        self.acertos = self.faltas = 0
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def obter(self, chave, gerar) -> bytes:
+        "Retorna a resposta em cache ou a gera com `gerar()` e a guarda."
+
+        with self._trava:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+        valor = gerar()
+        with self._trava:
+            self.faltas += 1
+            self._itens[chave] = valor
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+        return valor
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+
+#-------------------------------------------------------------------------------
+
+def _colecao(features: list) -> dict:
+    return {'type': 'FeatureCollection', 'features': features}
+
+def geojson_paradas(area) -> dict:
+    "Paradas do retângulo `area`, como pontos GeoJSON."
+
+    paradas = sparql.paradas_na_area(area)
+    if paradas.empty:
+        return _colecao([])
+    return _colecao([
+        {
+            'type': 'Feature', 'id': stop,
+            'geometry': {'type': 'Point', 'coordinates': [round(lon, 6), round(lat, 6)]},
+            'properties': {'stop': stop},
+        }
+        for stop, lat, lon in zip(paradas['stop'], paradas['lat'].tolist(), paradas['lon'].tolist())
+    ])
+
+def geojson_calor(area, zoom: int, peso: str = 'partidas') -> dict:
+    """
+    Pontos do heatmap do retângulo `area`: as paradas somadas na grade do
+    `zoom` (uma célula a cada heatmap.PIXELS_POR_CELULA pixels), pesando cada
+    parada pelas partidas por dia (peso='partidas') ou por 1.
+    """
+    paradas = sparql.paradas_na_area(area, partidas=peso == 'partidas')
+    if paradas.empty:
+        return _colecao([])
+    pesos = paradas['partidas'].to_numpy() if peso == 'partidas' else None
+    lats, lons, somas = heatmap.agregar_grade(paradas['lat'], paradas['lon'], pesos, heatmap.tamanho_celula(zoom))
+    return _colecao([
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [round(lon, 5), round(lat, 5)]},
+            'properties': {'peso': s},
+        }
+        for lat, lon, s in zip(lats.tolist(), lons.tolist(), somas.tolist())
+    ])
+
+class Tracados:
+    "Traçados dos shapes em memória, com o retângulo de cada um para a seleção por tile."
+
+    def __init__(self, geometrias):
+        self.ids, self.linhas, self.lats, self.lons = [], [], [], []
+        for shape, linha, wkt in zip(geometrias['shape'], geometrias['short_name'], geometrias['wkt']) if len(geometrias) else ():
+            pontos = np.asarray(sparql.wkt_para_coordenadas(wkt))
+            self.ids.append(f'{shape}#{linha}')
+            self.linhas.append(linha)
+            self.lats.append(pontos[:, 0])
+            self.lons.append(pontos[:, 1])
+        self.limites = np.array(
+            [(la.min(), lo.min(), la.max(), lo.max()) for la, lo in zip(self.lats, self.lons)]
+        ).reshape(-1, 4)
+
+    def geojson(self, area, zoom: int) -> dict:
+        """
+        Traçados recortados no retângulo `area` (só os trechos dentro dele) e
+        simplificados para a resolução do `zoom`.
+        """
+        lat_min, lon_min, lat_max, lon_max = area
+        cruzam = np.flatnonzero(
+            (self.limites[:, 0] <= lat_max) & (self.limites[:, 2] >= lat_min) &
+            (self.limites[:, 1] <= lon_max) & (self.limites[:, 3] >= lon_min)
+        )
+        tolerancia = heatmap.tamanho_celula(zoom) / heatmap.PIXELS_POR_CELULA
+        features = []
+        for i in cruzam.tolist():
+            partes = []
+            for lats, lons in recortar_linha(self.lats[i], self.lons[i], area):
+                manter = douglas_peucker(lats, lons, tolerancia)
+                partes.append(np.column_stack([lons[manter], lats[manter]]).round(5).tolist())
+            if not partes:
+                continue
+            geometria = {'type': 'LineString', 'coordinates': partes[0]} if len(partes) == 1 \
+                else {'type': 'MultiLineString', 'coordinates': partes}
+            features.append({
+                'type': 'Feature', 'id': self.ids[i],
+                'geometry': geometria,
+                'properties': {'linha': self.linhas[i]},
+            })
+        return _colecao(features)
+
+#-------------------------------------------------------------------------------
+
+_SCRIPT = """
+(function() {
+    var mapa = %(mapa)s;
+    var ZOOM_MIN = %(zoom_min)d, ZOOM_MAX = %(zoom_max)d, ZOOM_LINHAS = %(zoom_linhas)d, ZOOM_PARADAS = %(zoom_paradas)d;
+
+    var calor = L.heatLayer([], {radius: 10, blur: 15, minOpacity: 0.3}).addTo(mapa);
+    var linhas = L.geoJSON(null, {
+        style: {color: 'red', weight: 2, opacity: 0.6},
+        onEachFeature: function(f, camada) { camada.bindPopup('Linha ' + f.properties.linha); }
+    }).addTo(mapa);
+    var paradas = L.geoJSON(null, {
+        pointToLayer: function(f, ll) { return L.circleMarker(ll, {radius: 4, color: 'blue', fillOpacity: 0.7}); },
+        onEachFeature: function(f, camada) { camada.bindPopup(f.properties.stop); }
+    }).addTo(mapa);
+
+    var nivel = null, pedidos = {}, vistos = {}, pontos = [], maior = 0;
+
+    function tilesVisiveis(z) {
+        var b = mapa.getBounds(), n = Math.pow(2, z);
+        function tx(lon) { return Math.min(Math.max(Math.floor((lon + 180) / 360 * n), 0), n - 1); }
+        function ty(lat) {
+            var r = Math.max(Math.min(lat, 85.0511), -85.0511) * Math.PI / 180;
+            return Math.min(Math.max(Math.floor((1 - Math.asinh(Math.tan(r)) / Math.PI) / 2 * n), 0), n - 1);
+        }
+        var lista = [];
+        for (var x = tx(b.getWest()); x <= tx(b.getEast()); x++)
+            for (var y = ty(b.getNorth()); y <= ty(b.getSouth()); y++)
+                lista.push(z + '/' + x + '/' + y);
+        return lista;
+    }
+
+    function carregar(camada, tile, tratar) {
+        var chave = camada + '/' + tile;
+        if (pedidos[chave]) return;
+        pedidos[chave] = true;
+        var z = nivel;
+        fetch('tiles/' + chave + '.geojson')
+            .then(function(r) { return r.json(); })
+            .then(function(dados) { if (z === nivel) tratar(dados.features); });
+    }
+
+    function novas(camada, features) {
+        return features.filter(function(f) {
+            var chave = camada + f.id;
+            if (vistos[chave]) return false;
+            vistos[chave] = true;
+            return true;
+        });
+    }
+
+    function atualizar() {
+        var zoom = mapa.getZoom(), z = Math.min(Math.max(zoom, ZOOM_MIN), ZOOM_MAX);
+        if (z !== nivel) {
+            nivel = z; pedidos = {}; vistos = {}; pontos = []; maior = 0;
+            calor.setLatLngs([]); linhas.clearLayers(); paradas.clearLayers();
+        }
+        tilesVisiveis(z).forEach(function(tile) {
+            carregar('calor', tile, function(features) {
+                features.forEach(function(f) {
+                    pontos.push([f.geometry.coordinates[1], f.geometry.coordinates[0], f.properties.peso]);
+                    maior = Math.max(maior, f.properties.peso);
+                });
+                calor.setLatLngs(pontos.map(function(p) { return [p[0], p[1], maior ? p[2] / maior : 0]; }));
+            });
+            // Cada tile traz só os trechos dos traçados dentro dele: não há repetição entre tiles.
+            if (zoom >= ZOOM_LINHAS) carregar('linhas', tile, function(f) { linhas.addData(f); });
+            if (zoom >= ZOOM_PARADAS) carregar('paradas', tile, function(f) { paradas.addData(novas('paradas', f)); });
+        });
+    }
+
+    mapa.on('moveend', atualizar);
+    atualizar();
+})();
+"""
+
+def pagina_base(centro=CENTRO, zoom: int = 12) -> str:
+    "HTML da página base: um mapa folium sem dados, com o script que busca os tiles visíveis."
+
+    import folium
+    from folium.plugins import HeatMap
+
+    m = folium.Map(location=list(centro), zoom_start=zoom, min_zoom=ZOOM_MIN, tiles="cartodbpositron")
+    for _, url in HeatMap.default_js:
+        m.get_root().header.add_child(folium.JavascriptLink(url))
+    m.get_root().script.add_child(folium.Element(_SCRIPT % {
+        'mapa': m.get_name(), 'zoom_min': ZOOM_MIN, 'zoom_max': ZOOM_MAX,
+        'zoom_linhas': ZOOM_LINHAS, 'zoom_paradas': ZOOM_PARADAS,
+    }))
+    return m.get_root().render()
+
+#-------------------------------------------------------------------------------
+
+class _Requisicao(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status: int, corpo: bytes = b'', tipo: str = 'text/plain', cabecalhos: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        servidor = self.server.mapa
+        partes = urllib.parse.urlsplit(self.path).path.strip('/').split('/')
+
+        if partes == ['']:
+            self._responder(200, servidor.pagina(), 'text/html; charset=utf-8')
+            return
+
+        if len(partes) != 5 or partes[0] != 'tiles' or partes[1] not in CAMADAS or not partes[4].endswith('.geojson'):
+            self._responder(404, b'not found')
+            return
+        try:
+            zoom, x, y = int(partes[2]), int(partes[3]), int(partes[4][:-len('.geojson')])
+        except ValueError:
+            self._responder(400, b'invalid tile')
+            return
+        if not (ZOOM_MIN <= zoom <= ZOOM_MAX and 0 <= x < 2**zoom and 0 <= y < 2**zoom):
+            self._responder(400, b'invalid tile')
+            return
+
+        versao = servidor.versao()
+        etag = f'"{versao}"'
+        cabecalhos = {'ETag': etag, 'Cache-Control': f'max-age={sparql.INTERVALO_VERIFICACAO}'}
+        if self.headers.get('If-None-Match') == etag:
+            self._responder(304, cabecalhos=cabecalhos)
+            return
+        try:
+            corpo = servidor.tile(partes[1], zoom, x, y)
+        except Exception as erro:
+            self._responder(502, str(erro).encode())
+            return
+        self._responder(200, corpo, 'application/geo+json', cabecalhos)
+
+#-------------------------------------------------------------------------------
+
+class ServidorMapa:
+    """
+    Servidor HTTP do mapa interativo, numa thread própria, consultando o
+    backend de sparql.py. `url` é o endereço da página. `peso` escolhe o peso
+    do heatmap ('partidas' ou 'paradas'). Use como gerenciador de contexto ou
+    chame `fechar()` ao terminar.
+    """
+
+    def __init__(self, porta: int = 8000, peso: str = 'partidas', capacidade: int = CAPACIDADE_CACHE, endereco: str = '127.0.0.1'):
+        self.peso = peso
+        self.cache = CacheTiles(capacidade)
+        self._trava = threading.Lock()
+        self._versao, self._verificado_em = None, 0.0
+        self._pagina = self._tracados = None
+
+        self._servidor = ThreadingHTTPServer((endereco, porta), _Requisicao)
+        self._servidor.daemon_threads = True
+        self._servidor.mapa = self
+        self.url = f'http://{endereco}:{self._servidor.server_port}/'
+        self._thread = threading.Thread(target=self._servidor.serve_forever, name='servidor-mapa', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
+
+    def fechar(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    #---------------------------------------------------------------------------
+
+    def versao(self) -> str:
+        """
+        Versão do repositório, conferida no máximo a cada
+        sparql.INTERVALO_VERIFICACAO segundos. Quando muda, o cache de tiles e
+        os traçados em memória são descartados.
+        """
+        with self._trava:
+            agora = time.monotonic()
+            if self._versao is None or agora - self._verificado_em >= sparql.INTERVALO_VERIFICACAO:
+                versao = sparql.cliente.versao()
+                self._verificado_em = agora
+                if versao != self._versao:
+                    self._versao, self._tracados = versao, None
+                    self.cache.limpar()
+            return self._versao
+
+    def tracados(self) -> Tracados:
+        with self._trava:
+            if self._tracados is None:
+                self._tracados = Tracados(sparql.geometrias_shapes())
+            return self._tracados
+
+    def pagina(self) -> bytes:
+        if self._pagina is None:
+            self._pagina = pagina_base().encode('utf-8')
+        return self._pagina
+
+    def tile(self, camada: str, zoom: int, x: int, y: int) -> bytes:
+        "GeoJSON codificado de uma camada num tile, do cache ou consultado agora."
+
+        def gerar():
+            area = heatmap.limites_tile(x, y, zoom)
+            if camada == 'calor':
+                dados = geojson_calor(area, zoom, self.peso)
+            elif camada == 'linhas':
+                dados = self.tracados().geojson(area, zoom)
+            else:
+                dados = geojson_paradas(area)
+            return json.dumps(dados, separators=(',', ':')).encode('utf-8')
+
+        return self.cache.obter((self.versao(), camada, zoom, x, y), gerar)
+
+#-------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    # python servidor_mapa.py [porta]: serve o mapa até Ctrl+C
+    with ServidorMapa(int(sys.argv[1]) if len(sys.argv) > 1 else 8000) as servidor:
+        print(f"Mapa em {servidor.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
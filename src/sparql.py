@@ -1,15 +1,47 @@
-import folium
-from folium.plugins import HeatMap
-from folium.plugins import TimestampedGeoJson
 import datetime
-
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
+import time
 
 import numpy as np
-from SPARQLWrapper import SPARQLWrapper, JSON
 
-sparql = SPARQLWrapper("http://localhost:7200/repositories/gtfs-rj")
+from backends import BackendSobDemanda, criar_backend
+from cronometro import etapa
+from indice_espacial import IndiceParadas, RAIO_TERRA_M, haversine
+
+# Backend de consulta: o GraphDB por padrão, ou o definido em GTFS_SPARQL (uma
+# URL ou o caminho de um gtfs.ttl para consultar em processo; ver backends.py).
+# Só é criado na primeira consulta, então os processos que importam este
+# módulo apenas para desenhar mapas não abrem conexões nem carregam o grafo.
+cliente = BackendSobDemanda()
+
+# Intervalo mínimo, em segundos, entre duas verificações da versão do
+# repositório pelo índice de paradas.
+INTERVALO_VERIFICACAO = 60
+
+_indice = None
+_indice_versao = None
+_indice_verificado_em = 0.0
+
+# folium e matplotlib são importados dentro das funções que desenham mapas,
+# para que as consultas não paguem a importação das bibliotecas gráficas.
+
+# Tipos das colunas numéricas lidas com cliente.consultar_tabela.
+COORDENADAS = {'lat': 'float64', 'lon': 'float64'}
+
+def usar_backend(backend):
+    """
+    Troca o backend de consulta (uma URL, um caminho de arquivo RDF ou um
+    objeto backend já criado) e descarta o índice de paradas do anterior.
+    """
+    global cliente
+    cliente = criar_backend(backend) if isinstance(backend, str) else backend
+    descartar_indice()
+    return cliente
+
+def descartar_indice():
+    "Descarta o índice de paradas em memória; o próximo indice_paradas() o recarrega."
+
+    global _indice, _indice_versao, _indice_verificado_em
+    _indice, _indice_versao, _indice_verificado_em = None, None, 0.0
 
 #-------------------------------------------------------------------------------
 
@@ -17,56 +49,218 @@ def plot_paradas_linha(route_short_name):
     # 1. Descobre o URI da linha pelo short_name
     query_route = f"""
     PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
+    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
     SELECT ?route
     WHERE {{
       ?route a gtfs:Route ;
-             gtfs:shortName "{route_short_name}" .
+             gtfs:shortName "{route_short_name}"^^xsd:string .
     }}
     """
-    sparql.setQuery(query_route)
-    sparql.setReturnFormat(JSON)
-    results_route = sparql.query().convert()
+    results_route = cliente.consultar(query_route)
     if not results_route["results"]["bindings"]:
         print(f'Linha {route_short_name} não encontrada.')
         return
     route_uri = results_route["results"]["bindings"][0]["route"]["value"]
 
-    # 2. Busca todas as paradas de todas as viagens dessa linha
+    # 2. Busca as paradas atendidas pela linha (atalho gtfs:servesStop)
     query = f"""
     PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
     PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
     SELECT DISTINCT ?lat ?lon
     WHERE {{
-      ?trip gtfs:route <{route_uri}> .
-      ?stop_time gtfs:trip ?trip ; gtfs:stop ?stop .
+      <{route_uri}> gtfs:servesStop ?stop .
       ?stop geo:lat ?lat ; geo:long ?lon .
     }}
     """
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
-    results = sparql.query().convert()
-
-    coords = []
-    for r in results["results"]["bindings"]:
-        lat = float(r["lat"]["value"])
-        lon = float(r["lon"]["value"])
-        coords.append([lat, lon])
+    results = cliente.consultar_tabela(query, COORDENADAS)
+    coords = results[['lat', 'lon']].to_numpy().tolist() if len(results) else []
 
     if not coords:
         print("Nenhuma parada encontrada para essa linha.")
         return
 
+    # 3. Traçados da linha (uma geometria WKT por shape)
+    tracados = tracados_por_linha([route_short_name]).get(str(route_short_name), [])
+
+    salvar_mapa_paradas_linha(route_short_name, coords, tracados)
+
+def salvar_mapa_paradas_linha(route_short_name, coords, tracados=()):
+    """
+    Desenha as paradas (e, se informados, os traçados) de uma linha e salva o
+    mapa em ../map/paradas_linha_<linha>.html. Retorna o caminho do arquivo.
+    """
+    import folium
+
     lat_c = sum([c[0] for c in coords]) / len(coords)
     lon_c = sum([c[1] for c in coords]) / len(coords)
     m = folium.Map(location=[lat_c, lon_c], zoom_start=12, tiles="cartodbpositron")
+    for tracado in tracados:
+        folium.PolyLine(tracado, color="red", weight=3, opacity=0.7).add_to(m)
     for i, (lat, lon) in enumerate(coords):
         folium.CircleMarker([lat, lon], radius=4, color="blue", fill=True, fill_opacity=0.7, popup=f"Parada {i+1}").add_to(m)
-    m.save(f"../map/paradas_linha_{route_short_name}.html")
+    arquivo = f"../map/paradas_linha_{route_short_name}.html"
+    with etapa('renderizacao'):
+        m.save(arquivo)
     print(f"Mapa salvo como paradas_linha_{route_short_name}.html")
+    return arquivo
+
+def _valores_short_name(route_short_names) -> str:
+    "Cláusula VALUES que restringe ?short_name às linhas informadas ('' para todas)."
+
+    if route_short_names is None:
+        return ""
+    valores = " ".join(f'"{nome}"^^xsd:string' for nome in route_short_names)
+    return f"VALUES ?short_name {{ {valores} }}"
+
+def coordenadas_paradas_por_linha(route_short_names=None):
+    """
+    Busca, numa única query agrupada, as coordenadas das paradas de todas as
+    linhas (ou só das informadas) e retorna {short_name: [[lat, lon], ...]}.
+    """
+    filtro = _valores_short_name(route_short_names)
+
+    query = f"""
+    PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
+    PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
+    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+    SELECT DISTINCT ?short_name ?lat ?lon
+    WHERE {{
+      {filtro}
+      ?route a gtfs:Route ; gtfs:shortName ?short_name ; gtfs:servesStop ?stop .
+      ?stop geo:lat ?lat ; geo:long ?lon .
+    }}
+    """
+    results = cliente.consultar_tabela(query, COORDENADAS, cache=False)
+    if results.empty:
+        return {}
+    return {
+        nome: grupo[['lat', 'lon']].to_numpy().tolist()
+        for nome, grupo in results.groupby('short_name', sort=False)
+    }
+
+def wkt_para_coordenadas(wkt):
+    "Converte uma LINESTRING WKT (lon lat) na lista [[lat, lon], ...] usada pelo folium."
+
+    pontos = wkt[wkt.index("(") + 1:wkt.rindex(")")].split(",")
+    return [[float(lat), float(lon)] for lon, lat in (p.split() for p in pontos)]
+
+def tracados_por_linha(route_short_names=None):
+    """
+    Traçados dos shapes usados pelas viagens de todas as linhas (ou só das
+    informadas), a partir de geometrias_shapes. Retorna
+    {short_name: [[[lat, lon], ...], ...]}, um traçado por geometria distinta.
+    """
+    geometrias = geometrias_shapes(route_short_names)
+    if geometrias.empty:
+        return {}
+    linhas = {}
+    for nome, wkt in geometrias.drop_duplicates(['short_name', 'wkt'])[['short_name', 'wkt']].itertuples(index=False):
+        linhas.setdefault(nome, []).append(wkt_para_coordenadas(wkt))
+    return linhas
+
+def geometrias_shapes(route_short_names=None):
+    """
+    Geometrias dos shapes usados pelas viagens de todas as linhas (ou só das
+    informadas), numa única query. Retorna um DataFrame (shape, short_name,
+    wkt), com uma linha por shape e linha que o usa.
+    """
+    filtro = _valores_short_name(route_short_names)
+
+    query = f"""
+    PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
+    PREFIX geosparql: <http://www.opengis.net/ont/geosparql#>
+    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+    SELECT DISTINCT ?shape ?short_name ?wkt
+    WHERE {{
+      {filtro}
+      ?route a gtfs:Route ; gtfs:shortName ?short_name .
+      ?trip gtfs:route ?route ; gtfs:shape ?shape .
+      ?shape geosparql:hasGeometry/geosparql:asWKT ?wkt .
+    }}
+    """
+    return cliente.consultar_tabela(query, cache=False)
 
 #-------------------------------------------------------------------------------
 
-def encontrar_estacao_mais_proxima(lat, lon):
+# Consultas espaciais no servidor. As coordenadas das paradas são xsd:double,
+# então o repositório filtra retângulos pelo seu índice de literais numéricos
+# em vez de converter cada parada. Com USAR_GEOSPARQL (repositório com o
+# plugin GeoSPARQL do GraphDB ativo), os filtros usam as geometrias WKT das
+# paradas e o índice espacial do plugin.
+
+USAR_GEOSPARQL = False
+
+def _filtro_area(area, lat='?lat', lon='?lon'):
+    "FILTER SPARQL do retângulo `area` = (lat_min, lon_min, lat_max, lon_max), ou '' sem área."
+
+    if area is None:
+        return ""
+    lat_min, lon_min, lat_max, lon_max = (float(v) for v in area)
+    return f"FILTER({lat} >= {lat_min!r} && {lat} <= {lat_max!r} && {lon} >= {lon_min!r} && {lon} <= {lon_max!r})"
+
+def _poligono_area(area):
+    "O retângulo `area` como um POLYGON WKT (lon lat)."
+
+    lat_min, lon_min, lat_max, lon_max = (float(v) for v in area)
+    cantos = [(lon_min, lat_min), (lon_max, lat_min), (lon_max, lat_max), (lon_min, lat_max), (lon_min, lat_min)]
+    return "POLYGON((" + ", ".join(f"{x!r} {y!r}" for x, y in cantos) + "))"
+
+def area_do_raio(lat, lon, raio_m):
+    "Retângulo (lat_min, lon_min, lat_max, lon_max) que contém o círculo de `raio_m` metros em torno do ponto."
+
+    dlat = np.degrees(raio_m / RAIO_TERRA_M)
+    dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+    return (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+def paradas_na_area(area, partidas=False):
+    """
+    Paradas dentro do retângulo `area` = (lat_min, lon_min, lat_max, lon_max),
+    filtradas no servidor. Retorna um DataFrame (stop, lat, lon) e, com
+    `partidas`, a coluna partidas (partidas por dia, 0 nas paradas sem serviço).
+    """
+    if USAR_GEOSPARQL:
+        filtro = f"""
+        ?stop geosparql:hasGeometry/geosparql:asWKT ?wkt .
+        FILTER(geof:sfWithin(?wkt, "{_poligono_area(area)}"^^geosparql:wktLiteral))"""
+    else:
+        filtro = _filtro_area(area)
+
+    query = f"""
+    PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
+    PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
+    PREFIX geosparql: <http://www.opengis.net/ont/geosparql#>
+    PREFIX geof: <http://www.opengis.net/def/function/geosparql/>
+
+    SELECT ?stop ?lat ?lon {'?partidas' if partidas else ''}
+    WHERE {{
+      ?stop a gtfs:Stop ; geo:lat ?lat ; geo:long ?lon .
+      {filtro}
+      {'OPTIONAL { ?stop gtfs:departuresPerDay ?partidas }' if partidas else ''}
+    }}
+    """
+    results = cliente.consultar_tabela(query, dict(COORDENADAS, partidas='float64'))
+    if partidas:
+        results['partidas'] = results['partidas'].fillna(0) if 'partidas' in results else np.zeros(len(results))
+    return results
+
+def paradas_no_raio(lat, lon, raio_m):
+    """
+    Paradas a até `raio_m` metros do ponto, consultadas no servidor pelo
+    retângulo que contém o círculo e filtradas pela distância haversine.
+    Retorna um DataFrame (stop, lat, lon, distancia_m) da mais próxima à mais
+    distante. Para muitas consultas seguidas, encontrar_estacoes_proximas usa
+    o índice em memória.
+    """
+    paradas = paradas_na_area(area_do_raio(lat, lon, raio_m))
+    if paradas.empty:
+        return paradas.assign(distancia_m=np.empty(0))
+    paradas['distancia_m'] = haversine(lat, lon, paradas['lat'].to_numpy(), paradas['lon'].to_numpy())
+    paradas = paradas[paradas['distancia_m'] <= raio_m]
+    return paradas.sort_values('distancia_m', ignore_index=True)
+
+#-------------------------------------------------------------------------------
+
+def _carregar_indice_paradas():
     query = """
     PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
     PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
@@ -78,74 +272,80 @@ def encontrar_estacao_mais_proxima(lat, lon):
             geo:long ?stop_lon .
     }
     """
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
-    results = sparql.query().convert()
-
-    menor_dist = float('inf')
-    estacao_mais_proxima = None
-    for result in results["results"]["bindings"]:
-        stop = result["stop"]["value"]
-        stop_lat = float(result["stop_lat"]["value"])
-        stop_lon = float(result["stop_lon"]["value"])
-        dist = ((lat - stop_lat)**2 + (lon - stop_lon)**2)**0.5
-        if dist < menor_dist:
-            menor_dist = dist
-            estacao_mais_proxima = (stop, stop_lat, stop_lon)
-    return estacao_mais_proxima  # (uri, lat, lon)
-
-def melhor_rota(lat_origem, lon_origem, lat_dest, lon_dest):
-    estacao_origem = encontrar_estacao_mais_proxima(lat_origem, lon_origem)
-    estacao_dest = encontrar_estacao_mais_proxima(lat_dest, lon_dest)
-    if not estacao_origem or not estacao_dest:
-        print("Não foi possível encontrar estações próximas.")
-        return
+    results = cliente.consultar_tabela(query, {'stop_lat': 'float64', 'stop_lon': 'float64'})
+    if results.empty:
+        return IndiceParadas([], [], [])
+    return IndiceParadas(results['stop'], results['stop_lat'], results['stop_lon'])
 
-    stop_uri_origem = f"<{estacao_origem[0]}>"
-    stop_uri_dest = f"<{estacao_dest[0]}>"
-    print(f'uri_origem: {stop_uri_origem}, uri_dest: {stop_uri_dest}')
-
-    query = f"""
-    PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
-    PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#/>
+def indice_paradas():
+    """
+    Retorna o índice espacial das paradas, carregado do repositório uma única
+    vez e recarregado quando a versão do repositório muda. A versão é
+    conferida no máximo a cada INTERVALO_VERIFICACAO segundos.
+    """
+    global _indice, _indice_versao, _indice_verificado_em
 
-    SELECT ?trip ?route ?ordem ?lat ?lon
-    WHERE {{
-    ?trip gtfs:route ?route .
-    ?stop_time1 gtfs:trip ?trip ; gtfs:stop {stop_uri_origem} ; gtfs:stop_sequence ?seq1_raw .
-    ?stop_time2 gtfs:trip ?trip ; gtfs:stop {stop_uri_dest} ; gtfs:stop_sequence ?seq2_raw .
+    agora = time.monotonic()
+    if _indice is not None and agora - _indice_verificado_em < INTERVALO_VERIFICACAO:
+        return _indice
 
-    BIND(xsd:integer(?seq1_raw) AS ?seq1)
-    BIND(xsd:integer(?seq2_raw) AS ?seq2)
+    versao = cliente.versao()
+    _indice_verificado_em = agora
+    if _indice is None or versao != _indice_versao:
+        _indice = _carregar_indice_paradas()
+        _indice_versao = versao
+    return _indice
 
-    FILTER(?seq2 > ?seq1)
+def encontrar_estacao_mais_proxima(lat, lon):
+    "Parada mais próxima (distância haversine) de um ponto, como (uri, lat, lon)."
 
-    ?stop_time gtfs:trip ?trip ; gtfs:stop ?stop ; gtfs:stop_sequence ?ordem_raw .
-    BIND(xsd:integer(?ordem_raw) AS ?ordem)
+    return indice_paradas().mais_proxima(lat, lon)
 
-    FILTER(?ordem >= ?seq1 && ?ordem <= ?seq2)
+def encontrar_estacoes_proximas(lat, lon, k=5, raio_m=None):
+    """
+    As `k` paradas mais próximas de um ponto ou, com `raio_m`, todas as que
+    estão a até esse raio. Retorna uma lista de (uri, lat, lon, distancia_m).
+    """
+    indice = indice_paradas()
+    if raio_m is not None:
+        indices, distancias = indice.no_raio(lat, lon, raio_m)
+    else:
+        indices, distancias = indice.k_mais_proximas(lat, lon, k)
+    return [
+        (indice.uris[i], float(indice.lats[i]), float(indice.lons[i]), float(d))
+        for i, d in zip(np.ravel(indices), np.ravel(distancias))
+    ]
 
-    ?stop geo:lat ?lat ; geo:long ?lon .
-    }}
-    ORDER BY ?trip ?ordem
+def melhor_rota(lat_origem, lon_origem, lat_dest, lon_dest, horario_partida="08:00:00"):
+    """
+    Calcula o itinerário de chegada mais cedo (com transferências) entre dois
+    pontos, saindo a partir de `horario_partida`, pelo motor RAPTOR em memória
+    (roteamento.py), e salva o mapa animado do percurso.
     """
+    import folium
+    from folium.plugins import TimestampedGeoJson
+
+    import roteamento
+
+    with etapa('roteamento'):
+        roteador = roteamento.roteador_padrao()
+    estacao_origem = roteador.indice.mais_proxima(lat_origem, lon_origem)
+    estacao_dest = roteador.indice.mais_proxima(lat_dest, lon_dest)
+    if not estacao_origem or not estacao_dest:
+        print("Não foi possível encontrar estações próximas.")
+        return
 
-    print(query)
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
-    results = sparql.query().convert()
+    print(f'parada_origem: {estacao_origem[0]}, parada_dest: {estacao_dest[0]}')
 
-    rotas = {}
-    for result in results["results"]["bindings"]:
-        route = result["route"]["value"]
-        ordem = int(result["ordem"]["value"])
-        lat = float(result["lat"]["value"])
-        lon = float(result["lon"]["value"])
-        rotas.setdefault(route, []).append((ordem, lat, lon))
-    melhor_rota = min(rotas.values(), key=len) if rotas else []
+    h, m, s = (int(parte) for parte in horario_partida.split(':'))
+    with etapa('roteamento'):
+        trechos = roteador.consultar(estacao_origem[0], estacao_dest[0], h * 3600 + m * 60 + s) or []
 
-    melhor_rota = sorted(melhor_rota, key=lambda x: x[0])
+    melhor_rota = []
+    for trecho in trechos:
+        for lat, lon in trecho['coordenadas']:
+            if not melhor_rota or melhor_rota[-1][1:] != (lat, lon):
+                melhor_rota.append((len(melhor_rota), lat, lon))
 
     base_time = datetime.datetime(2023, 1, 1, 12, 0, 0)
     features = []
@@ -176,37 +376,32 @@ def melhor_rota(lat_origem, lon_origem, lat_dest, lon_dest):
         date_options='YYYY/MM/DD HH:mm:ss',
         time_slider_drag_update=True
     ).add_to(m)
-    m.save("../map/melhor_rota.html")
+    with etapa('renderizacao'):
+        m.save("../map/melhor_rota.html")
     print("Mapa animado salvo como melhor_rota.html")
 
 #-------------------------------------------------------------------------------
 
 def generate_heatmap_paradas_geral():
+    import matplotlib.image as mpimg
+    import matplotlib.pyplot as plt
+
     query = """
     PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
 
     SELECT ?lat_group ?lon_group (COUNT(?stop) AS ?qtd_paradas)
     WHERE {
     ?stop geo:lat ?lat ; geo:long ?lon .
-    BIND(xsd:float(?lat) AS ?lat_num)
-    BIND(xsd:float(?lon) AS ?lon_num)
-    BIND(ROUND(?lat_num * 100) / 100 AS ?lat_group)
-    BIND(ROUND(?lon_num * 100) / 100 AS ?lon_group)
+    BIND(ROUND(?lat * 100) / 100 AS ?lat_group)
+    BIND(ROUND(?lon * 100) / 100 AS ?lon_group)
     }
     GROUP BY ?lat_group ?lon_group
     """
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
-    results = sparql.query().convert()
-
-    lats, lons, counts = [], [], []
-    for result in results["results"]["bindings"]:
-        lats.append(float(result["lat_group"]["value"]))
-        lons.append(float(result["lon_group"]["value"]))
-        counts.append(int(result["qtd_paradas"]["value"]))
+    results = cliente.consultar_tabela(query, {'lat_group': 'float64', 'lon_group': 'float64', 'qtd_paradas': 'int64'})
 
-    print(lats[1:10])
+    lats = results['lat_group'].to_numpy() if len(results) else np.empty(0)
+    lons = results['lon_group'].to_numpy() if len(results) else np.empty(0)
+    counts = results['qtd_paradas'].to_numpy() if len(results) else np.empty(0)
 
     img = mpimg.imread('../mapa_rj.png')
     x_min, y_min = -43.7955, -23.0827
@@ -214,73 +409,146 @@ def generate_heatmap_paradas_geral():
 
     plt.figure(figsize=(10, 10))
     plt.imshow(img, extent=[x_min, x_max, y_min, y_max], aspect='auto')
-    plt.scatter(lons, lats, s=[c*5 for c in counts], c=counts, cmap='hot', alpha=0.6)
+    plt.scatter(lons, lats, s=counts * 5, c=counts, cmap='hot', alpha=0.6)
     plt.axis('off')
     plt.tight_layout()
-    plt.savefig('heatmap_paradas_geral.png', dpi=200, bbox_inches='tight')
+    with etapa('renderizacao'):
+        plt.savefig('heatmap_paradas_geral.png', dpi=200, bbox_inches='tight')
     plt.close()
 
     return results
 
-def generate_heatmap_paradas_geral_folium():
-    query = """
-    PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
-    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-
-    SELECT ?lat ?lon
-    WHERE {
-      ?stop geo:lat ?lat ; geo:long ?lon .
-    }
+def generate_heatmap_paradas_geral_folium(peso="paradas", celula=0.002, tiles_dir=None, hora=None, area=None):
     """
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
-    results = sparql.query().convert()
-
-    coords = []
-    for result in results["results"]["bindings"]:
-        lat = float(result["lat"]["value"])
-        lon = float(result["lon"]["value"])
-        coords.append([lat, lon])
-
-    if coords:
-        lat_c = sum([c[0] for c in coords]) / len(coords)
-        lon_c = sum([c[1] for c in coords]) / len(coords)
+    Gera o heatmap geral das paradas com os pontos pré-agregados numa grade de
+    `celula` graus (heatmap.py), em vez de embutir cada parada no HTML. Com
+    peso="partidas", cada parada pesa pelo número de partidas no dia (ou só na
+    `hora` informada), lido do nível de serviço pré-calculado na conversão
+    (frequencias.py), em vez de 1. Com `area` (lat_min, lon_min, lat_max,
+    lon_max), só as paradas do retângulo são consultadas. Com `tiles_dir`,
+    grava também tiles {z}/{x}/{y}.json agregados para cada nível de zoom.
+    """
+    import folium
+    from folium.plugins import HeatMap
+
+    import heatmap
+
+    if peso == "partidas" and hora is not None:
+        query = f"""
+        PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
+        PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
+        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+
+        SELECT ?lat ?lon ?peso
+        WHERE {{
+          ?nivel gtfs:stop ?stop ;
+                 gtfs:hour "{int(hora)}"^^xsd:nonNegativeInteger ;
+                 gtfs:departures ?peso .
+          ?stop geo:lat ?lat ; geo:long ?lon .
+          {_filtro_area(area)}
+        }}
+        """
+    elif peso == "partidas":
+        query = f"""
+        PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
+        PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
+
+        SELECT ?lat ?lon ?peso
+        WHERE {{
+          ?stop gtfs:departuresPerDay ?peso ;
+                geo:lat ?lat ; geo:long ?lon .
+          {_filtro_area(area)}
+        }}
+        """
+    else:
+        query = f"""
+        PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
+
+        SELECT ?lat ?lon
+        WHERE {{
+          ?stop geo:lat ?lat ; geo:long ?lon .
+          {_filtro_area(area)}
+        }}
+        """
+    results = cliente.consultar_tabela(query, dict(COORDENADAS, peso='float64'))
+
+    lats = results['lat'].to_numpy() if len(results) else np.empty(0)
+    lons = results['lon'].to_numpy() if len(results) else np.empty(0)
+    pesos = results['peso'].to_numpy() if peso == "partidas" and len(results) else None
+
+    if len(lats):
+        lat_c, lon_c = lats.mean(), lons.mean()
     else:
         lat_c, lon_c = -22.9, -43.2
 
+    pontos = heatmap.pontos_ponderados(*heatmap.agregar_grade(lats, lons, pesos, celula))
+
     m = folium.Map(location=[lat_c, lon_c], zoom_start=11, tiles="cartodbpositron")
-    HeatMap(coords, radius=8, blur=15, min_opacity=0.3).add_to(m)
-    m.save("../map/heatmap_paradas_geral.html")
-    print("Mapa salvo como heatmap_paradas_geral.html")
+    HeatMap(pontos, radius=8, blur=15, min_opacity=0.3).add_to(m)
+    with etapa('renderizacao'):
+        m.save("../map/heatmap_paradas_geral.html")
+    print(f"Mapa salvo como heatmap_paradas_geral.html ({len(pontos)} pontos agregados de {len(lats)} paradas)")
+
+    if tiles_dir:
+        total = heatmap.exportar_tiles(heatmap.agregar_niveis(lats, lons, pesos), tiles_dir)
+        print(f"{total} tiles salvos em {tiles_dir}")
 
     return results
 
+def partidas_por_hora(route_short_name=None):
+    """
+    Nível de serviço das linhas: partidas por hora de cada linha (todas, ou só
+    a de `route_short_name`), pré-calculado na conversão. Retorna um DataFrame
+    (route_short_name, hora, partidas) ordenado por linha e hora.
+    """
+    filtro = _valores_short_name(None if route_short_name is None else [route_short_name])
+    query = f"""
+    PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
+    PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+
+    SELECT ?short_name ?hora ?partidas
+    WHERE {{
+        {filtro}
+        ?route a gtfs:Route ; gtfs:shortName ?short_name .
+        ?nivel gtfs:route ?route ; gtfs:hour ?hora ; gtfs:departures ?partidas .
+    }}
+    """
+    results = cliente.consultar_tabela(query, {'hora': 'int64', 'partidas': 'int64'})
+    if not len(results):
+        return results
+    results = results.rename(columns={'short_name': 'route_short_name'})
+    return results.sort_values(['route_short_name', 'hora'], ignore_index=True)
+
 #-------------------------------------------------------------------------------
 
 def generate_heatmap_paradas_linha(route_id="1234"):
     """
-    Gera o heatmap das paradas de uma linha específica usando folium.
+    Gera o heatmap das paradas de uma linha específica usando folium. Cada
+    parada pesa o número de passagens das viagens da linha por ela, contado
+    pelos padrões de parada em vez de percorrer todos os stop_times.
     """
+    import folium
+    from folium.plugins import HeatMap
+
     query = f"""
     PREFIX gtfs: <http://vocab.gtfs.org/terms#/>
     PREFIX geo: <http://www.w3.org/2003/01/geo/wgs84_pos#/>
 
-    SELECT ?lat ?lon
+    SELECT ?lat ?lon (COUNT(?trip) AS ?passagens)
     WHERE {{
-        ?trip gtfs:route <http://vocab.gtfs.org/terms#/routes/O0636AAA0A> .
-        ?stop_time gtfs:trip ?trip ; gtfs:stop ?stop .
+        ?pattern a gtfs:StopPattern ; gtfs:route <http://vocab.gtfs.org/terms#/routes/{route_id}> .
+        ?trip a gtfs:Trip ; gtfs:pattern ?pattern .
+        ?pattern_stop a gtfs:PatternStop ; gtfs:pattern ?pattern ; gtfs:stop ?stop .
         ?stop geo:lat ?lat ; geo:long ?lon .
     }}
+    GROUP BY ?stop ?lat ?lon
     """
-    sparql.setQuery(query)
-    sparql.setReturnFormat(JSON)
-    results = sparql.query().convert()
+    results = cliente.consultar_tabela(query, dict(COORDENADAS, passagens='float64'))
 
     coords = []
-    for result in results["results"]["bindings"]:
-        lat = float(result["lat"]["value"])
-        lon = float(result["lon"]["value"])
-        coords.append([lat, lon])
+    if len(results):
+        pesos = results['passagens'] / results['passagens'].max()
+        coords = np.column_stack([results['lat'], results['lon'], pesos]).tolist()
 
     if coords:
         lat_c = sum([c[0] for c in coords]) / len(coords)
@@ -290,7 +558,8 @@ def generate_heatmap_paradas_linha(route_id="1234"):
 
     m = folium.Map(location=[lat_c, lon_c], zoom_start=11, tiles="cartodbpositron")
     HeatMap(coords, radius=10, blur=18, min_opacity=0.3).add_to(m)
-    m.save(f"../map/heatmap_paradas_linha_{route_id}.html")
+    with etapa('renderizacao'):
+        m.save(f"../map/heatmap_paradas_linha_{route_id}.html")
     print(f"Mapa salvo como heatmap_paradas_linha_{route_id}.html")
 
     return results
\ No newline at end of file
@@ -0,0 +1,79 @@
+import csv
+import io
+import os
+import time
+import uuid
+
+# Marcador de versão dos dados no repositório: uma única tripla
+# <feed> gtfs:dataVersion "..." trocada a cada escrita (carga de N-Triples ou
+# atualização SPARQL, ver ntriples.carregar_no_graphdb). Os caches das
+# consultas (ClienteSPARQL, índice de paradas, tiles do servidor de mapa e o
+# cache em disco do main.py) usam o marcador junto com o número de triplas
+# como versão, então uma escrita que mantém o número de triplas (ex.: trocar a
+# coordenada de uma parada) também os invalida. Só usa a biblioteca padrão,
+# para que o main.py possa consultar a versão sem importar pandas e rdflib.
+# Pelo mesmo motivo a assinatura dos CSVs do feed (assinatura_feed), usada
+# pelo cache do roteador e pelo do main.py, também fica aqui.
+
+# Repositório padrão do projeto no GraphDB e pasta padrão dos CSVs do feed
+# (csvToRdf.BASE_DIR parte deste valor).
+ENDPOINT = "http://localhost:7200/repositories/gtfs-rj"
+BASE_DIR = '../assets/gtfs-rio-de-janeiro'
+
+SUJEITO = "http://vocab.gtfs.org/terms#/feed"
+PREDICADO = "http://vocab.gtfs.org/terms#/dataVersion"
+
+QUERY_VERSAO = f"SELECT ?versao WHERE {{ <{SUJEITO}> <{PREDICADO}> ?versao }}"
+
+def assinatura_feed(base_dir: str = BASE_DIR) -> dict:
+    "Identifica um feed: o caminho absoluto e o tamanho e a data de modificação de cada CSV."
+
+    base_dir = os.path.abspath(base_dir)
+    arquivos = {}
+    for nome in sorted(os.listdir(base_dir)):
+        if nome.endswith('.csv'):
+            estado = os.stat(os.path.join(base_dir, nome))
+            arquivos[nome] = (estado.st_size, estado.st_mtime_ns)
+    return {'base_dir': base_dir, 'arquivos': arquivos}
+
+def nova_versao() -> str:
+    "Valor novo para o marcador: instante da escrita e um sufixo aleatório."
+
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:12]}"
+
+def update_versao(versao: str = None) -> str:
+    "Atualização SPARQL que substitui o marcador de versão do repositório."
+
+    versao = versao or nova_versao()
+    return (
+        f"DELETE WHERE {{ <{SUJEITO}> <{PREDICADO}> ?versao }} ;\n"
+        f"INSERT DATA {{ <{SUJEITO}> <{PREDICADO}> \"{versao}\" . }}\n"
+    )
+
+def ler_marcador(corpo: bytes) -> str:
+    "Lê o marcador do resultado SPARQL CSV de QUERY_VERSAO ('' se o repositório não tem)."
+
+    linhas = list(csv.reader(io.StringIO(corpo.decode('utf-8'))))[1:]
+    return ','.join(sorted(linha[0] for linha in linhas if linha))
+
+def compor(marcador: str, triplas: str) -> str:
+    "Versão a partir do marcador e do número de triplas (/size)."
+
+    return f"{marcador or 'sem-marcador'}-{triplas}"
+
+def versao_endpoint(endpoint: str, timeout: float = 10) -> str:
+    "Versão de um repositório remoto (GraphDB/RDF4J), consultada só com a biblioteca padrão."
+
+    import urllib.parse
+    import urllib.request
+
+    endpoint = endpoint.rstrip('/')
+    with urllib.request.urlopen(endpoint + '/size', timeout=timeout) as resposta:
+        triplas = resposta.read().decode().strip()
+    requisicao = urllib.request.Request(
+        endpoint, data=urllib.parse.urlencode({'query': QUERY_VERSAO}).encode(),
+        headers={'Content-Type': 'application/x-www-form-urlencoded', 'Accept': 'text/csv'},
+    )
+    with urllib.request.urlopen(requisicao, timeout=timeout) as resposta:
+        marcador = ler_marcador(resposta.read())
+    return compor(marcador, triplas)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do projeto ficam em src/ e se importam pelo nome, como quando
+# executados de dentro dessa pasta.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Feed mínimo (tests/dados/gtfs), com campos opcionais em branco, horários
+# depois da meia-noite, frequências e shapes.
+FEED = os.path.join(os.path.dirname(__file__), 'dados', 'gtfs')
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    """
+    Aponta csvToRdf para o feed mínimo, com um grafo vazio, e usa
+    tmp_path/trabalho como diretório de trabalho (os mapas vão para tmp_path/map).
+    """
+    import csvToRdf
+    from rdflib import Graph
+
+    monkeypatch.setattr(csvToRdf, 'BASE_DIR', FEED)
+    monkeypatch.setattr(csvToRdf, 'mainGraph', Graph())
+    (tmp_path / 'map').mkdir()
+    (tmp_path / 'trabalho').mkdir()
+    monkeypatch.chdir(tmp_path / 'trabalho')
+    return tmp_path
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from backends import BackendLocal
+
+# Snapshot pickle do BackendLocal: reaproveitado só enquanto o arquivo de
+# origem não muda.
+
+TRIPLA = '<http://exemplo/s> <http://exemplo/p> "{}" .\n'
+
+def test_snapshot_acompanha_o_arquivo_de_origem(tmp_path):
+    origem = tmp_path / 'dados.nt'
+    origem.write_text(TRIPLA.format('a'))
+    assert len(BackendLocal(str(origem)).grafo) == 1
+    assert os.path.exists(str(origem) + '.pkl')
+
+    # Conteúdo novo com a data de modificação antiga: o snapshot, mais novo que
+    # o arquivo, não pode ser servido.
+    estado = origem.stat()
+    origem.write_text(TRIPLA.format('b') + TRIPLA.format('c'))
+    os.utime(origem, ns=(estado.st_atime_ns, estado.st_mtime_ns))
+    assert len(BackendLocal(str(origem)).grafo) == 2
+
+    origem.unlink()
+    with pytest.raises(FileNotFoundError):
+        BackendLocal(str(origem))
@@ -0,0 +1,27 @@
+import pytest
+
+import csvToRdf
+import sparql
+
+# Consultas de sparql.py sobre o feed mínimo convertido e consultado em
+# processo (BackendLocal).
+
+@pytest.fixture(params=[False, True], ids=['padrao', 'compacto'])
+def backend(feed, request, monkeypatch):
+    "Converte o feed mínimo (nos dois modelos de stop_times) e o usa como backend do sparql.py."
+
+    destino = str(feed / 'gtfs.nt')
+    csvToRdf.generate_rdf_stream(destino, compacto=request.param)
+    monkeypatch.setattr(sparql, 'cliente', sparql.cliente)
+    return sparql.usar_backend(destino)
+
+def test_heatmap_da_linha_conta_as_viagens_por_parada(backend):
+    resultado = sparql.generate_heatmap_paradas_linha('R1')
+
+    stops = csvToRdf.ler_tabela('stops').set_index(['stop_lat', 'stop_lon'])['stop_id']
+    passagens = {
+        stops[(lat, lon)]: int(n)
+        for lat, lon, n in zip(resultado['lat'], resultado['lon'], resultado['passagens'])
+    }
+    # T1 passa por S1, S2 e S4; T2 por S4 e S1.
+    assert passagens == {'S1': 2, 'S2': 1, 'S4': 2}
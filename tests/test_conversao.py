@@ -0,0 +1,17 @@
+import colunar
+import csvToRdf
+from armazem_local import carregar_grafo
+
+# Paridade da conversão sobre o feed mínimo (fixture `feed`, ver conftest.py).
+
+def test_paridade_colunar_com_iterrows(feed):
+    assert colunar.verificar_paridade(csvToRdf.read_csv_file()) == {}
+
+def test_grafo_e_stream_geram_as_mesmas_triplas(feed):
+    csvToRdf.generate_rdf_graph()
+    triplas = csvToRdf.generate_rdf_stream(str(feed / 'gtfs.nt.gz'))
+
+    grafo = set(csvToRdf.mainGraph)
+    stream = set(carregar_grafo(str(feed / 'gtfs.nt.gz')))
+    assert grafo and grafo == stream
+    assert triplas >= len(stream)